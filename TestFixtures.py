@@ -2,14 +2,33 @@ from fastapi_wrapper import cli
 import json
 
 import unittest # https://docs.python.org/2/library/unittest.html
+from unittest import mock
+
+import settings.settings as settings
+
+def override_settings(**values):
+    '''Overrides settings in a `with` block (or from `start()` to `stop()`), e.g. `with override_settings(SNAPSHOTS=True):`'''
+    return mock.patch.multiple(settings, **values)
 
 class FastAPIWrapperTests(unittest.TestCase):
 
     def setUp(self):
-        pass
+        from fastapi_wrapper.fastapi_wrapper import FastAPI_Wrapper
+
+        # The routes config the cli serves
+        self.config_db = 'apiness_routes_config_TEST.db'
+        FastAPI_Wrapper(config_db=self.config_db).create_database('wrapper_test', './data/test.csv')
 
     def tearDown(self):
-        pass
+        import os
+        from fastapi_wrapper.fastapi_wrapper import resolve_db, close_database
+
+        for database in [self.config_db, 'wrapper_test']:
+            db, _ = resolve_db(database)
+            close_database(db)
+            for path in [db, f'{db}-wal', f'{db}-shm']:
+                if os.path.exists(path):
+                    os.remove(path)
 
     def testFastAPIWrapper(self):
         '''
@@ -17,12 +36,31 @@ class FastAPIWrapperTests(unittest.TestCase):
         '''
         print('### FastAPI Wrapper Test')
 
+        import importlib
+        from unittest import mock
+        import settings.settings as settings
+
         # -- Default routes config --
         # cli.main(init_routes_with_config_db=True, start_server=False, host='localhost', port=8000)
 
         # -- Named routes config --
         # cli.main(config_db='routes_config.db', init_routes_with_config_db=True, start_server=False, host='localhost', port=8000)
-        cli.main(config_db='apiness_routes_config_TEST.db', init_routes_with_config_db=True, start_server=False, host='localhost', port=8000)
+        # The server is always started from a routes config, so don't let it block the test
+        with mock.patch.object(cli.uvicorn, 'run') as run:
+            cli.main(config_db=self.config_db, init_routes_with_config_db=True, start_server=False, host='localhost', port=8000, workers=1)
+        app = run.call_args.args[0]
+        self.assertIn('/wrapper_test/{table}', [route.path for route in app.routes])
+
+        # Without --workers, the API_WORKERS setting applies
+        with mock.patch.object(settings, 'API_WORKERS', 3):
+            # The option's default is read when the cli is imported
+            importlib.reload(cli)
+        try:
+            with mock.patch.object(cli, 'run_workers') as run_workers, mock.patch.object(cli, 'snapshot_memory_db'):
+                cli.main(config_db=self.config_db, init_routes_with_config_db=True, host='localhost', port=8000)
+            self.assertEqual(run_workers.call_args.kwargs['workers'], 3)
+        finally:
+            importlib.reload(cli)
 
         # -- In-memory db + server start --
         # cli.main(database=':memory:', data_path='./data/test.csv', data_format='CSV', start_server=True, if_exists='replace', host='localhost', port=8000)
@@ -366,6 +404,999 @@ class MiscTests(unittest.TestCase):
                 print(f'{qp} / {type_}')
 
 
+class OpenAPISchemaTests(unittest.TestCase):
+
+    def setUp(self):
+        from fastapi_wrapper.fastapi_wrapper import FastAPI_Wrapper
+
+        self.config_db = 'openapi_TEST_config.db'
+        self.app = FastAPI_Wrapper(config_db=self.config_db).create_database('openapi_test', './data/test.csv')
+
+    def tearDown(self):
+        import os
+        from fastapi_wrapper.fastapi_wrapper import resolve_db, close_database
+
+        for database in [self.config_db, 'openapi_test', 'openapi_test2']:
+            db, _ = resolve_db(database)
+            close_database(db)
+            if os.path.exists(db):
+                os.remove(db)
+
+    def testOpenAPISchemaCache(self):
+        '''
+        ### Test OpenAPI schema cache invalidation and restore
+        '''
+        print('### OpenAPI Schema Cache Test')
+
+        from fastapi.testclient import TestClient
+        from fastapi_wrapper.fastapi_wrapper import FastAPI_Wrapper
+
+        client = TestClient(self.app)
+        schema = client.get('/openapi.json').json()
+        self.assertIn('/openapi_test/{table}', schema['paths'])
+
+        # Adding a route must invalidate the cached schema
+        self.app.create_database('openapi_test2', './data/test.csv')
+        schema = client.get('/openapi.json').json()
+        self.assertIn('/openapi_test2/{table}', schema['paths'])
+
+        # A restart restores the same schema from the cached route fragments
+        app = FastAPI_Wrapper(init_routes_with_config_db=True, config_db=self.config_db)
+        self.assertEqual(TestClient(app).get('/openapi.json').json(), schema)
+
+
+class ImportTests(unittest.TestCase):
+
+    def testLazyHeavyImports(self):
+        '''
+        ### Test serving modules don't import pandas, numpy or django-environ
+        '''
+        import subprocess
+        import sys
+
+        print('### Lazy Imports Test')
+
+        code = (
+            'import sys, bootstrapper, fastapi_wrapper.cli; '
+            "print('imported:', [mod for mod in ['pandas', 'numpy', 'environ'] if mod in sys.modules])"
+        )
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertIn('imported: []', result.stdout)
+
+class SettingsTests(unittest.TestCase):
+
+    def testEnvBool(self):
+        '''
+        ### Test boolean settings all parse the same strings, like django-environ did
+        '''
+        import os
+
+        print('### Env Bool Test')
+
+        for val in ['true', 'True', ' on ', 'ok', 'y', 'YES', '1']:
+            with mock.patch.dict(os.environ, {'TEST_FLAG': val}):
+                self.assertIs(settings.env_bool('TEST_FLAG', False), True, val)
+        for val in ['false', '0', 'no', 'off', '']:
+            with mock.patch.dict(os.environ, {'TEST_FLAG': val}):
+                self.assertIs(settings.env_bool('TEST_FLAG', True), False, val)
+        with mock.patch.dict(os.environ):
+            os.environ.pop('TEST_FLAG', None)
+            self.assertIs(settings.env_bool('TEST_FLAG', True), True)
+            self.assertIs(settings.env_bool('TEST_FLAG', False), False)
+
+class MemoryDatabaseTests(unittest.TestCase):
+
+    def setUp(self):
+        import os
+        import tempfile
+        from fastapi_wrapper.fastapi_wrapper import FastAPI_Wrapper
+
+        self.config_db = 'memory_TEST_config.db'
+        self.snapshot = os.path.join(tempfile.mkdtemp(), 'memory_snapshot_TEST.db')
+        self.app = FastAPI_Wrapper(config_db=self.config_db).create_database(':memory:', './data/test.csv')
+
+    def tearDown(self):
+        import os
+        from fastapi_wrapper.fastapi_wrapper import resolve_db, close_database
+
+        close_database(':memory:')
+        db, _ = resolve_db(self.config_db)
+        close_database(db)
+        for path in [db, self.snapshot]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def testMemoryDatabaseSnapshot(self):
+        '''
+        ### Test in-memory database sharing, snapshot and restore
+        '''
+        print('### Memory Database Snapshot Test')
+
+        import threading
+        from fastapi.testclient import TestClient
+        from fastapi_wrapper.fastapi_wrapper import close_database, snapshot_memory_db, restore_memory_db, query_database
+
+        client = TestClient(self.app)
+        full_count = client.get('/memory/test').json()['metadata']['full_count']
+        self.assertGreater(full_count, 0)
+
+        # Pooled connections on other threads see the same in-memory data
+        counts = []
+        threads = [threading.Thread(target=lambda: counts.append(len(query_database(':memory:', 'SELECT * FROM test')))) for _ in range(4)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+        self.assertEqual(counts, [full_count] * 4)
+
+        snapshot_memory_db(self.snapshot)
+        close_database(':memory:')
+        self.assertTrue(restore_memory_db(self.snapshot))
+        self.assertEqual(client.get('/memory/test').json()['metadata']['full_count'], full_count)
+
+
+class GeneratedRouteTestCase(unittest.TestCase):
+    '''
+    Serves the `routes_test` database (from `./data/test.csv`). Tests may create a `routes_geo` database too.
+    '''
+
+    def setUp(self):
+        from fastapi.testclient import TestClient
+        from fastapi_wrapper.fastapi_wrapper import FastAPI_Wrapper
+
+        self.config_db = 'routes_TEST_config.db'
+        self.app = FastAPI_Wrapper(config_db=self.config_db).create_database('routes_test', './data/test.csv')
+        self.client = TestClient(self.app)
+
+    def tearDown(self):
+        import os
+        from fastapi_wrapper.fastapi_wrapper import resolve_db, close_database
+
+        for database in [self.config_db, 'routes_test', 'routes_geo']:
+            db, _ = resolve_db(database)
+            close_database(db)
+            for path in [db, f'{db}-wal', f'{db}-shm']:
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+class DbProfileTests(GeneratedRouteTestCase):
+
+    def testDbProfile(self):
+        '''
+        ### Test per-database SQLite profiles, on pooled connections and after a restart from the routes config
+        '''
+        from fastapi_wrapper.fastapi_wrapper import DB_PROFILES, FastAPI_Wrapper, close_database, connection_for_db, pooled_connection, resolve_db
+
+        print('### DB Profile Test')
+
+        db, _ = resolve_db('routes_geo')
+        self.addCleanup(DB_PROFILES.pop, db, None)
+        def pragma(con, name):
+            return con.execute(f'PRAGMA {name}').fetchone()[name]
+
+        with override_settings(SQLITE_DB_PROFILES={'routes_geo': {'cache_size': -1234}}):
+            self.app.create_database('routes_geo', './data/test.csv')
+            with pooled_connection(db) as con:
+                self.assertEqual((pragma(con, 'cache_size'), pragma(con, 'query_only')), (-1234, 1))
+            # The primary connection writes
+            self.assertEqual(pragma(connection_for_db(db), 'query_only'), 0)
+
+        # The profile is restored from the routes config, whatever the settings are now
+        DB_PROFILES.clear()
+        close_database(db)
+        FastAPI_Wrapper(init_routes_with_config_db=True, config_db=self.config_db)
+        with pooled_connection(db) as con:
+            self.assertEqual(pragma(con, 'cache_size'), -1234)
+
+
+class HtmlPaginationTests(GeneratedRouteTestCase):
+
+    def testHtmlPagination(self):
+        '''
+        ### Test streamed, paginated HTML tables
+        '''
+        print('### HTML Pagination Test')
+
+        response = self.client.get('/routes_test/test?tohtml&location_like=Kingdom&page_size=10&page=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Page 2 of', response.text)
+        self.assertIn('page=3', response.text)
+        self.assertEqual(response.text.count('<tr>'), 10)
+
+    def testPageSizeBounds(self):
+        '''
+        ### Test page sizes are clamped to between a row and HTML_MAX_ROWS
+        '''
+        print('### Page Size Bounds Test')
+
+        def page(query):
+            response = self.client.get(f'/routes_test/test?tohtml&location_like=Kingdom&{query}')
+            self.assertEqual(response.status_code, 200)
+            return response.text
+
+        # `page_size=0` is the default page size
+        self.assertIn('Page 1 of 1', page('page_size=0'))
+        # A negative one is a row (not SQLite's unlimited `LIMIT -1`)
+        html = page('page_size=-1')
+        self.assertEqual(html.count('<tr>'), 1)
+        self.assertIn('page_size=1', html)
+
+        with override_settings(HTML_MAX_ROWS=5):
+            self.assertEqual(page('page_size=100').count('<tr>'), 5)
+            self.assertEqual(page('page_size=-1000').count('<tr>'), 1)
+        with override_settings(HTML_PAGE_SIZE=0):
+            self.assertEqual(page('page=2').count('<tr>'), 1)
+
+
+class AggregationTests(GeneratedRouteTestCase):
+
+    def testAggregation(self):
+        '''
+        ### Test group_by / agg / having parameters
+        '''
+        print('### Aggregation Test')
+
+        response = self.client.get('/routes_test/test?group_by=location&agg=sum:value,count&having=count>100')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        self.assertTrue(all(row['count'] > 100 for row in data))
+        self.assertEqual(set(data[0].keys()), {'location', 'sum_value', 'count'})
+
+        with self.assertRaises(Exception):
+            self.client.get('/routes_test/test?group_by=no_such_column&agg=count')
+
+
+class FullTextIndexTests(GeneratedRouteTestCase):
+
+    def testFullTextIndex(self):
+        '''
+        ### Test string filters served from a full-text index
+        '''
+        print('### Full-Text Index Test')
+
+        queries = ['location_like=kingdom', 'location_begin=United', 'location_end=dom', 'indicator_search=GDP real']
+        expected = [self.client.get(f'/routes_test/test?{query}').json()['data'] for query in queries]
+
+        self.app.update_database('routes_test', './data/test.csv', fts_columns='location,indicator')
+        for query, data in zip(queries, expected):
+            response = self.client.get(f'/routes_test/test?{query}').json()
+            self.assertIn('test_fts', response['metadata']['sql_query'])
+            self.assertEqual(response['data'], data)
+
+
+class PrefixIndexTests(GeneratedRouteTestCase):
+
+    def testPrefixIndex(self):
+        '''
+        ### Test _begin range rewrite and suggest endpoint
+        '''
+        print('### Prefix Index Test')
+
+        expected = self.client.get('/routes_test/test?location_begin=UNITED K').json()['data']
+
+        self.app.update_database('routes_test', './data/test.csv', prefix_columns='location,indicatorcode')
+        response = self.client.get('/routes_test/test?location_begin=UNITED K').json()
+        self.assertIn('COLLATE NOCASE', response['metadata']['sql_query'])
+        self.assertEqual(sorted(row['id'] for row in response['data']), sorted(row['id'] for row in expected))
+
+        response = self.client.get('/routes_test/test/suggest?col=indicatorcode&prefix=gdp&limit=2').json()
+        self.assertEqual(len(response['data']), 2)
+        self.assertTrue(all(row['value'].lower().startswith('gdp') for row in response['data']))
+
+    def testPrefixRangeBounds(self):
+        '''
+        ### Test _begin range rewrite matches LIKE for prefixes next to uppercase letters
+        '''
+        import pandas as pd
+
+        print('### Prefix Range Bounds Test')
+
+        emails = pd.DataFrame({'Email': ['john@example.com', 'John@Work.org', 'john[1]', 'john_doe', 'john^x', 'johnA', 'johna', 'joho']})
+        self.app.create_database('routes_geo', 'emails.csv', df=emails, prefix_columns='email')
+        for prefix in ['john@', 'JOHN@', 'john', 'john[', 'john`']:
+            expected = self.client.get(f'/routes_geo/emails?where=email LIKE "{prefix}%"').json()['data']
+            response = self.client.get(f'/routes_geo/emails?email_begin={prefix}').json()
+            self.assertIn('COLLATE NOCASE', response['metadata']['sql_query'])
+            self.assertEqual(sorted(row['email'] for row in response['data']), sorted(row['email'] for row in expected), prefix)
+
+
+class SpatialIndexTests(GeneratedRouteTestCase):
+
+    def testSpatialIndex(self):
+        '''
+        ### Test bbox and near filters served from an R*Tree index
+        '''
+        import csv
+        from fastapi_wrapper.sql_helper import distance_km
+
+        print('### Spatial Index Test')
+
+        self.app.create_database('routes_geo', './data/data.csv')
+        with open('./data/data.csv') as f:
+            points = [(i, float(row['lat']), float(row['lng'])) for i, row in enumerate(csv.DictReader(f))]
+
+        response = self.client.get('/routes_geo/data?bbox=-0.2,51.5,-0.19,51.51').json()
+        self.assertIn('data_rtree', response['metadata']['sql_query'])
+        expected = [i for i, lat, lng in points if 51.5 <= lat <= 51.51 and -0.2 <= lng <= -0.19]
+        self.assertEqual(sorted(row['id'] for row in response['data']), expected)
+
+        response = self.client.get('/routes_geo/data?near=51.505,-0.198,0.5').json()
+        expected = [i for i, lat, lng in points if distance_km(lat, lng, 51.505, -0.198) <= 0.5]
+        self.assertEqual(sorted(row['id'] for row in response['data']), expected)
+        distances = [row['distance_km'] for row in response['data']]
+        self.assertEqual(distances, sorted(distances))
+
+    def testSpatialNearEdges(self):
+        '''
+        ### Test near filters across the antimeridian, over a pole and far from the equator
+        '''
+        import pandas as pd
+        from fastapi_wrapper.sql_helper import distance_km
+
+        print('### Spatial Near Edges Test')
+
+        points = pd.DataFrame({
+            'name': ['east', 'west', 'far_west', 'date_line', 'origin', 'pole_east', 'pole_west', 'pole_far', 'arctic'],
+            'lat': [0.0, 0.0, 0.0, 0.05, 0.0, 89.9, 89.95, 89.5, 70.48],
+            'lng': [179.9, -179.9, -179.0, 180.0, 0.0, 180.0, -90.0, 180.0, 13.2],
+        })
+        self.app.create_database('routes_geo', 'points.csv', df=points)
+        for near in ['0,179.95,20', '0,-179.95,20', '0,-180,20', '89.9,0,50', '70,0,500']:
+            lat, lng, radius_km = map(float, near.split(','))
+            expected = sorted(name for name, p_lat, p_lng in points.itertuples(index=False) if distance_km(p_lat, p_lng, lat, lng) <= radius_km)
+            response = self.client.get(f'/routes_geo/points?near={near}').json()
+            self.assertIn('points_rtree', response['metadata']['sql_query'])
+            self.assertEqual(sorted(row['name'] for row in response['data']), expected, near)
+            self.assertTrue(expected, near)
+
+
+class MetricsTests(GeneratedRouteTestCase):
+
+    def testMetrics(self):
+        '''
+        ### Test Prometheus metrics endpoint
+        '''
+        print('### Metrics Test')
+
+        self.client.get('/routes_test/test?location_like=Kingdom')
+        self.client.get('/routes_test/test?tohtml&page_size=10')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('fastapi_wrapper_requests_total{route="/routes_test/{table}",method="GET",status="200"}', response.text)
+        for name in ['sql_duration_seconds_bucket', 'serialization_duration_seconds_count', 'html_render_duration_seconds_count',
+                     'rows_returned_total', 'pool_connections_in_use', 'ingest_rows_total{table="test"}']:
+            self.assertIn(f'fastapi_wrapper_{name}', response.text)
+
+
+class TimingTests(GeneratedRouteTestCase):
+
+    def testTiming(self):
+        '''
+        ### Test phase timings in metadata and Server-Timing header
+        '''
+        print('### Timing Test')
+
+        response = self.client.get('/routes_test/test?cmd=LIMIT 10&timing=1')
+        self.assertEqual(list(response.json()['metadata']['timing']), ['compile', 'count', 'query', 'fetch', 'rows'])
+        self.assertIn('serialize;dur=', response.headers['Server-Timing'])
+
+        response = self.client.get('/routes_test/test?cmd=LIMIT 10')
+        self.assertNotIn('timing', response.json()['metadata'])
+
+
+class SlowQueryLogTests(GeneratedRouteTestCase):
+
+    def setUp(self):
+        import os
+        import tempfile
+        from fastapi_wrapper import slow_query_helper
+
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.addCleanup(slow_query_helper.close)
+        # Both log backends: a SQLite DB, and a JSONL file
+        self.logs = [os.path.join(tmp_dir.name, log_name) for log_name in ['slow.db', 'slow.jsonl']]
+
+    def testSlowQueryLog(self):
+        '''
+        ### Test slow query log with query plans, in SQLite and JSONL logs
+        '''
+        print('### Slow Query Log Test')
+
+        for log in self.logs:
+            with override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_LOG=log):
+                self.client.get('/routes_test/test?location_like=Kingdom&cmd=LIMIT 5')
+                entries = self.client.get('/admin/slow-queries?limit=1').json()['data']
+                self.assertEqual(len(entries), 1)
+                self.assertEqual(entries[0]['route'], '/routes_test/{table}')
+                self.assertEqual(entries[0]['params'], {'location_like': 'Kingdom', 'cmd': 'LIMIT 5'})
+                self.assertEqual(entries[0]['rows_returned'], 5)
+                self.assertTrue(any('SCAN test' in line for line in entries[0]['query_plan']))
+
+    def testSlowQueriesLimit(self):
+        '''
+        ### Test the slow query log's limit is at least 1, rather than the whole log (or all but the newest entries)
+        '''
+        from fastapi_wrapper import slow_query_helper
+
+        print('### Slow Queries Limit Test')
+
+        for log in self.logs:
+            with override_settings(SLOW_QUERY_MS=0, SLOW_QUERY_LOG=log):
+                for limit in [1, 2, 3]:
+                    self.client.get(f'/routes_test/test?cmd=LIMIT {limit}')
+                entries = slow_query_helper.recent(limit=1000)
+                self.assertGreaterEqual(len(entries), 3)
+                self.assertEqual(self.client.get('/admin/slow-queries?limit=2').json()['data'], entries[:2])
+
+                for limit in [0, -1, 1001]:
+                    self.assertEqual(self.client.get(f'/admin/slow-queries?limit={limit}').status_code, 422, limit)
+                for limit in [0, -1]:
+                    self.assertEqual(slow_query_helper.recent(limit=limit), entries[:1], limit)
+
+
+class IndexAdvisorTests(GeneratedRouteTestCase):
+
+    def setUp(self):
+        import os
+        import tempfile
+        from fastapi_wrapper import workload_helper
+
+        super().setUp()
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.addCleanup(workload_helper.close)
+        patcher = override_settings(WORKLOAD_DB=os.path.join(tmp_dir.name, 'workload.db'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Only the shapes of this test's queries
+        workload_helper._pending.clear()
+        for _ in range(3):
+            self.client.get('/routes_test/test?location=United Kingdom&year_gte=2020&cols=value')
+
+    def testIndexAdvisor(self):
+        '''
+        ### Test index recommendations from recorded filter shapes
+        '''
+        import time
+
+        print('### Index Advisor Test')
+
+        recommendations = self.client.get('/admin/index-advisor?database=routes_test').json()['data']
+        self.assertEqual(recommendations[0]['columns'], ['location', 'year', 'value'])
+        self.assertEqual(recommendations[0]['queries'], 3)
+        self.assertIn('SCAN test', recommendations[0]['current_plan'])
+        self.assertIn('COVERING INDEX ix_test_location_year_value', recommendations[0]['new_plan'][0])
+
+        self.client.get('/admin/index-advisor?database=routes_test&build=true')
+        # Once built, the index isn't recommended any more
+        for _ in range(50):
+            time.sleep(0.1)
+            recommendations = self.client.get('/admin/index-advisor?database=routes_test').json()['data']
+            if not recommendations:
+                break
+        self.assertEqual(recommendations, [])
+
+    def testDistinctCountsFromStats(self):
+        '''
+        ### Test the advisor ranks columns by their column stats, rather than scanning the table per column
+        '''
+        from fastapi_wrapper import workload_helper
+        from fastapi_wrapper.fastapi_wrapper import TABLE_STATS, open_connection, resolve_db
+
+        print('### Index Advisor Distinct Counts Test')
+
+        db, _ = resolve_db('routes_test')
+        workload_helper.flush()
+        shapes = workload_helper.load_shapes(database=db, table='test')
+        statements = []
+        con = open_connection(db, read_only=True)
+        try:
+            con.set_trace_callback(statements.append)
+            recommendations = workload_helper.recommend(con, 'test', shapes, stats=TABLE_STATS[(db, 'test')])
+        finally:
+            con.close()
+        self.assertEqual(recommendations[0]['columns'], ['location', 'year', 'value'])
+        self.assertFalse([sql for sql in statements if 'DISTINCT' in sql])
+
+    def testBuildWaitsForWriteLock(self):
+        '''
+        ### Test an index build waits for a load holding the DB's write lock, and is only reported built once committed
+        '''
+        import functools
+        import time
+        from fastapi_wrapper import workload_helper
+        from fastapi_wrapper.fastapi_wrapper import connection_for_db, open_connection, query_database, resolve_db
+
+        print('### Index Build Write Lock Test')
+
+        db, _ = resolve_db('routes_test')
+        rec = {
+            'index_name': 'ix_test_year', 'table': 'test', 'create_sql': 'CREATE INDEX ix_test_year ON test (year)',
+            'shapes': [{'eq': ['year'], 'range': [], 'select': None, 'count': 1}],
+        }
+        self.addCleanup(workload_helper.BUILDS.pop, 'ix_test_year', None)
+        con = connection_for_db(db)
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            thread = workload_helper.build_index(functools.partial(open_connection, db), rec)
+            time.sleep(0.5)
+            self.assertEqual(workload_helper.BUILDS['ix_test_year'], 'building')
+        finally:
+            con.commit()
+        thread.join()
+        self.assertEqual(workload_helper.BUILDS['ix_test_year'], 'built')
+        self.assertIn('ix_test_year', [row['name'] for row in query_database(db, 'PRAGMA index_list(test)')])
+
+
+class FastJSONTests(GeneratedRouteTestCase):
+
+    def testFastJSON(self):
+        '''
+        ### Test fast JSON serialization, with and without orjson
+        '''
+        import json
+        from fastapi_wrapper import json_helper
+
+        print('### Fast JSON Test')
+
+        response = self.client.get('/routes_test/test?cmd=LIMIT 3')
+        self.assertEqual(response.headers['content-type'], 'application/json')
+        self.assertEqual(len(response.json()['data']), 3)
+
+        content = {'data': [{'a': float('nan'), 'b': float('inf'), 'c': None, 'd': b'blob', 'e': 'Zürich', 'f': 1.5}]}
+        expected = {'data': [{'a': None, 'b': None, 'c': None, 'd': 'blob', 'e': 'Zürich', 'f': 1.5}]}
+        self.assertEqual(json.loads(json_helper.dumps(content)), expected)
+        with mock.patch.object(json_helper, 'orjson', None):
+            self.assertEqual(json.loads(json_helper.dumps(content)), expected)
+
+
+class CompressionTests(GeneratedRouteTestCase):
+
+    def testCompression(self):
+        '''
+        ### Test negotiated response compression, of whole and streamed responses
+        '''
+        from fastapi_wrapper.compression_helper import negotiate
+
+        print('### Compression Test')
+
+        self.assertEqual(negotiate('br;q=0.5, gzip', ['zstd', 'br', 'gzip']), 'gzip')
+        self.assertEqual(negotiate('gzip, br', ['zstd', 'br', 'gzip']), 'br')
+        self.assertEqual(negotiate('*;q=0.1, identity', ['gzip']), 'gzip')
+        self.assertIsNone(negotiate('gzip;q=0', ['gzip']))
+
+        response = self.client.get('/routes_test/test', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['vary'])
+        self.assertGreater(len(response.json()['data']), 0)
+
+        response = self.client.get('/routes_test/test?cmd=LIMIT 1', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('content-encoding', response.headers)
+
+        response = self.client.get('/routes_test/test', headers={'Accept-Encoding': 'identity'})
+        self.assertNotIn('content-encoding', response.headers)
+
+        response = self.client.get('/routes_test/test?tohtml&page_size=100', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['content-encoding'], 'gzip')
+        self.assertNotIn('content-length', response.headers)
+        self.assertIn('</table>', response.text)
+
+    def testVaryUncompressed(self):
+        '''
+        ### Test compressible responses vary by Accept-Encoding, compressed or not, so shared caches keep them apart
+        '''
+        print('### Vary Uncompressed Test')
+
+        for path, accept_encoding in [
+            ('/routes_test/test?cmd=LIMIT 1', 'gzip'), # Under the size threshold
+            ('/routes_test/test', 'identity'), # No usable encoding
+            ('/routes_test/test', ''), # No encodings
+            ('/routes_test/test?tohtml&cmd=LIMIT 1', 'identity'), # Streamed
+        ]:
+            response = self.client.get(path, headers={'Accept-Encoding': accept_encoding})
+            self.assertNotIn('content-encoding', response.headers)
+            self.assertIn('Accept-Encoding', response.headers.get('vary', ''), (path, accept_encoding))
+
+        # Not for responses which aren't compressible
+        response = self.client.get('/download/routes_test', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['content-type'], 'application/octet-stream')
+        self.assertNotIn('vary', response.headers)
+
+
+class ColumnStatsTests(GeneratedRouteTestCase):
+
+    def testColumnStats(self):
+        '''
+        ### Test column stats computed at ingest, and the stats endpoint
+        '''
+        print('### Column Stats Test')
+
+        response = self.client.get('/routes_test/test/stats')
+        self.assertEqual(response.status_code, 200)
+        stats = response.json()
+        columns = stats['columns']
+
+        year = self.client.get('/routes_test/test?cols=MIN(year) AS min, MAX(year) AS max, COUNT(DISTINCT year) AS n').json()['data'][0]
+        self.assertEqual((columns['year']['min'], columns['year']['max']), (year['min'], year['max']))
+        self.assertEqual(columns['year']['distinct_count'], year['n'])
+        self.assertEqual(sum(columns['value']['histogram']['counts']), columns['value']['count'])
+        self.assertEqual(columns['value']['count'] + columns['value']['null_count'], stats['metadata']['row_count'])
+        self.assertEqual(columns['location']['type'], 'str')
+        self.assertLessEqual(len(columns['location']['top_values']), 10)
+
+        response = self.client.get('/routes_test/test/stats?cols=year,location')
+        self.assertEqual(list(response.json()['columns']), ['year', 'location'])
+
+        # Stats survive a restart from the routes config DB
+        from fastapi_wrapper.fastapi_wrapper import TABLE_STATS, resolve_db
+        TABLE_STATS.clear()
+        self.app.initialize_routes_with_config_db(resolve_db(self.config_db)[0])
+        self.assertEqual(self.client.get('/routes_test/test/stats').json(), stats)
+
+
+class CountEstimateTests(GeneratedRouteTestCase):
+
+    def testCountEstimate(self):
+        '''
+        ### Test estimated full_count, from column stats and from a sample
+        '''
+        from fastapi_wrapper import stats_helper
+        from fastapi_wrapper.fastapi_wrapper import pooled_connection, resolve_db
+
+        print('### Count Estimate Test')
+
+        for query in ['location=United Kingdom', 'year_gte=2021&year_lte=2030', 'locationcode_in=UK,US&value_gt=1000']:
+            exact = self.client.get(f'/routes_test/test?{query}&cmd=LIMIT 1').json()['metadata']
+            estimated = self.client.get(f'/routes_test/test?{query}&cmd=LIMIT 1&count=estimate').json()['metadata']
+            bounds = estimated['full_count_estimate']
+            self.assertEqual(bounds['method'], 'stats')
+            self.assertLessEqual(bounds['low'], exact['full_count'])
+            self.assertGreaterEqual(bounds['high'], exact['full_count'])
+            self.assertEqual(estimated['results_count'], 1)
+
+        # Top values are counted exactly
+        estimated = self.client.get('/routes_test/test?location=United Kingdom&count=estimate').json()['metadata']
+        self.assertEqual(estimated['full_count'], estimated['full_count_estimate']['low'])
+        self.assertEqual(estimated['full_count'], estimated['full_count_estimate']['high'])
+
+        # Other filters are counted on a sample (here the whole table, which is smaller than the sample)
+        exact = self.client.get('/routes_test/test?location_like=Kingdom&cmd=LIMIT 1').json()['metadata']
+        estimated = self.client.get('/routes_test/test?location_like=Kingdom&cmd=LIMIT 1&count=estimate').json()['metadata']
+        self.assertEqual(estimated['full_count_estimate']['method'], 'exact')
+        self.assertEqual(estimated['full_count'], exact['full_count'])
+
+        with pooled_connection(resolve_db('routes_test')[0]) as con:
+            estimate = stats_helper.sample_count(con, 'test', "WHERE year >= 2000", budget=200, blocks=20)
+        self.assertFalse(estimate['exact'])
+        self.assertLessEqual(estimate['low'], estimate['count'])
+        self.assertLessEqual(estimate['count'], estimate['high'])
+
+        with self.assertRaises(Exception):
+            self.client.get('/routes_test/test?count=guess')
+
+
+class BatchTests(GeneratedRouteTestCase):
+
+    def testBatch(self):
+        '''
+        ### Test batch endpoint running many route queries in one request
+        '''
+        print('### Batch Test')
+
+        queries = [
+            {'id': 'uk', 'path': '/routes_test/test', 'params': {'location': 'United Kingdom', 'cmd': 'LIMIT 5'}},
+            {'path': '/routes_test/test?year_gte=2021&cols=location, year'},
+            {'path': '/routes_test/test', 'params': {'year': 'not a year'}},
+            {'path': '/routes_test/test', 'params': {'colour': 'red'}},
+            {'path': '/nowhere/test'},
+        ]
+        response = self.client.post('/batch', json={'queries': queries})
+        self.assertEqual(response.status_code, 200)
+        batch = response.json()
+        self.assertEqual(batch['metadata'], {'results_count': 5, 'errors_count': 3})
+
+        results = batch['results']
+        expected = self.client.get('/routes_test/test?location=United Kingdom&cmd=LIMIT 5').json()
+        self.assertEqual((results[0]['id'], results[0]['status']), ('uk', 200))
+        self.assertEqual(results[0]['result'], expected)
+        self.assertEqual(set(results[1]['result']['data'][0].keys()), {'location', 'year'})
+        self.assertEqual([result['status'] for result in results[2:]], [400, 400, 404])
+        self.assertIn('colour', results[3]['error'])
+
+
+class FederatedJoinTests(GeneratedRouteTestCase):
+
+    def testFederatedJoin(self):
+        '''
+        ### Test joins of tables in different databases
+        '''
+        import pandas as pd
+
+        print('### Federated Join Test')
+
+        codes = pd.DataFrame({'Code': ['UK', 'US', 'FR'], 'Name': ['Britain', 'United States', 'France']})
+        self.app.create_database('routes_geo', 'codes.csv', df=codes)
+
+        query = {
+            'tables': [
+                {'database': 'routes_test', 'table': 'test', 'alias': 't'},
+                {'database': 'routes_geo', 'table': 'codes', 'alias': 'c', 'on': {'t.locationcode': 'c.code'}},
+            ],
+            'filters': {'t.year_gte': 2021, 'c.name_begin': 'United'},
+            'cols': ['t.location', 't.year', 'c.name AS country'],
+            'order_by': ['t.year DESC'],
+        }
+        response = self.client.post('/federated', json=query)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()
+        expected = self.client.get('/routes_test/test?locationcode=US&year_gte=2021').json()['metadata']['full_count']
+        self.assertEqual(results['metadata']['results_count'], expected)
+        self.assertEqual(results['metadata']['databases'], {'main': 'routes_test', 'db1': 'routes_geo'})
+        self.assertEqual(set(results['data'][0].keys()), {'location', 'year', 'country'})
+        self.assertTrue(all(row['country'] == 'United States' for row in results['data']))
+
+        # Nothing stays attached to the pooled connections
+        self.assertEqual(self.client.get('/routes_test/test?cmd=LIMIT 1').status_code, 200)
+        response = self.client.post('/federated', json={**query, 'filters': {}, 'cols': [], 'order_by': [], 'limit': 2}).json()
+        self.assertEqual(len(response['data']), 2)
+        self.assertIn('c_name', response['data'][0])
+
+        with self.assertRaises(Exception):
+            self.client.post('/federated', json={**query, 'cols': ['t.nope']})
+
+
+class CsvEngineTests(GeneratedRouteTestCase):
+
+    def testCsvEngine(self):
+        '''
+        ### Test the pandas-free csv ingestion engine gives the same table, query params and stats as pandas
+        '''
+        print('### CSV Engine Test')
+
+        self.app.create_database('routes_geo', './data/test.csv', engine='csv')
+
+        query_params = lambda route_path: [(field.name, field.type_) for field in self.app._get_query_params(route_path)]
+        self.assertEqual(query_params('/routes_geo/{table}'), query_params('/routes_test/{table}'))
+
+        query = 'test?location=United Kingdom&cmd=ORDER BY id'
+        self.assertEqual(self.client.get(f'/routes_geo/{query}').json()['data'], self.client.get(f'/routes_test/{query}').json()['data'])
+
+        stats = self.client.get('/routes_geo/test/stats').json()
+        pandas_stats = self.client.get('/routes_test/test/stats').json()
+        for col in ['year', 'value', 'location']:
+            for key in ['type', 'count', 'null_count', 'distinct_count', 'min', 'max', 'histogram']:
+                self.assertEqual(stats['columns'][col].get(key), pandas_stats['columns'][col].get(key))
+
+        # Appended rows' ids follow on, and the stats cover the whole table
+        self.app.update_database('routes_geo', './data/test.csv', if_exists='append', engine='csv')
+        data = self.client.get('/routes_geo/test?cols=COUNT(*) AS n, COUNT(DISTINCT id) AS ids').json()['data'][0]
+        self.assertEqual(data['n'], data['ids'])
+        self.assertEqual(self.client.get('/routes_geo/test/stats').json()['metadata']['row_count'], data['n'])
+
+        with self.assertRaises(Exception):
+            self.app.update_database('routes_geo', './data/test.csv', data_format='XLSX', engine='csv')
+
+
+class SnapshotTests(GeneratedRouteTestCase):
+
+    def setUp(self):
+        from fastapi_wrapper import snapshot_helper
+        from fastapi_wrapper.fastapi_wrapper import resolve_db
+
+        super().setUp()
+        patcher = override_settings(SNAPSHOTS=True, SNAPSHOT_KEEP=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.db, _ = resolve_db('routes_test')
+        self.addCleanup(self._remove_snapshots)
+        # Publishes snapshot 1
+        self.app.update_database('routes_test', './data/test.csv')
+        self.assertEqual(snapshot_helper.current(self.db)['version'], 1)
+
+    def _remove_snapshots(self):
+        import os
+        from fastapi_wrapper import snapshot_helper
+
+        for path in [snapshot_helper.pointer_path(self.db), *snapshot_helper.snapshot_versions(self.db).values()]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def testSnapshots(self):
+        '''
+        ### Test queries read published snapshots, pinned while in use and reclaimed when idle
+        '''
+        import os
+        import sqlite3
+        from fastapi_wrapper import snapshot_helper
+        from fastapi_wrapper.fastapi_wrapper import DB_POOLS, open_connection, pooled_connection
+
+        print('### Snapshots Test')
+
+        db = self.db
+        rows = self.client.get('/routes_test/test?cmd=LIMIT 1').json()['metadata']['full_count']
+
+        # A read in progress stays on its snapshot while a load publishes a new one
+        with pooled_connection(db) as con:
+            self.app.update_database('routes_test', './data/test.csv', if_exists='append')
+            self.assertEqual(con.execute('SELECT COUNT(*) AS n FROM test').fetchone()['n'], rows)
+            self.assertEqual(self.client.get('/routes_test/test?cmd=LIMIT 1').json()['metadata']['full_count'], 2 * rows)
+        # ...and its snapshot's pool is closed once idle
+        self.assertNotIn(snapshot_helper.snapshot_path(db, 1), DB_POOLS)
+
+        self.app.update_database('routes_test', './data/test.csv', if_exists='append')
+        self.assertEqual(sorted(snapshot_helper.snapshot_versions(db)), [2, 3])
+        self.assertEqual(self.client.get('/routes_test/test?cmd=LIMIT 1').json()['metadata']['full_count'], 3 * rows)
+
+        # A deleted snapshot can't be opened (rather than being created empty)
+        with self.assertRaises(sqlite3.OperationalError):
+            open_connection(db, read_only=True, snapshot=snapshot_helper.snapshot_path(db, 1))
+        self.assertFalse(os.path.exists(snapshot_helper.snapshot_path(db, 1)))
+
+    def testPublishedByOtherWorker(self):
+        '''
+        ### Test the idle pool of a snapshot is closed when the pool of one published by another worker process is made
+        '''
+        import sqlite3
+        from fastapi_wrapper import snapshot_helper
+        from fastapi_wrapper.fastapi_wrapper import DB_POOLS, pool_for_db
+
+        print('### Snapshot Published By Other Worker Test')
+
+        db = self.db
+        self.client.get('/routes_test/test?cmd=LIMIT 1')
+        writer = sqlite3.connect(db)
+        try:
+            snapshot_helper.publish(writer, db)
+        finally:
+            writer.close()
+        self.assertIn(snapshot_helper.snapshot_path(db, 1), DB_POOLS)
+        self.assertEqual(pool_for_db(db).snapshot, snapshot_helper.snapshot_path(db, 2))
+        self.assertNotIn(snapshot_helper.snapshot_path(db, 1), DB_POOLS)
+
+    def testConcurrentPublishers(self):
+        '''
+        ### Test worker processes publishing at once each take a version of their own
+        '''
+        import subprocess
+        import sys
+        from fastapi_wrapper import snapshot_helper
+
+        print('### Concurrent Snapshot Publishers Test')
+
+        code = 'import sqlite3, sys; from fastapi_wrapper import snapshot_helper; snapshot_helper.publish(sqlite3.connect(sys.argv[1]), sys.argv[1])'
+        procs = [subprocess.Popen([sys.executable, '-c', code, self.db], stdout=subprocess.DEVNULL) for _ in range(4)]
+        self.assertEqual([proc.wait() for proc in procs], [0] * 4)
+        self.assertEqual(sorted(snapshot_helper.snapshot_versions(self.db)), [1, 2, 3, 4, 5])
+        self.assertEqual(snapshot_helper.current(self.db)['version'], 5)
+
+
+class AdmissionControlTests(GeneratedRouteTestCase):
+
+    # Every ad-hoc query is expensive, and a client runs one at a time, waiting 0.1s for a slot
+    ONE_AT_A_TIME = {'ADMISSION_EXPENSIVE_COST': 1, 'ADMISSION_MAX_EXPENSIVE': 1, 'ADMISSION_QUEUE_SECONDS': 0.1}
+
+    def setUp(self):
+        from fastapi_wrapper import admission_helper
+
+        super().setUp()
+        self.addCleanup(admission_helper._running.clear)
+
+    def testAdmissionControl(self):
+        '''
+        ### Test ad-hoc queries are costed, and rejected beyond their client's budget
+        '''
+        from fastapi_wrapper import admission_helper
+        from fastapi_wrapper.fastapi_wrapper import TABLE_STATS, pooled_connection, resolve_db
+
+        print('### Admission Control Test')
+
+        db, _ = resolve_db('routes_test')
+        rows = TABLE_STATS[(db, 'test')]['row_count']
+        with pooled_connection(db) as con:
+            stats = lambda table: TABLE_STATS.get((db, table), None)
+            self.assertEqual(admission_helper.estimate_cost(con, 'SELECT * FROM test', stats), rows)
+            # A cartesian product, sorted
+            cost = admission_helper.estimate_cost(con, 'SELECT * FROM test WHERE year IN (SELECT a.year FROM test a, test b) ORDER BY value', stats)
+            self.assertGreater(cost, rows * rows)
+
+        with override_settings(ADMISSION_MAX_COST=rows * rows):
+            results = self.client.get('/routes_test/test?cols=location, year&where=year > 2020').json()
+            # The exact count's scan, and the limited query's
+            self.assertEqual(results['metadata']['estimated_cost'], 2 * rows)
+            results = self.client.get('/routes_test/test?cols=location, year&where=year > 2020&count=estimate').json()
+            self.assertEqual(results['metadata']['estimated_cost'], rows)
+            response = self.client.get('/routes_test/test?where=year IN (SELECT a.year FROM test a, test b)')
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('estimated cost', response.json()['detail'])
+
+        # Queries without ad-hoc SQL aren't costed
+        self.assertNotIn('estimated_cost', self.client.get('/routes_test/test?year=2020').json()['metadata'])
+
+    def testAdmissionQueue(self):
+        '''
+        ### Test a client's expensive queries beyond ADMISSION_MAX_EXPENSIVE wait for a slot, then are rejected
+        '''
+        from fastapi_wrapper import admission_helper
+
+        print('### Admission Queue Test')
+
+        with override_settings(**self.ONE_AT_A_TIME):
+            admission_helper._running['testclient'] = 1
+            response = self.client.get('/routes_test/test?cmd=LIMIT 1')
+            self.assertEqual((response.status_code, response.headers['Retry-After']), (429, '1'))
+            admission_helper._release('testclient')
+            self.assertEqual(self.client.get('/routes_test/test?cmd=LIMIT 1').status_code, 200)
+            self.assertEqual(admission_helper.running('testclient'), 0)
+
+    def testAdmissionStreamedHtml(self):
+        '''
+        ### Test a streamed HTML table holds its admission slot until it's streamed
+        '''
+        import asyncio
+        from fastapi import Request
+        from fastapi_wrapper import admission_helper
+
+        print('### Admission Streamed HTML Test')
+
+        route = self.app._find_route('/routes_test/{table}')
+        kwargs = {field.name: None for field in route.dependant.query_params}
+        kwargs.update(tohtml='', cmd='LIMIT 5')
+        scope = {
+            'type': 'http', 'method': 'GET', 'scheme': 'http', 'server': ('testserver', 80), 'root_path': '', 'headers': [],
+            'client': ('testclient', 50000), 'path': '/routes_test/test', 'query_string': b'tohtml=&cmd=LIMIT+5',
+            'app': self.app, 'route': route, 'endpoint': route.endpoint, 'path_params': {'table': 'test'},
+        }
+
+        async def consume(response):
+            return b''.join([chunk.encode() if isinstance(chunk, str) else chunk async for chunk in response.body_iterator])
+
+        with override_settings(**self.ONE_AT_A_TIME):
+            # The endpoint has returned, but its page isn't streamed yet
+            streaming = route.endpoint(table='test', request=Request(scope), **kwargs)
+            self.assertEqual(admission_helper.running('testclient'), 1)
+            self.assertEqual(self.client.get('/routes_test/test?tohtml&cmd=LIMIT 5').status_code, 429)
+
+            self.assertIn(b'<table', asyncio.run(consume(streaming)))
+            self.assertEqual(admission_helper.running('testclient'), 0)
+            self.assertEqual(self.client.get('/routes_test/test?tohtml&cmd=LIMIT 5').status_code, 200)
+
+
+class RowLimitTests(GeneratedRouteTestCase):
+
+    def testRowLimits(self):
+        '''
+        ### Test routes' default and max. row limits, in the SQL and the routes config
+        '''
+        from fastapi.testclient import TestClient
+        from fastapi_wrapper.fastapi_wrapper import FastAPI_Wrapper, ROUTE_LIMITS, resolve_db
+
+        print('### Row Limits Test')
+
+        try:
+            self.app.create_database('routes_test', './data/test.csv', default_limit=5, max_limit=20)
+            metadata = self.client.get('/routes_test/test').json()['metadata']
+            self.assertEqual((metadata['results_count'], metadata['limit'], metadata['truncated']), (5, 5, True))
+            self.assertTrue(metadata['sql_query'].endswith('LIMIT 6 OFFSET 0'))
+
+            # The continuation hint gets the next rows
+            following = self.client.get(metadata['next']).json()
+            self.assertEqual(following['metadata']['offset'], 5)
+            self.assertEqual(following['data'], self.client.get('/routes_test/test?cmd=LIMIT 5 OFFSET 5').json()['data'])
+
+            self.assertEqual(self.client.get('/routes_test/test?limit=1000').json()['metadata']['results_count'], 20)
+            metadata = self.client.get('/routes_test/test?cmd=LIMIT 3').json()['metadata']
+            self.assertEqual((metadata['results_count'], metadata['truncated'], metadata['next']), (3, False, None))
+
+            # Routes rebuilt from the routes config keep their limits
+            ROUTE_LIMITS.clear()
+            app = FastAPI_Wrapper(init_routes_with_config_db=True, config_db=self.config_db)
+            self.assertEqual(ROUTE_LIMITS['/routes_test/{table}'], {'default_limit': 5, 'max_limit': 20})
+            self.assertEqual(TestClient(app).get('/routes_test/test').json()['metadata']['results_count'], 5)
+        finally:
+            ROUTE_LIMITS.clear()
+
+
 if __name__ == '__main__':
     # suite = unittest.TestLoader().loadTestsFromTestCase(MiscTests)
     # suite = unittest.TestLoader().loadTestsFromTestCase(FastAPIMultiprocessTests)
@@ -0,0 +1,254 @@
+"""
+End-to-end benchmarks of ingestion and query latency, against an in-process uvicorn server.
+
+Generates a synthetic dataset (CSV and/or XLSX) of the given size and width, and measures:
+- ingestion throughput of `update_database` (rows/s) and route registration time of `create_database`
+- p50/p95/p99 latency and throughput of representative filter, `_like`, `cols`, `cmd` and `tohtml`
+  queries, with concurrent clients
+
+Results are written as JSON (with the git commit), to compare across commits. Run from the repo root:
+
+    python benchmarks/bench_end_to_end.py --rows 200000 --width 10 --concurrency 8 --requests 400
+    python benchmarks/bench_end_to_end.py --compare benchmarks/results/<earlier results>.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+import uvicorn
+
+from fastapi_wrapper.fastapi_wrapper import FastAPI_Wrapper, resolve_db, close_database
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+LOCATIONS = [f'Location {i}' for i in range(200)]
+INDICATORS = ['GDP', 'GDP real', 'Inflation', 'Unemployment', 'Population', 'Exports', 'Imports', 'Consumption']
+
+def make_dataset(rows, width, seed=42) -> pd.DataFrame:
+    """A macro-model like table: location, indicator, year, value, plus `width - 4` extra numeric and text columns."""
+    rng = random.Random(seed)
+    data = {
+        'Location': [rng.choice(LOCATIONS) for _ in range(rows)],
+        'Indicator': [rng.choice(INDICATORS) for _ in range(rows)],
+        'Year': [1980 + i % 70 for i in range(rows)],
+        'Value': [rng.random() * 1000 for _ in range(rows)],
+    }
+    for i in range(max(0, width - 4)):
+        if i % 2 == 0:
+            data[f'Num {i}'] = [rng.random() for _ in range(rows)]
+        else:
+            data[f'Text {i}'] = [f'text {rng.randrange(1000)}' for _ in range(rows)]
+    return pd.DataFrame(data)
+
+def queries(table) -> dict:
+    """Representative queries of a generated route."""
+    return {
+        'filter': f'/bench/{table}?location={quote("Location 7")}&year_gte=2000',
+        'like': f'/bench/{table}?location_like={quote("ion 1")}&indicator_like=GDP',
+        'cols': f'/bench/{table}?cols={quote("location, year, value")}&year=2010',
+        'cmd': f'/bench/{table}?indicator=Inflation&cmd={quote("ORDER BY value DESC LIMIT 100")}',
+        'tohtml': f'/bench/{table}?tohtml&indicator=Exports&page_size=500',
+    }
+
+class TimedWrapper(FastAPI_Wrapper):
+    """Times the `update_database` calls, so route registration can be told apart from ingestion."""
+
+    def __init__(self, *args, **kwargs):
+        self.update_seconds = {}
+        super().__init__(*args, **kwargs)
+
+    def update_database(self, database, data_path, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().update_database(database, data_path, *args, **kwargs)
+        finally:
+            self.update_seconds[str(data_path)] = self.update_seconds.get(str(data_path), 0) + time.perf_counter() - start
+
+def db_files(database) -> list:
+    db, _ = resolve_db(database)
+    return [db, f'{db}-wal', f'{db}-shm']
+
+def bench_ingestion(data_path, data_format, rows) -> tuple:
+    app = TimedWrapper(config_db='bench_config.db')
+    start = time.perf_counter()
+    app.create_database('bench', data_path, data_format=data_format)
+    create_seconds = time.perf_counter() - start
+    ingest_seconds = app.update_seconds[data_path]
+
+    start = time.perf_counter()
+    app.openapi()
+    openapi_seconds = time.perf_counter() - start
+
+    return app, {
+        'rows': rows,
+        'ingest_seconds': round(ingest_seconds, 4),
+        'ingest_rows_per_second': round(rows / ingest_seconds, 1),
+        'route_registration_ms': round((create_seconds - ingest_seconds) * 1000, 3),
+        'openapi_ms': round(openapi_seconds * 1000, 3),
+        'db_size_mib': round(sum(os.path.getsize(path) for path in db_files('bench') if os.path.exists(path)) / 2**20, 2),
+    }
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(app, port) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning', access_log=False))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+def percentile(sorted_values, pct) -> float:
+    idx = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[idx]
+
+def bench_query(port, path, requests, concurrency) -> dict:
+    """Runs `requests` GETs of a path from `concurrency` client threads, each with a keep-alive connection."""
+    per_client = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def client(count):
+        con = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        latencies, errors, size = [], 0, 0
+        for _ in range(count):
+            start = time.perf_counter()
+            con.request('GET', path)
+            response = con.getresponse()
+            body = response.read()
+            latencies.append((time.perf_counter() - start) * 1000)
+            size = len(body)
+            if response.status != 200:
+                errors += 1
+        con.close()
+        return latencies, errors, size
+
+    # Warm up (connection pool, page cache)
+    client(min(5, requests))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(client, per_client))
+    seconds = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result[0])
+    return {
+        'requests': len(latencies),
+        'errors': sum(result[1] for result in results),
+        'response_bytes': max(result[2] for result in results),
+        'throughput_rps': round(len(latencies) / seconds, 1),
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def compare(results, baseline_path):
+    """Prints the change of each metric against an earlier results file."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline['meta']['git_commit']}):")
+    for data_format, ingestion in results['ingestion'].items():
+        old = baseline['ingestion'].get(data_format, None)
+        if old:
+            for key in ['ingest_rows_per_second', 'route_registration_ms', 'openapi_ms']:
+                print(f"  {data_format} {key:<24} {old[key]:>12} -> {ingestion[key]:>12} ({(ingestion[key] / old[key] - 1) * 100:+.1f}%)")
+    for name, query in results['queries'].items():
+        old = baseline['queries'].get(name, None)
+        if old:
+            for key in ['p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps']:
+                print(f"  {name:<8} {key:<16} {old[key]:>12} -> {query[key]:>12} ({(query[key] / old[key] - 1) * 100:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='Rows in the synthetic dataset')
+    parser.add_argument('--width', type=int, default=8, help='Columns in the synthetic dataset (min. 4)')
+    parser.add_argument('--formats', default='csv', help="Comma separated data formats to ingest: csv, xlsx")
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per query')
+    parser.add_argument('--output', default=None, help='Results JSON file (default: benchmarks/results/<timestamp>_<commit>.json)')
+    parser.add_argument('--compare', default=None, help='Earlier results JSON file to compare with')
+    args = parser.parse_args()
+
+    formats = [fmt.strip().lower() for fmt in args.formats.split(',') if fmt.strip()]
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': vars(args),
+        },
+        'ingestion': {},
+        'queries': {},
+    }
+
+    print(f'Generating {args.rows} x {args.width} dataset...')
+    df = make_dataset(args.rows, args.width)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        app = None
+        for data_format in formats:
+            data_path = os.path.join(tmp_dir, 'bench_data' + ('.xlsx' if data_format == 'xlsx' else '.csv'))
+            if data_format == 'xlsx':
+                df.to_excel(data_path, index=False)
+            else:
+                df.to_csv(data_path, index=False)
+            print(f'Ingesting {data_format.upper()}...')
+            app, results['ingestion'][data_format] = bench_ingestion(data_path, data_format.upper(), args.rows)
+            print(f"  {results['ingestion'][data_format]}")
+
+        port = free_port()
+        server = start_server(app, port)
+        try:
+            for name, path in queries('bench_data').items():
+                print(f'Querying {name}: {path}')
+                results['queries'][name] = bench_query(port, path, args.requests, args.concurrency)
+                print(f"  {results['queries'][name]}")
+        finally:
+            server.should_exit = True
+            time.sleep(0.5)
+
+    for database in ['bench', 'bench_config']:
+        close_database(resolve_db(database)[0])
+        for path in db_files(database):
+            if os.path.exists(path):
+                os.remove(path)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{results['meta']['git_commit'] or 'nogit'}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {output}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
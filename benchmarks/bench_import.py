@@ -0,0 +1,69 @@
+"""
+Benchmarks the import time of the serving modules (what every worker and CLI invocation pays at start-up),
+each in fresh interpreters, and checks that they don't import pandas, numpy or django-environ, which are
+only needed to ingest data (or to render DataFrames as HTML).
+
+Run from the repo root (exits with 1 if a heavy module is imported, or an import takes over `--max-ms`):
+
+    python benchmarks/bench_import.py --repeat 10 --max-ms 1000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ['fastapi_wrapper.fastapi_wrapper', 'fastapi_wrapper.cli', 'bootstrapper']
+HEAVY_MODULES = ['pandas', 'numpy', 'environ']
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'heavy': [mod for mod in {heavy} if mod in sys.modules]}}))
+"""
+
+def import_once(module) -> dict:
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def slowest_imports(module, top) -> list:
+    """The `top` slowest imports (cumulative µs) of a module, from `python -X importtime`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=ROOT, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[1].isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Imports per module (the median is reported)')
+    parser.add_argument('--max-ms', type=float, default=None, help='Fail if a median import time is over this')
+    parser.add_argument('--top', type=int, default=0, help='Also list the slowest imports of each module')
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<34} {'median (ms)':>12} {'min (ms)':>10}  heavy modules imported")
+    for module in MODULES:
+        runs = [import_once(module) for _ in range(args.repeat)]
+        times = [run['seconds'] * 1000 for run in runs]
+        heavy = sorted(set(mod for run in runs for mod in run['heavy']))
+        median = statistics.median(times)
+        print(f"{module:<34} {median:>12.1f} {min(times):>10.1f}  {', '.join(heavy) or '-'}")
+        if heavy or (args.max_ms is not None and median > args.max_ms):
+            failed = True
+        for micros, name in slowest_imports(module, args.top):
+            print(f'    {micros / 1000:>8.1f} ms  {name}')
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
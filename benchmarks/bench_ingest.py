@@ -0,0 +1,106 @@
+"""
+Benchmarks the ingestion engines of `update_database` against each other: `pandas` (`read_csv` → DataFrame → `to_sql`)
+and `csv` (the stdlib `csv` module streaming rows into SQLite, see `fastapi_wrapper/csv_helper.py`).
+
+Each run ingests a CSV file in a fresh interpreter, and reports its time and peak RSS (resident memory), both overall and
+over the RSS before ingesting (after the serving modules are imported). Without a `--data-path`, a synthetic CSV of
+`--rows` rows and `--width` columns (alternately numeric and text) is generated. Run from the repo root:
+
+    python benchmarks/bench_ingest.py --rows 500000 --width 10 --repeat 3
+    python benchmarks/bench_ingest.py --data-path data/data.csv --no-stats
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fastapi_wrapper.fastapi_wrapper import INGEST_ENGINES, resolve_db
+
+DATABASE = 'bench_ingest'
+CONFIG_DB = 'bench_ingest_config.db'
+
+PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {root!r})
+from fastapi_wrapper.fastapi_wrapper import FastAPI_Wrapper
+
+def rss_mib():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KiB on Linux, bytes on macOS
+    return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+app = FastAPI_Wrapper(config_db={config_db!r})
+before = rss_mib()
+start = time.perf_counter()
+table = app.update_database({database!r}, {data_path!r}, engine={engine!r})
+seconds = time.perf_counter() - start
+print(json.dumps({{'seconds': seconds, 'rows': len(table), 'peak_rss_mib': rss_mib(), 'before_rss_mib': before}}))
+"""
+
+def make_csv(path, rows, width, seed=42):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Location', 'Year', 'Value'] + [f'Col {i}' for i in range(max(0, width - 3))])
+        for i in range(rows):
+            extra = [round(rng.random() * 100, 4) if j % 2 == 0 else f'text {rng.randrange(1000)}' for j in range(max(0, width - 3))]
+            writer.writerow([f'Location {rng.randrange(200)}', 1980 + i % 70, round(rng.random() * 1000, 3)] + extra)
+
+def remove_dbs():
+    for database in [DATABASE, CONFIG_DB]:
+        db, _ = resolve_db(database)
+        for path in [db, f'{db}-wal', f'{db}-shm']:
+            if os.path.exists(path):
+                os.remove(path)
+
+def ingest_once(data_path, engine, stats) -> dict:
+    env = {**os.environ, 'COLUMN_STATS': str(stats)}
+    probe = PROBE.format(root=ROOT, config_db=CONFIG_DB, database=DATABASE, data_path=data_path, engine=engine)
+    try:
+        result = subprocess.run([sys.executable, '-c', probe], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    finally:
+        remove_dbs()
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--data-path', default=None, help='CSV file to ingest (default: a synthetic CSV)')
+    parser.add_argument('--rows', type=int, default=200000, help='Rows in the synthetic CSV')
+    parser.add_argument('--width', type=int, default=8, help='Columns in the synthetic CSV (min. 3)')
+    parser.add_argument('--engines', default=','.join(INGEST_ENGINES), help='Comma separated engines to compare')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per engine (the median time and max. RSS are reported)')
+    parser.add_argument('--no-stats', action='store_true', help="Don't compute column stats at ingest")
+    args = parser.parse_args()
+
+    tmp_dir = None
+    data_path = args.data_path
+    if data_path is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        data_path = os.path.join(tmp_dir.name, 'bench_ingest.csv')
+        make_csv(data_path, args.rows, args.width)
+    size_mib = os.path.getsize(data_path) / 2**20
+
+    print(f'{data_path} ({size_mib:.1f} MiB), column stats: {not args.no_stats}')
+    print(f"{'engine':<8} {'rows':>10} {'median (s)':>11} {'rows/s':>11} {'peak RSS (MiB)':>15} {'ingest RSS (MiB)':>17}")
+    try:
+        for engine in [engine.strip() for engine in args.engines.split(',') if engine.strip()]:
+            runs = [ingest_once(data_path, engine, not args.no_stats) for _ in range(args.repeat)]
+            seconds = statistics.median(run['seconds'] for run in runs)
+            peak = max(run['peak_rss_mib'] for run in runs)
+            ingest = max(run['peak_rss_mib'] - run['before_rss_mib'] for run in runs)
+            rows = runs[0]['rows']
+            print(f'{engine:<8} {rows:>10} {seconds:>11.3f} {rows / seconds:>11.0f} {peak:>15.1f} {ingest:>17.1f}')
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+if __name__ == '__main__':
+    main()
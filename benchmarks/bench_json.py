@@ -0,0 +1,75 @@
+"""
+Benchmarks JSON serialization of a large query result: FastAPI's default path (`jsonable_encoder`, then
+the stdlib encoder, as `JSONResponse` does) vs. the fast path of generated routes (`json_helper.dumps`).
+
+Run from the repo root:
+
+    python benchmarks/bench_json.py --rows 100000 --repeat 5
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+from fastapi_wrapper import json_helper
+from fastapi_wrapper.fastapi_wrapper import dict_factory
+
+def make_results(rows) -> dict:
+    """A generated route's result, with rows of SQLite scalar types (text, integers, reals and NULLs) as dicts."""
+    rng = random.Random(42)
+    con = sqlite3.connect(':memory:')
+    con.execute('CREATE TABLE bench (id INTEGER, location TEXT, indicator TEXT, year INTEGER, value REAL, note TEXT)')
+    con.executemany('INSERT INTO bench VALUES (?, ?, ?, ?, ?, ?)', (
+        (i, f'Location {i % 200}', f'Indicator {i % 40}', 1980 + i % 70, rng.random() * 1000, None if i % 3 else 'revised')
+        for i in range(rows)
+    ))
+    con.row_factory = dict_factory
+    data = con.execute('SELECT * FROM bench').fetchall()
+    con.close()
+    return {
+        'metadata': {'database': 'bench.db', 'table': 'bench', 'sql_query': 'SELECT * FROM bench', 'full_count': rows, 'results_count': rows},
+        'data': data,
+    }
+
+def fastapi_default(content) -> bytes:
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+
+def stdlib_direct(content) -> bytes:
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='Rows in the result')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per serializer (the median is reported)')
+    args = parser.parse_args()
+
+    content = make_results(args.rows)
+    serializers = {
+        'jsonable_encoder + json': fastapi_default,
+        'json (no encoder)': stdlib_direct,
+        f"json_helper ({'orjson' if json_helper.orjson is not None else 'json'})": json_helper.dumps,
+    }
+
+    print(f"Serializing {args.rows} rows...")
+    print(f"{'serializer':<26} {'median (ms)':>12} {'rows/s':>12} {'MiB/s':>8} {'speedup':>8}")
+    baseline = None
+    for name, serialize in serializers.items():
+        runs = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            body = serialize(content)
+            runs.append(time.perf_counter() - start)
+        median = statistics.median(runs)
+        baseline = baseline or median
+        print(f'{name:<26} {median * 1000:>12.1f} {args.rows / median:>12.0f} {len(body) / 2**20 / median:>8.1f} {baseline / median:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
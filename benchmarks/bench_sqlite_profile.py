@@ -0,0 +1,80 @@
+"""
+Benchmarks scan-heavy queries on a file DB with SQLite defaults vs. the performance profile in settings.
+
+Run from the repo root:
+
+    python benchmarks/bench_sqlite_profile.py --rows 2000000 --repeat 5
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings.settings as settings
+from fastapi_wrapper.fastapi_wrapper import apply_profile
+
+QUERIES = {
+    'count_like': "SELECT COUNT(*) FROM bench WHERE name LIKE '%ab%'",
+    'group_sum': "SELECT category, SUM(value), COUNT(*) FROM bench GROUP BY category",
+    'order_by': "SELECT * FROM bench ORDER BY value DESC LIMIT 10",
+    'range_scan': "SELECT AVG(value) FROM bench WHERE year BETWEEN 1990 AND 2010",
+}
+
+def make_db(path, rows):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    con = sqlite3.connect(path)
+    con.execute('CREATE TABLE bench (id INTEGER PRIMARY KEY, name TEXT, category TEXT, value REAL, year INTEGER)')
+    rng = random.Random(42)
+    batch = []
+    for i in range(rows):
+        name = ''.join(rng.choice(letters) for _ in range(12))
+        batch.append((i, name, f'cat_{i % 50}', rng.random() * 1000, 1950 + i % 75))
+        if len(batch) == 100000:
+            con.executemany('INSERT INTO bench VALUES (?, ?, ?, ?, ?)', batch)
+            batch = []
+    con.executemany('INSERT INTO bench VALUES (?, ?, ?, ?, ?)', batch)
+    con.commit()
+    con.close()
+
+def time_queries(path, profile, repeat):
+    con = sqlite3.connect(path)
+    if profile is not None:
+        apply_profile(con, profile, read_only=True)
+    timings = {}
+    for name, sql in QUERIES.items():
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            con.execute(sql).fetchall()
+            runs.append((time.perf_counter() - start) * 1000)
+        timings[name] = statistics.median(runs)
+    con.close()
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='Rows in the benchmark table')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per query (the median is reported)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'bench.db')
+        print(f'Creating {args.rows} row benchmark DB...')
+        make_db(path, args.rows)
+        print(f'DB size: {os.path.getsize(path) / 2**20:.1f} MiB | Profile: {settings.SQLITE_PROFILE}')
+
+        defaults = time_queries(path, None, args.repeat)
+        profiled = time_queries(path, settings.SQLITE_PROFILE, args.repeat)
+
+    print(f"{'query':<12} {'defaults (ms)':>14} {'profile (ms)':>14} {'speedup':>8}")
+    for name in QUERIES:
+        print(f'{name:<12} {defaults[name]:>14.1f} {profiled[name]:>14.1f} {defaults[name] / profiled[name]:>7.2f}x')
+
+if __name__ == '__main__':
+    main()
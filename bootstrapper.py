@@ -4,11 +4,17 @@ Simple bootstrapper to start the API as a daemon process with routes supplied fr
 import sys
 import uvicorn
 
-from fastapi_wrapper.fastapi_wrapper import FastAPI_Wrapper, FastAPI_Wrapper_Singleton
+import settings.settings as settings
+from fastapi_wrapper.fastapi_wrapper import FastAPI_Wrapper, create_app, run_workers
 
-def stand_up(config_db='routes_config.db', host='127.0.0.1', port=8000):
-    app: FastAPI_Wrapper = FastAPI_Wrapper_Singleton(init_routes_with_config_db=False, config_db=config_db).instance
-    uvicorn.run(app, host=host, port=port)
+def stand_up(config_db='routes_config.db', host='127.0.0.1', port=8000, workers=settings.API_WORKERS):
+    if workers > 1:
+        # Each worker process rebuilds the routes from config_db via the app factory
+        run_workers(config_db, host=host, port=port, workers=workers)
+    else:
+        app: FastAPI_Wrapper = create_app(config_db)
+        uvicorn.run(app, host=host, port=port)
 
 if __name__ == "__main__":
-    stand_up(config_db=sys.argv[1], host=sys.argv[2], port=int(sys.argv[3]))
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else settings.API_WORKERS
+    stand_up(config_db=sys.argv[1], host=sys.argv[2], port=int(sys.argv[3]), workers=workers)
@@ -0,0 +1,248 @@
+"""
+Cost-based admission control of ad-hoc queries (generated route queries with `where`, `cols` or `cmd` params,
+see `ADMISSION_CONTROL` in settings).
+
+Before such a query runs, its cost (the rows SQLite will read, plus sorts) is estimated from its
+`EXPLAIN QUERY PLAN` and the table stats computed at ingest:
+
+- `SCAN t` reads all of `t`'s rows (its `row_count`, else `MAX(rowid)`)
+- `SEARCH t USING INDEX ... (a=? AND b>?)` reads the rows matching the constraints: a row count over the
+  column's distinct count per equality (else `EQ_ROWS`), and a `RANGE_SELECTIVITY` fraction per range
+- `SEARCH t USING INTEGER PRIMARY KEY (rowid=?)` reads a row
+- nested loops (joins, incl. cartesian products) multiply, and a `USE TEMP B-TREE` sort costs n·log2(n)
+
+Queries costing more than a client's `max_cost` are rejected. A client runs at most `max_expensive` queries
+costing at least `expensive_cost` at once (in this process); more wait up to `ADMISSION_QUEUE_SECONDS` for a
+slot, then are rejected. Rejected queries get a 429 response.
+"""
+from contextvars import ContextVar
+import functools
+import json
+import math
+import re
+import threading
+import time
+
+from fastapi import Response
+
+import settings.settings as settings
+
+if __package__ is None or __package__ == '':
+    import metrics_helper
+else:
+    from . import metrics_helper
+
+# Rows an index equality constraint is assumed to match without column stats (like SQLite's planner)
+EQ_ROWS = 10
+# Fraction of rows a range constraint is assumed to keep (like SQLite's planner without stats)
+RANGE_SELECTIVITY = 0.25
+
+_LOOP = re.compile(r'(SCAN|SEARCH) (\S+)(?: AS (\S+))?(.*)')
+# A table and its alias, e.g. `FROM test a` or `JOIN test AS b` (plans name a table by its alias)
+_ALIAS = re.compile(r'(?:\bFROM|\bJOIN|,)\s+"?(\w+)"?\s+(?:AS\s+)?"?(\w+)"?', re.IGNORECASE)
+_KEYWORDS = frozenset(['where', 'on', 'using', 'join', 'inner', 'left', 'right', 'full', 'outer', 'cross', 'natural',
+                       'group', 'order', 'limit', 'having', 'window', 'union', 'intersect', 'except', 'indexed', 'not', 'from'])
+
+_cond = threading.Condition()
+_running = {} # key = client, value = expensive queries running
+
+# Releases of the slots taken in a request (see `admitted`)
+_SLOTS: ContextVar = ContextVar('admission_slots', default=None)
+
+class AdmissionRejected(Exception):
+    """A query which exceeds its client's budget. `retry_after` is in seconds (None if retrying won't help)."""
+
+    def __init__(self, message, cost, retry_after=None) -> None:
+        super().__init__(message)
+        self.cost = cost
+        self.retry_after = retry_after
+
+def enabled() -> bool:
+    return settings.ADMISSION_CONTROL
+
+def client_key(request) -> str:
+    """The client a request counts against: the `ADMISSION_CLIENT_HEADER` header (e.g. an API key) if set, else its host."""
+    if settings.ADMISSION_CLIENT_HEADER:
+        key = request.headers.get(settings.ADMISSION_CLIENT_HEADER, None)
+        if key:
+            return key
+    return request.client.host if request.client is not None else 'unknown'
+
+def client_limits(client) -> dict:
+    """A client's `max_cost`, `expensive_cost` and `max_expensive`: the defaults, overridden by `ADMISSION_CLIENT_LIMITS`."""
+    return {
+        'max_cost': settings.ADMISSION_MAX_COST,
+        'expensive_cost': settings.ADMISSION_EXPENSIVE_COST,
+        'max_expensive': settings.ADMISSION_MAX_EXPENSIVE,
+        **settings.ADMISSION_CLIENT_LIMITS.get(client, {}),
+    }
+
+# ----- Cost estimation -----
+
+def _sort_cost(rows) -> float:
+    return rows * math.log2(max(rows, 2))
+
+def estimate_cost(con, sql_query, table_stats=None) -> float:
+    """
+    Estimates the rows a query will read (and sort) from its `EXPLAIN QUERY PLAN`, see the module docs.
+    `table_stats(table)` gets a table's column stats (or None). Raises if the query can't be planned.
+    A `LIMIT` isn't credited: how many rows are read to find its rows depends on how many match the filters.
+    """
+    cur = con.execute(f'EXPLAIN QUERY PLAN {sql_query}')
+    cur.row_factory = None
+    children = {}
+    for node_id, parent, _, detail in cur.fetchall():
+        children.setdefault(parent, []).append((node_id, detail))
+
+    aliases = {alias: table for table, alias in _ALIAS.findall(sql_query) if alias.lower() not in _KEYWORDS}
+    row_counts = {}
+    def table_rows(table):
+        if table not in row_counts:
+            stats = table_stats(table) if table_stats is not None else None
+            if stats is not None:
+                row_counts[table] = stats['row_count']
+            else:
+                try:
+                    rows_cur = con.execute(f'SELECT MAX(rowid) FROM "{table}"')
+                    rows_cur.row_factory = None
+                    row_counts[table] = rows_cur.fetchone()[0] or 0
+                except Exception:
+                    row_counts[table] = None # e.g. a subquery's or CTE's name
+        return row_counts[table]
+
+    def search_rows(table, rows, detail):
+        constraints = detail[detail.find('('):] if '(' in detail else ''
+        if 'rowid=' in constraints:
+            return 1
+        stats = table_stats(table) if table_stats is not None else None
+        columns = stats['columns'] if stats is not None else {}
+        for col, op in re.findall(r'(\w+)\s*([=<>])', constraints):
+            if op != '=':
+                rows *= RANGE_SELECTIVITY
+            elif col in columns:
+                rows /= max(1, columns[col]['distinct_count'])
+            else:
+                rows = min(rows, EQ_ROWS)
+        return max(1, rows)
+
+    # Rows produced by materialized subqueries and CTEs, by name
+    derived = {}
+    def cost_of(parent) -> tuple:
+        """The cost of a plan node's children, and the rows they produce."""
+        cost = 0.0
+        loop_rows = None # Rows through the nested loops so far
+        sub_rows = 0
+        for node_id, detail in children.get(parent, []):
+            loop = _LOOP.match(detail)
+            if loop is not None:
+                _, name, alias, rest = loop.groups()
+                rows = table_rows(name)
+                if rows is None and name in aliases:
+                    name = aliases[name]
+                    rows = table_rows(name)
+                if rows is None:
+                    rows = derived.get(name, derived.get(alias, 1))
+                if 'VIRTUAL TABLE' in rest:
+                    # A full-text or R*Tree index search
+                    rows *= RANGE_SELECTIVITY
+                elif loop.group(1) == 'SEARCH':
+                    if 'AUTOMATIC' in rest:
+                        # SQLite builds a transient index of the table for the query
+                        cost += _sort_cost(rows)
+                    rows = search_rows(name, rows, rest)
+                cost += (loop_rows or 1) * rows
+                loop_rows = (loop_rows or 1) * rows
+            elif detail.startswith('USE TEMP B-TREE'):
+                cost += _sort_cost(loop_rows or 1)
+            else:
+                node_cost, node_rows = cost_of(node_id)
+                if detail.startswith('CORRELATED'):
+                    # Runs once per outer row
+                    node_cost *= loop_rows or 1
+                match = re.match(r'(?:MATERIALIZE|CO-ROUTINE) (\S+)', detail)
+                if match:
+                    derived[match.group(1)] = node_rows
+                cost += node_cost
+                sub_rows += node_rows
+        return cost, loop_rows if loop_rows is not None else sub_rows
+
+    return cost_of(0)[0]
+
+# ----- Admission -----
+
+def admit(client, cost) -> None:
+    """
+    Admits a query of a client costing `cost`, waiting for a slot if it's expensive, or raises `AdmissionRejected`.
+    A slot taken is released when the endpoint (decorated with `admitted`) returns.
+    """
+    limits = client_limits(client)
+    if limits['max_cost'] >= 0 and cost > limits['max_cost']:
+        metrics_helper.ADMISSION_DECISIONS.inc('rejected_cost')
+        raise AdmissionRejected(
+            f"Query rejected: its estimated cost ({cost:.0f} rows read) exceeds the limit ({limits['max_cost']:.0f}). "
+            'Add filters on indexed columns, or avoid joins and sorts of large tables.', cost
+        )
+    slots = _SLOTS.get()
+    if cost < limits['expensive_cost'] or slots is None:
+        metrics_helper.ADMISSION_DECISIONS.inc('admitted')
+        return
+
+    deadline = time.monotonic() + settings.ADMISSION_QUEUE_SECONDS
+    queued = False
+    with _cond:
+        while _running.get(client, 0) >= limits['max_expensive']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                metrics_helper.ADMISSION_DECISIONS.inc('rejected_busy')
+                raise AdmissionRejected(
+                    f"Query rejected: {limits['max_expensive']} expensive queries of this client are running already.",
+                    cost, retry_after=max(1, math.ceil(settings.ADMISSION_QUEUE_SECONDS))
+                )
+            queued = True
+            _cond.wait(remaining)
+        _running[client] = _running.get(client, 0) + 1
+    metrics_helper.ADMISSION_DECISIONS.inc('queued' if queued else 'admitted')
+    slots.append(functools.partial(_release, client))
+
+def _release(client) -> None:
+    with _cond:
+        _running[client] -= 1
+        if not _running[client]:
+            del _running[client]
+        _cond.notify_all()
+
+def hand_off():
+    """
+    Takes the slots of the endpoint's queries off the endpoint, for a response which runs its query after the
+    endpoint returns (e.g. a streamed HTML table). Returns a function releasing them, to call when it's done.
+    """
+    slots = _SLOTS.get()
+    releases = list(slots or [])
+    if slots:
+        slots.clear()
+    def release():
+        while releases:
+            releases.pop()()
+    return release
+
+def running(client) -> int:
+    """The expensive queries of a client running now."""
+    with _cond:
+        return _running.get(client, 0)
+
+def admitted(func):
+    """Decorates an endpoint, so the slots its queries take are released when it returns, and rejections are 429 responses."""
+    @functools.wraps(func)
+    def endpoint(*args, **kwargs):
+        token = _SLOTS.set([])
+        try:
+            return func(*args, **kwargs)
+        except AdmissionRejected as ex:
+            headers = {'Retry-After': str(ex.retry_after)} if ex.retry_after is not None else {}
+            body = json.dumps({'detail': str(ex), 'estimated_cost': round(ex.cost)})
+            return Response(body, status_code=429, media_type='application/json', headers=headers)
+        finally:
+            for release in _SLOTS.get():
+                release()
+            _SLOTS.reset(token)
+    return endpoint
@@ -6,12 +6,16 @@ from typing import Optional
 
 import uvicorn
 
+import settings.settings as settings
+
 if __package__ is None or __package__ == '':
     # uses current directory visibility
-    from fastapi_wrapper import FastAPI_Wrapper, FastAPI_Wrapper_Singleton
+    from fastapi_wrapper import FastAPI_Wrapper, create_app, run_workers, snapshot_memory_db, advise_indexes
+    from workload_helper import BUILDS
 else:
     # uses current package visibility
-    from .fastapi_wrapper import FastAPI_Wrapper, FastAPI_Wrapper_Singleton
+    from .fastapi_wrapper import FastAPI_Wrapper, create_app, run_workers, snapshot_memory_db, advise_indexes
+    from .workload_helper import BUILDS
 
 typer_app = typer.Typer()
 
@@ -20,6 +24,9 @@ from enum import Enum
 class DataFormat(str, Enum):
     csv = "CSV"
     xlsx = "XLSX"
+class Engine(str, Enum):
+    pandas = "pandas"
+    csv = "csv"
 class IfExists(str, Enum):
     replace = "replace"
     append = "append"
@@ -40,10 +47,40 @@ def main(
 
     database: Optional[str] = typer.Option(":memory:", help="Sqlite DB name. Defaults to in-memory DB."),
     if_exists: Optional[IfExists] = typer.Option(IfExists.replace, help="Defines treatment of database if it exists"),
+    fts_columns: Optional[str] = typer.Option(
+        None,
+        help = "Comma separated text columns to build a full-text index for, or '*' for all text columns. " +
+               "Speeds up _like, _begin, _end and _search query params."
+    ),
+    prefix_columns: Optional[str] = typer.Option(
+        None,
+        help = "Comma separated text columns to build a case-insensitive prefix index for, or '*' for all text columns. " +
+               "Speeds up _begin query params and the /{database}/{table}/suggest endpoint."
+    ),
+    engine: Optional[Engine] = typer.Option(
+        None,
+        help = "Ingestion engine: 'pandas', or 'csv' to stream a CSV file into the database without pandas. " +
+               "Defaults to the INGEST_ENGINE setting."
+    ),
+    default_limit: Optional[int] = typer.Option(
+        None,
+        help = "Rows the API route's queries return, unless their 'limit' param is given. " +
+               "Defaults to the DEFAULT_ROW_LIMIT setting."
+    ),
+    max_limit: Optional[int] = typer.Option(
+        None,
+        help = "Max. rows the API route's queries return, whatever 'limit' param is given. " +
+               "Defaults to the MAX_ROW_LIMIT setting."
+    ),
 
     start_server: Optional[bool] = typer.Option(True, help="Start server."),
     host: Optional[str] = typer.Option("127.0.0.1", help="IP to run the API on"),
     port: Optional[int] = typer.Option(8000, help="Port to run the API on"),
+    workers: Optional[int] = typer.Option(
+        settings.API_WORKERS,
+        help = "Number of uvicorn worker processes. Each worker rebuilds the API routes from 'config_db', " +
+               "and gets its own copy of an in-memory 'database'. Defaults to the API_WORKERS setting."
+    ),
 ):
     """
     \U0001F3D7 Create APIs from CSV or XLSX data files within seconds, using fastapi.
@@ -62,6 +99,18 @@ def main(
         host = host.default
     if type(port) != int:
         port = port.default
+    if type(workers) != int:
+        workers = workers.default
+    if fts_columns is not None and type(fts_columns) != str:
+        fts_columns = fts_columns.default
+    if prefix_columns is not None and type(prefix_columns) != str:
+        prefix_columns = prefix_columns.default
+    if engine is not None and type(engine) != Engine:
+        engine = engine.default
+    if default_limit is not None and type(default_limit) != int:
+        default_limit = default_limit.default
+    if max_limit is not None and type(max_limit) != int:
+        max_limit = max_limit.default
 
     typer.echo("-" * 80)
     typer.echo('>>> Applicable argument values <<<')
@@ -71,25 +120,37 @@ def main(
         typer.echo(f'start_server: True')
         typer.echo(f'host: {host}')
         typer.echo(f'port: {port}')
+        typer.echo(f'workers: {workers}')
     else:
         typer.echo(f'data_path: {data_path}')
         typer.echo(f'data_format: {data_format}')
         typer.echo(f'database: {database}')
         typer.echo(f'config_db: {config_db}')
         typer.echo(f'if_exists: {if_exists}')
+        typer.echo(f'fts_columns: {fts_columns}')
+        typer.echo(f'prefix_columns: {prefix_columns}')
+        typer.echo(f'engine: {engine}')
+        typer.echo(f'default_limit: {default_limit}')
+        typer.echo(f'max_limit: {max_limit}')
         typer.echo(f'start_server: {start_server}')
         typer.echo(f'host: {host}')
         typer.echo(f'port: {port}')
+        typer.echo(f'workers: {workers}')
     typer.echo("-" * 80)
 
     if init_routes_with_config_db == True:
         typer.echo(f"\U0001F528 Creating > Routes from file: {config_db}")
-        app: FastAPI_Wrapper = FastAPI_Wrapper_Singleton(init_routes_with_config_db=False, config_db=config_db).instance
+        # With multiple workers, each worker process creates its own app
+        app = create_app(config_db) if workers == 1 else None
         # Force True
         start_server = True
     else:
         typer.echo(f"\U0001F528 Creating > Database: {database} | From file: {data_path} | Type: {data_format} | Update mode: {if_exists}")
-        app = FastAPI_Wrapper(config_db=config_db).create_database(database, data_path, data_format=data_format, if_exists=if_exists)
+        app = FastAPI_Wrapper(config_db=config_db).create_database(
+            database, data_path, data_format=data_format, if_exists=if_exists,
+            fts_columns=fts_columns, prefix_columns=prefix_columns, engine=engine.value if engine is not None else None,
+            default_limit=default_limit, max_limit=max_limit
+        )
 
     if start_server == True:
         typer.echo("\U0001F4E1 Starting API server (uvicorn)...")
@@ -98,7 +159,42 @@ def main(
             + typer.style(f"http://{host}:{port}/docs | http://{host}:{port}/redoc", bold=True)
         )
         typer.echo("-" * 80)
-        uvicorn.run(app, host=host, port=port)
+        if workers > 1:
+            # Workers restore the in-memory DB (if used) from its snapshot
+            snapshot_memory_db()
+            run_workers(config_db, host=host, port=port, workers=workers)
+        else:
+            uvicorn.run(app, host=host, port=port)
+
+# A separate app, as a second command would make `fastapi-wrapper` need a subcommand name
+advisor_app = typer.Typer()
+
+@advisor_app.command()
+def advise(
+    database: Optional[str] = typer.Option(None, help="Database name (e.g. 'macro') to recommend indexes for. Defaults to all."),
+    table: Optional[str] = typer.Option(None, help="Table to recommend indexes for. Defaults to all."),
+    build: Optional[bool] = typer.Option(False, help="Build the recommended indexes."),
+    limit: Optional[int] = typer.Option(10, help="Max. number of recommendations."),
+):
+    """
+    \U0001F4A1 Recommend indexes for the query workload recorded by the API (see WORKLOAD_DB in settings).
+
+    Indexes are ranked by the estimated SQL time they would have saved, and are only recommended if
+    SQLite's query planner would use them. The in-memory DB can't be advised from here, use /admin/index-advisor.
+    """
+    recommendations = advise_indexes(database=database, table=table, build=build, limit=limit)
+    if not recommendations:
+        typer.echo("No indexes to recommend")
+    for rec in recommendations:
+        typer.echo("-" * 80)
+        typer.echo(typer.style(rec['create_sql'], bold=True))
+        typer.echo(f"Database: {rec['database']} | Queries: {rec['queries']} | SQL time: {rec['total_ms']:.1f} ms | Est. saved: {rec['est_saved_ms']:.1f} ms")
+        typer.echo(f"Plan now: {' | '.join(rec['current_plan'])}")
+        typer.echo(f"Plan with index: {' | '.join(rec['new_plan'])}")
+        thread = rec.get('build', None)
+        if thread is not None:
+            thread.join()
+            typer.echo(f"\U0001F528 Index {rec['index_name']}: {BUILDS[rec['index_name']]}")
 
 if __name__ == "__main__":
     typer_app()
@@ -0,0 +1,234 @@
+"""
+Response compression, negotiated with the client's `Accept-Encoding` header.
+
+gzip is always available. Brotli (`br`) and Zstandard (`zstd`) are used if the `brotli` and
+`zstandard` packages are installed. Responses under `COMPRESSION_MIN_SIZE` bytes are sent as they
+are. Streamed responses (e.g. HTML tables) are compressed chunk by chunk, once their first chunks
+reach the threshold. The compressed bytes of whole (not streamed) responses can be cached
+(`COMPRESSION_CACHE_MB`), so a hot query's response is compressed once.
+"""
+from collections import OrderedDict
+import gzip
+import hashlib
+import threading
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+if __package__ is None or __package__ == '':
+    import metrics_helper
+else:
+    from . import metrics_helper
+
+COMPRESSIBLE_TYPES = ['text/', 'application/json', 'application/javascript', 'application/xml', '+json', '+xml']
+
+def available_encodings(preferred) -> list:
+    """The encodings of `preferred` (in order) which can be used."""
+    installed = {'gzip': True, 'br': brotli is not None, 'zstd': zstandard is not None}
+    return [enc for enc in preferred if installed.get(enc, False)]
+
+def negotiate(accept_encoding, encodings):
+    """
+    Picks the encoding for an `Accept-Encoding` header value: the one with the highest q-value,
+    ties going to the earlier of `encodings`. Returns None for no compression.
+    """
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            key, _, val = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(val)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+    def q_of(enc):
+        return accepted.get(enc, accepted.get('*', 0.0))
+    candidates = [enc for enc in encodings if q_of(enc) > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda enc: (q_of(enc), -encodings.index(enc)))
+
+def compress(data, encoding, level) -> bytes:
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise Exception(f'Unknown encoding: {encoding}')
+
+class StreamCompressor():
+    """Compresses a stream chunk by chunk, flushing each chunk so the client can decode it right away."""
+
+    def __init__(self, encoding, level) -> None:
+        self.encoding = encoding
+        if encoding == 'gzip':
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        elif encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        elif encoding == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            raise Exception(f'Unknown encoding: {encoding}')
+
+    def compress(self, data) -> bytes:
+        if self.encoding == 'gzip':
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == 'br':
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+class CompressedCache():
+    """An LRU cache of compressed response bodies, keyed by encoding and a hash of the uncompressed body."""
+
+    def __init__(self, max_bytes) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compress(self, body, encoding, level) -> bytes:
+        key = (encoding, level, hashlib.blake2b(body, digest_size=16).digest())
+        with self._lock:
+            compressed = self._entries.get(key, None)
+            if compressed is not None:
+                self._entries.move_to_end(key)
+        metrics_helper.cache_lookup('compression', hit=compressed is not None)
+        if compressed is not None:
+            return compressed
+
+        compressed = compress(body, encoding, level)
+        if len(compressed) <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = compressed
+                    self.size += len(compressed)
+                while self.size > self.max_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self.size -= len(evicted)
+        return compressed
+
+class CompressionMiddleware():
+    """ASGI middleware which compresses responses, see the module docs."""
+
+    def __init__(self, app, encodings=('zstd', 'br', 'gzip'), levels=None, minimum_size=1024, cache_mb=0) -> None:
+        self.app = app
+        self.encodings = available_encodings(encodings)
+        self.levels = {'gzip': 6, 'br': 4, 'zstd': 3, **(levels or {})}
+        self.minimum_size = minimum_size
+        self.cache = CompressedCache(int(cache_mb * 2**20)) if cache_mb > 0 else None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        # Responses the client doesn't get compressed still vary by `Accept-Encoding`, for shared caches
+        encoding = negotiate(Headers(scope=scope).get('accept-encoding', ''), self.encodings)
+        level = self.levels[encoding] if encoding is not None else None
+        responder = _CompressingResponder(send, encoding, level, self.minimum_size, self.cache)
+        await self.app(scope, receive, responder.send)
+
+class _CompressingResponder():
+    """
+    Holds back the response start message until it knows whether (and how) to compress the body. Every
+    response of a compressible type gets `Vary: Accept-Encoding`, compressed or not (`encoding` None).
+    """
+
+    def __init__(self, send, encoding, level, minimum_size, cache) -> None:
+        self._send = send
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.cache = cache
+        self.start_message = None
+        self.mode = None # None (undecided), 'identity' or 'stream'
+        self.buffer = []
+        self.buffered = 0
+        self.compressor = None
+
+    def _compressible(self) -> bool:
+        headers = Headers(raw=self.start_message['headers'])
+        if 'content-encoding' in headers or self.start_message['status'] in (204, 304):
+            return False
+        content_type = headers.get('content-type', '')
+        return any(media_type in content_type for media_type in COMPRESSIBLE_TYPES)
+
+    def _set_encoding_headers(self, content_length=None):
+        headers = MutableHeaders(raw=self.start_message['headers'])
+        headers['Content-Encoding'] = self.encoding
+        if content_length is None:
+            del headers['Content-Length']
+        else:
+            headers['Content-Length'] = str(content_length)
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.start_message = message
+            if self._compressible():
+                MutableHeaders(raw=message['headers']).add_vary_header('Accept-Encoding')
+            if self.encoding is None:
+                self.mode = 'identity'
+                await self._send(message)
+            return
+        if message['type'] != 'http.response.body' or self.mode == 'identity':
+            await self._send(message)
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if self.mode == 'stream':
+            chunk = self.compressor.compress(body) if body else b''
+            if not more_body:
+                chunk += self.compressor.finish()
+            await self._send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+            return
+
+        # Undecided: buffer (streamed) chunks until the body reaches the threshold, or ends
+        self.buffer.append(body)
+        self.buffered += len(body)
+        if more_body and self.buffered < self.minimum_size:
+            return
+        body = b''.join(self.buffer)
+        self.buffer = []
+
+        if self.buffered < self.minimum_size or not self._compressible():
+            self.mode = 'identity'
+            await self._send(self.start_message)
+            await self._send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
+        elif not more_body:
+            # A whole body
+            self.mode = 'identity'
+            if self.cache is not None:
+                compressed = self.cache.get_or_compress(body, self.encoding, self.level)
+            else:
+                compressed = compress(body, self.encoding, self.level)
+            self._set_encoding_headers(content_length=len(compressed))
+            await self._send(self.start_message)
+            await self._send({'type': 'http.response.body', 'body': compressed, 'more_body': False})
+        else:
+            self.mode = 'stream'
+            self.compressor = StreamCompressor(self.encoding, self.level)
+            self._set_encoding_headers()
+            await self._send(self.start_message)
+            await self._send({'type': 'http.response.body', 'body': self.compressor.compress(body), 'more_body': True})
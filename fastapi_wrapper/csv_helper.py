@@ -0,0 +1,282 @@
+"""
+A pandas-free ingestion engine for CSV files (`engine='csv'`), built on the stdlib `csv` module and sqlite3.
+
+The file is read twice, a chunk of rows at a time: the first pass infers each column's type incrementally
+(widening it as values require: bool or int, then float, then str), the second converts the values and
+bulk-inserts them into SQLite. Memory use doesn't grow with the file, as no DataFrame is built.
+
+Types are inferred like `pandas.read_csv` does, so both engines create the same query params: pandas'
+default NA strings (and empty strings) are NULL, int columns with NULLs are float, bool columns with
+NULLs (or other values) are str, and columns of only NULLs are float. A URL is downloaded to a temporary
+file first. Compressed files are not supported (use the pandas engine).
+"""
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import datetime
+from itertools import accumulate, islice
+import csv
+import math
+import os
+import shutil
+import tempfile
+import urllib.request
+
+if __package__ is None or __package__ == '':
+    from stats_helper import _py
+else:
+    from .stats_helper import _py
+
+# pandas' default NA strings
+NA_VALUES = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+TRUE_VALUES = frozenset(['True', 'TRUE', 'true'])
+BOOL_VALUES = TRUE_VALUES | frozenset(['False', 'FALSE', 'false'])
+INT64_MIN, INT64_MAX = -2**63, 2**63 - 1
+# Rows read, typed and inserted at a time. Values are handled a column of a chunk at a time,
+# with builtins like `set`, `map(int, ...)` and `map(float, ...)`, rather than one by one.
+CHUNK_ROWS = 10000
+
+SQL_TYPES = {bool: 'INTEGER', int: 'INTEGER', float: 'REAL', str: 'TEXT'}
+
+class CsvTable():
+    """
+    The result of ingesting a CSV file: its (normalized) `columns`, their Python types (`dtypes`, named
+    like a DataFrame's, so callers can treat both engines' results alike) and the number of rows.
+    """
+
+    def __init__(self, columns, dtypes, row_count) -> None:
+        self.columns = columns
+        self.dtypes = dtypes
+        self.row_count = row_count
+
+    def __len__(self) -> int:
+        return self.row_count
+
+def header_columns(header) -> list:
+    """Column names of a header row, with empty and duplicate names made unique like pandas does."""
+    columns = []
+    for idx, col in enumerate(header):
+        col = col or f'Unnamed: {idx}'
+        name, n = col, 0
+        while name in columns:
+            n += 1
+            name = f'{col}.{n}'
+        columns.append(name)
+    return columns
+
+def read_chunks(path, width, chunk_rows=CHUNK_ROWS):
+    """Yields the rows of a CSV file after its header in lists of up to `chunk_rows`, skipping blank lines and padding short rows."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                return
+            if not all(rows):
+                rows = [row for row in rows if row]
+            if set(map(len, rows)) != {width}:
+                longest = max(map(len, rows))
+                if longest > width:
+                    raise Exception(f'Expected {width} fields in a row of {path}, saw {longest}')
+                rows = [row if len(row) == width else row + [''] * (width - len(row)) for row in rows]
+            if rows:
+                yield rows
+
+def widen(kind, values):
+    """The kind ('bool', 'int', 'float' or 'str') of a column of `kind` (None if it's only had NAs) which also holds `values` (a set of non-NA strings)."""
+    if kind == 'str' or not values:
+        return kind
+    if '_' in ''.join(values):
+        # int() and float() accept digit separators, pandas doesn't
+        return 'str'
+    if values <= BOOL_VALUES:
+        return 'bool' if kind in (None, 'bool') else 'str'
+    if kind == 'bool' or not values.isdisjoint(BOOL_VALUES):
+        return 'str'
+    if kind in (None, 'int'):
+        try:
+            ints = list(map(int, values))
+            if INT64_MIN <= min(ints) and max(ints) <= INT64_MAX:
+                return 'int'
+        except ValueError:
+            pass
+    try:
+        floats = list(map(float, values))
+    except ValueError:
+        return 'str'
+    # float() also parses NaN strings which pandas doesn't take as NA (e.g. 'NAN')
+    return 'str' if any(map(math.isnan, floats)) else 'float'
+
+def infer_types(path) -> tuple:
+    """First pass: the header's column names, their Python types and the number of rows."""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        header = next(csv.reader(f), None)
+    if header is None:
+        raise Exception(f'No columns to parse from file: {path}')
+    columns = header_columns(header)
+
+    kinds = [None] * len(columns)
+    has_na = [False] * len(columns)
+    row_count = 0
+    for rows in read_chunks(path, len(columns)):
+        row_count += len(rows)
+        for idx, values in enumerate(zip(*rows)):
+            if kinds[idx] == 'str' and has_na[idx]:
+                continue
+            values = set(values)
+            if not values.isdisjoint(NA_VALUES):
+                has_na[idx] = True
+                values -= NA_VALUES
+            kinds[idx] = widen(kinds[idx], values)
+
+    types = []
+    for kind, na in zip(kinds, has_na):
+        if kind is None or (kind == 'int' and na):
+            types.append(float)
+        elif kind == 'bool' and na:
+            types.append(str)
+        else:
+            types.append({'bool': bool, 'int': int, 'float': float, 'str': str}[kind])
+    return columns, types, row_count
+
+def convert(values, type_):
+    """Converts a column (of a chunk) of strings to a type, with NA strings as None."""
+    if NA_VALUES.isdisjoint(values):
+        if type_ == str:
+            return values
+        if type_ == bool:
+            return [int(val in TRUE_VALUES) for val in values]
+        return list(map(type_, values))
+    if type_ == str:
+        return [None if val in NA_VALUES else val for val in values]
+    if type_ == bool:
+        return [None if val in NA_VALUES else int(val in TRUE_VALUES) for val in values]
+    return [None if val in NA_VALUES else type_(val) for val in values]
+
+def insert_rows(con, table, columns, types, chunks, if_exists='replace') -> None:
+    """
+    Second pass: creates the table (like `DataFrame.to_sql` does, with an indexed `id` column) unless
+    appending to it, and bulk-inserts the chunks of rows, converted to the columns' types, in one transaction.
+    Appended rows' ids follow on from the table's.
+    """
+    quoted = ', '.join(f'"{col}"' for col in columns)
+    column_defs = ', '.join(f'"{col}" {SQL_TYPES[type_]}' for col, type_ in zip(columns, types))
+    insert_sql = f'INSERT INTO "{table}" ("id", {quoted}) VALUES ({", ".join(["?"] * (len(columns) + 1))})'
+    with con:
+        exists = con.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+        if exists and if_exists == 'fail':
+            raise Exception(f'Table `{table}` already exists.')
+        if exists and if_exists == 'replace':
+            con.execute(f'DROP TABLE "{table}"')
+        next_id = 0
+        if exists and if_exists == 'append':
+            cur = con.execute(f'SELECT MAX(id) FROM "{table}"')
+            cur.row_factory = None
+            max_id = cur.fetchone()[0]
+            next_id = 0 if max_id is None else max_id + 1
+        else:
+            con.execute(f'CREATE TABLE "{table}" ("id" INTEGER, {column_defs})')
+            con.execute(f'CREATE INDEX "ix_{table}_id" ON "{table}" ("id")')
+        for rows in chunks:
+            values = [convert(col_values, type_) for col_values, type_ in zip(zip(*rows), types)]
+            con.executemany(insert_sql, zip(range(next_id, next_id + len(rows)), *values))
+            next_id += len(rows)
+
+def ingest_csv(con, table, data_path, normalize=None, if_exists='replace') -> CsvTable:
+    """Ingests a CSV file (path or URL) into a table, see the module docs. `normalize` maps the header's column names."""
+    path, downloaded = str(data_path), None
+    if path.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(path) as response, tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as f:
+            shutil.copyfileobj(response, f)
+            path = downloaded = f.name
+    try:
+        columns, types, row_count = infer_types(path)
+        if normalize is not None:
+            columns = [normalize(col) for col in columns]
+        insert_rows(con, table, columns, types, read_chunks(path, len(columns)), if_exists=if_exists)
+    finally:
+        if downloaded is not None:
+            os.remove(downloaded)
+    return CsvTable(columns, types, row_count)
+
+# ----- Column stats (for tables ingested without pandas) -----
+
+def sql_column_types(con, table) -> dict:
+    """The stats types ('int', 'float' or 'str') of a table's columns (but `id`), from their declared types."""
+    cur = con.execute(f'PRAGMA table_info("{table}")')
+    cur.row_factory = None
+    types = {}
+    for _, col, declared, *_ in cur.fetchall():
+        if col != 'id':
+            declared = (declared or '').upper()
+            types[col] = 'int' if 'INT' in declared else 'float' if declared in ('REAL', 'FLOAT', 'DOUBLE') else 'str'
+    return types
+
+def histogram(counter, values, bins) -> dict:
+    """
+    An equal-width histogram of a column's finite numeric values, binned like `numpy.histogram`:
+    `values` are the column's distinct values in order, `counter` holds their counts.
+    """
+    values = values[bisect_right(values, -math.inf):bisect_left(values, math.inf)]
+    if not values:
+        return {'edges': [], 'counts': []}
+    lo, hi = values[0], values[-1]
+    if lo == hi:
+        lo, hi = lo - 0.5, hi + 0.5
+    width = (hi - lo) / bins
+    edges = [lo + i * width for i in range(bins)] + [hi]
+    # Rows with values up to each distinct value, so a bin's count is the difference at its edges
+    cumulative = [0] + list(accumulate(map(counter.__getitem__, values)))
+    starts = [bisect_left(values, edge) for edge in edges[:-1]] + [len(values)]
+    counts = [cumulative[end] - cumulative[start] for start, end in zip(starts[:-1], starts[1:])]
+    return {'edges': [float(edge) for edge in edges], 'counts': counts}
+
+def column_stats(con, table, col, col_type, row_count, top_k=10, bins=20) -> dict:
+    """The stats of a column, counting its values with a `Counter` while scanning it in chunks of rows."""
+    counter = Counter()
+    cur = con.execute(f'SELECT "{col}" FROM "{table}"')
+    cur.row_factory = None
+    while True:
+        rows = cur.fetchmany(CHUNK_ROWS)
+        if not rows:
+            break
+        counter.update(next(zip(*rows)))
+    null_count = counter.pop(None, 0)
+
+    try:
+        values = sorted(counter)
+    except TypeError:
+        # Values of other types than the column's (SQLite doesn't enforce types)
+        values = sorted(val for val in counter if isinstance(val, str if col_type == 'str' else (int, float)))
+    col_stats = {
+        'type': col_type,
+        'count': row_count - null_count,
+        'null_count': null_count,
+        'distinct_count': len(counter),
+        'min': _py(values[0]) if values else None,
+        'max': _py(values[-1]) if values else None,
+        'top_values': [{'value': _py(val), 'count': count} for val, count in counter.most_common(top_k)],
+    }
+    if col_type != 'str':
+        col_stats['histogram'] = histogram(counter, values, bins)
+    return col_stats
+
+def table_stats(con, table, top_k=10, bins=20) -> dict:
+    """
+    Computes the same column stats as `stats_helper.table_stats`, from the table in the DB, scanning
+    a column at a time (so only one column's distinct values are held in memory at once).
+    """
+    cur = con.execute(f'SELECT COUNT(*) FROM "{table}"')
+    cur.row_factory = None
+    row_count = cur.fetchone()[0]
+    return {
+        'row_count': row_count,
+        'computed_at': datetime.now().isoformat(timespec='seconds'),
+        'columns': {
+            col: column_stats(con, table, col, col_type, row_count, top_k=top_k, bins=bins)
+            for col, col_type in sql_column_types(con, table).items()
+        },
+    }
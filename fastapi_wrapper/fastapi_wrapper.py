@@ -1,23 +1,29 @@
 """
 Contains the main `FastAPI_Wrapper` class, which wraps `FastAPI`.
 """
-from typing import Union, Dict, Type
+from typing import Union, Dict, Type, List, Any, Optional
 from pathlib import Path
 import inspect
 import logging
 import re
-import pandas as pd
 import sqlite3
-import numpy as np
 import pydantic
 import json
 import os
 import inspect
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+import functools
+from urllib.parse import urlsplit, parse_qsl, urlencode
 from datetime import datetime
 
 import fastapi
-from fastapi import FastAPI, Response, Request
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, Response, Request, Body, Query
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 import utils.fastapi_patch
@@ -25,9 +31,35 @@ import utils.fastapi_patch
 import settings.settings as settings
 
 if __package__ is None or __package__ == '':
-    from html_helper import dicts_to_html
+    from html_helper import stream_html_table, pagination_html
+    from sql_helper import compile_aggregation, compile_join, compile_spatial_filter, compile_string_filter, distance_km, prefix_range, sql_string
+    from index_helper import resolve_index_columns, build_fts_index, rebuild_fts_index, build_prefix_indexes, detect_coordinate_columns, build_spatial_index, index_info
+    import openapi_helper
+    import metrics_helper
+    import slow_query_helper
+    import workload_helper
+    from json_helper import FastJSONResponse
+    import json_helper
+    import stats_helper
+    import csv_helper
+    import snapshot_helper
+    import admission_helper
+    from compression_helper import CompressionMiddleware
 else:
-    from .html_helper import dicts_to_html
+    from .html_helper import stream_html_table, pagination_html
+    from .sql_helper import compile_aggregation, compile_join, compile_spatial_filter, compile_string_filter, distance_km, prefix_range, sql_string
+    from .index_helper import resolve_index_columns, build_fts_index, rebuild_fts_index, build_prefix_indexes, detect_coordinate_columns, build_spatial_index, index_info
+    from . import openapi_helper
+    from . import metrics_helper
+    from . import slow_query_helper
+    from . import workload_helper
+    from .json_helper import FastJSONResponse
+    from . import json_helper
+    from . import stats_helper
+    from . import csv_helper
+    from . import snapshot_helper
+    from . import admission_helper
+    from .compression_helper import CompressionMiddleware
 
 # Configure logging...
 # logging.basicConfig(level=logging.DEBUG)
@@ -53,12 +85,53 @@ def create_query_param(name: str, type_: Type, default) -> pydantic.fields.Model
 
 
 def dtype_to_type(dtype) -> Type:
-    """Convert numpy/pandas dtype to normal Python type."""
+    """Convert numpy/pandas dtype to normal Python type (Python types, e.g. of the csv engine's columns, are kept)."""
+    if isinstance(dtype, type):
+        return dtype
     if dtype == object:
         return str
     else:
+        import numpy as np
         return type(np.zeros(1, dtype).item())
 
+def normalize_column_name(col) -> str:
+    return col.lower().replace(' ', '_').replace('.', '_').replace(':', '_').replace('unnamed', 'x')
+
+INGEST_ENGINES = ['pandas', 'csv']
+
+ROUTE_LIMIT_COLUMNS = ['default_limit', 'max_limit']
+
+def save_routes_config(config_db, routes_config):
+    """
+    Appends a route's config to the routes config DB (its table is laid out like `DataFrame.to_sql` made it).
+    The row limit columns are added to routes config DBs made before routes had them.
+    """
+    con = connection_for_db(config_db)
+    with con:
+        con.execute(
+            'CREATE TABLE IF NOT EXISTS routes_config ("id" INTEGER, "route_path" TEXT, "route_name" TEXT, "route_tags" TEXT, "query_params" TEXT, '
+            '"default_limit" INTEGER, "max_limit" INTEGER)'
+        )
+        con.execute('CREATE INDEX IF NOT EXISTS "ix_routes_config_id" ON routes_config ("id")')
+        columns = [row['name'] for row in con.execute('PRAGMA table_info(routes_config)').fetchall()]
+        for col in ROUTE_LIMIT_COLUMNS:
+            if col not in columns:
+                con.execute(f'ALTER TABLE routes_config ADD COLUMN "{col}" INTEGER')
+        con.execute(
+            'INSERT INTO routes_config (id, route_path, route_name, route_tags, query_params, default_limit, max_limit) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (0, routes_config['route_path'], routes_config['route_name'], routes_config['route_tags'], routes_config['query_params'],
+             routes_config.get('default_limit', None), routes_config.get('max_limit', None))
+        )
+
+ROUTE_LIMITS: Dict = {} # key = route path, value = {'default_limit': ..., 'max_limit': ...} (None = the settings' limit)
+
+def row_limits(route_path) -> tuple:
+    """Gets the default and max. row limits of a generated route's queries: its own, else `DEFAULT_ROW_LIMIT` and `MAX_ROW_LIMIT`."""
+    limits = ROUTE_LIMITS.get(route_path, {})
+    max_limit = limits.get('max_limit', None) or settings.MAX_ROW_LIMIT
+    default_limit = limits.get('default_limit', None) or settings.DEFAULT_ROW_LIMIT
+    return min(default_limit, max_limit), max_limit
+
 def as_int_or_float(val):
     """Infers Python int vs. float from string representation."""
     if type(val) == str:
@@ -77,28 +150,320 @@ def resolve_db(database) -> tuple:
 
     return db, Path(db).stem.replace(':', '')
 
+# Make database return dicts instead of tuples.
+# From: https://stackoverflow.com/questions/3300464/how-can-i-get-dict-from-sqlite-query
+def dict_factory(cursor, row):
+    d = {}
+    for idx, col in enumerate(cursor.description):
+        d[col[0]] = row[idx]
+    return d
+
+# The in-memory DB is a named, shared-cache DB, so any number of connections in this process
+# see the same data. It lives as long as its primary connection (in DB_CONNECTIONS) is open.
+MEMORY_DB_URI = 'file:fastapi_wrapper_memory?mode=memory&cache=shared'
+
+DB_PROFILES: Dict = {} # key = db, value = performance profile
+TEMP_STORE_VALUES = ['DEFAULT', 'FILE', 'MEMORY']
+
+def profile_for_db(db) -> dict:
+    """Gets the performance profile for a DB, from the routes config or else from settings."""
+    profile = DB_PROFILES.get(db, None)
+    if profile is None:
+        db_name = Path(db).stem.replace(':', '')
+        profile = {**settings.SQLITE_PROFILE, **settings.SQLITE_DB_PROFILES.get(db_name, {})}
+    return profile
+
+def set_profile_for_db(db, profile):
+    """Sets the performance profile for a DB. It is applied to connections opened from now on."""
+    DB_PROFILES[db] = {**settings.SQLITE_PROFILE, **profile}
+
+def apply_profile(con, profile, read_only=False):
+    """Applies a performance profile's PRAGMAs to a connection."""
+    for pragma in ['mmap_size', 'cache_size']:
+        if profile.get(pragma, None) is not None:
+            con.execute(f'PRAGMA {pragma}={int(profile[pragma])}')
+
+    temp_store = profile.get('temp_store', None)
+    if temp_store is not None:
+        temp_store = str(temp_store).upper()
+        if temp_store not in TEMP_STORE_VALUES:
+            raise Exception(f'Invalid temp_store ({temp_store}) in SQLite profile. Must be one of {TEMP_STORE_VALUES}')
+        con.execute(f'PRAGMA temp_store={temp_store}')
+
+    if read_only and profile.get('query_only', False):
+        con.execute('PRAGMA query_only=1')
+
+DB_PROFILES_TABLE = 'db_profiles'
+
+def save_db_profile(config_db, db_name, profile):
+    """Stores a DB's performance profile in the routes config DB."""
+    con = connection_for_db(config_db)
+    with con:
+        con.execute(f'CREATE TABLE IF NOT EXISTS {DB_PROFILES_TABLE} (database TEXT PRIMARY KEY, profile TEXT)')
+        con.execute(f'INSERT OR REPLACE INTO {DB_PROFILES_TABLE} (database, profile) VALUES (?, ?)', (db_name, json.dumps(profile)))
+
+def load_db_profiles(config_db):
+    """Sets the performance profiles of all DBs stored in the routes config DB."""
+    con = connection_for_db(config_db)
+    con.execute(f'CREATE TABLE IF NOT EXISTS {DB_PROFILES_TABLE} (database TEXT PRIMARY KEY, profile TEXT)')
+    for row in con.execute(f'SELECT database, profile FROM {DB_PROFILES_TABLE}').fetchall():
+        db = ':memory:' if row['database'] == 'memory' else resolve_db(row['database'])[0]
+        set_profile_for_db(db, json.loads(row['profile']))
+
+TABLE_STATS: Dict = {} # key = (db, table), value = column stats
+TABLE_STATS_TABLE = 'table_stats'
+
+def save_table_stats(config_db, db_name, table, stats):
+    """Stores a table's column stats in the routes config DB."""
+    con = connection_for_db(config_db)
+    with con:
+        con.execute(f'CREATE TABLE IF NOT EXISTS {TABLE_STATS_TABLE} (database TEXT, table_name TEXT, stats TEXT, PRIMARY KEY (database, table_name))')
+        con.execute(f'INSERT OR REPLACE INTO {TABLE_STATS_TABLE} (database, table_name, stats) VALUES (?, ?, ?)', (db_name, table, json.dumps(stats)))
+
+def load_table_stats(config_db):
+    """Loads the column stats of all tables stored in the routes config DB."""
+    con = connection_for_db(config_db)
+    con.execute(f'CREATE TABLE IF NOT EXISTS {TABLE_STATS_TABLE} (database TEXT, table_name TEXT, stats TEXT, PRIMARY KEY (database, table_name))')
+    for row in con.execute(f'SELECT database, table_name, stats FROM {TABLE_STATS_TABLE}').fetchall():
+        db = ':memory:' if row['database'] == 'memory' else resolve_db(row['database'])[0]
+        TABLE_STATS[(db, row['table_name'])] = json.loads(row['stats'])
+
+def open_connection(db, read_only=False, snapshot=None) -> sqlite3.Connection:
+    """
+    Opens a new connection to a DB (`:memory:` opens the shared in-memory DB), with the DB's
+    performance profile applied. Pass `read_only=True` for connections which only query, and the
+    path of one of the DB's `snapshot` files to read that (see `snapshot_helper`).
+    """
+    if db == ':memory:':
+        con = sqlite3.connect(MEMORY_DB_URI, uri=True, check_same_thread=False, timeout=settings.SQLITE_BUSY_TIMEOUT)
+        # Don't let readers take shared-cache table locks, which would make the writer (or themselves) fail at once, as
+        # shared-cache locks don't wait for the busy timeout. The tradeoff: reads during a load are dirty (see README)
+        con.execute('PRAGMA read_uncommitted=1')
+    elif snapshot is not None:
+        # Snapshots never change, so SQLite can skip locking and change detection. Read-only, so opening
+        # a snapshot which was deleted in the meantime fails rather than creating an empty DB
+        con = sqlite3.connect(f'{Path(snapshot).absolute().as_uri()}?mode=ro&immutable=1', uri=True, check_same_thread=False)
+    else:
+        con = sqlite3.connect(db, check_same_thread=False, timeout=settings.SQLITE_BUSY_TIMEOUT)
+        # WAL lets readers (e.g. in other uvicorn worker processes) run concurrently with a writer
+        con.execute('PRAGMA journal_mode=WAL')
+    apply_profile(con, profile_for_db(db), read_only=read_only)
+    # Used by the `near` filter of tables with coordinates
+    con.create_function('distance_km', 4, distance_km, deterministic=True)
+    con.row_factory = dict_factory
+    return con
+
 DB_CONNECTIONS: Dict = {} # key = db, value = connection
 def connection_for_db(db) -> sqlite3.Connection:
     """Gets connection for a DB. Uses cached connection if there is one."""
 
-    # Make database return dicts instead of tuples.
-    # From: https://stackoverflow.com/questions/3300464/how-can-i-get-dict-from-sqlite-query
-    def dict_factory(cursor, row):
-        d = {}
-        for idx, col in enumerate(cursor.description):
-            d[col[0]] = row[idx]
-        return d
-
     # If appending then we expect there to be an existing connection, or it's the first time
     global DB_CONNECTIONS
     con = DB_CONNECTIONS.get(db, None)
     if con is None:
-        con = sqlite3.connect(db, check_same_thread=False)
-        con.row_factory = dict_factory
+        con = open_connection(db)
         DB_CONNECTIONS[db] = con
 
     return con
 
+class ConnectionPool():
+    """
+    A pool of read connections for a DB (or one of its snapshots), so concurrent queries don't share one connection.
+
+    Writes (ingestion, dropping tables) go through the DB's primary connection (see `connection_for_db`).
+    """
+
+    def __init__(self, db, size=settings.SQLITE_POOL_SIZE, snapshot=None) -> None:
+        self.db = db
+        self.snapshot = snapshot
+        self.size = size
+        self.created = 0
+        self.in_use = 0
+        self.leases = 0 # requests pinned to the pool's snapshot
+        self.waits = 0
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            self.in_use += 1
+            can_create = self._idle.empty() and self.created < self.size
+            if can_create:
+                self.created += 1
+            elif self._idle.empty():
+                self.waits += 1
+        metrics_helper.cache_lookup('connection_pool', hit=not can_create)
+        if can_create:
+            try:
+                return open_connection(self.db, read_only=True, snapshot=self.snapshot)
+            except Exception:
+                with self._lock:
+                    self.created -= 1
+                    self.in_use -= 1
+                raise
+        try:
+            return self._idle.get(timeout=settings.SQLITE_BUSY_TIMEOUT)
+        except queue.Empty:
+            with self._lock:
+                self.in_use -= 1
+            raise Exception(f'Timed out waiting for a connection to database `{Path(self.db).name}`.')
+
+    def release(self, con) -> None:
+        with self._lock:
+            self.in_use -= 1
+        self._idle.put(con)
+        if self.in_use == 0 and self.superseded():
+            reclaim_snapshots(self.db)
+
+    def superseded(self) -> bool:
+        """Whether the pool's snapshot is no longer the DB's current one."""
+        if self.snapshot is None:
+            return False
+        pointer = snapshot_helper.current(self.db)
+        return pointer is None or pointer['path'] != self.snapshot
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+DB_POOLS: Dict = {} # key = db, value = ConnectionPool
+_DB_POOLS_LOCK = threading.Lock()
+
+# Pools of the DBs read in a request, so all its queries read the same snapshots (see `pinned_snapshots`)
+_PINNED_POOLS: ContextVar = ContextVar('pinned_pools', default=None)
+
+def pool_for_db(db) -> ConnectionPool:
+    """
+    Gets the read connection pool for a DB, creating it on first use. If the DB has snapshots (see
+    `snapshot_helper`), that's the pool of its current snapshot, or of the one pinned by the request.
+    """
+    pins = _PINNED_POOLS.get()
+    if pins is not None and db in pins:
+        return pins[db]
+    pointer = snapshot_helper.current(db) if settings.SNAPSHOTS and db != ':memory:' else None
+    snapshot = pointer['path'] if pointer is not None else None
+    created = False
+    with _DB_POOLS_LOCK:
+        pool = DB_POOLS.get(snapshot or db, None)
+        if pool is None:
+            # Make sure the primary connection exists, which keeps an in-memory DB alive
+            connection_for_db(db)
+            pool = DB_POOLS[snapshot or db] = ConnectionPool(db, snapshot=snapshot)
+            created = True
+        if pins is not None:
+            pool.leases += 1
+            pins[db] = pool
+    if created and snapshot is not None:
+        # A new snapshot was published (maybe by another worker process), so close the idle pools of the old ones
+        reclaim_snapshots(db)
+    return pool
+
+def pinned_snapshots(func):
+    """Decorates an endpoint, so that all its queries of a DB read the snapshot its first query did."""
+    @functools.wraps(func)
+    def pinned(*args, **kwargs):
+        token = _PINNED_POOLS.set({})
+        try:
+            return func(*args, **kwargs)
+        finally:
+            pools = _PINNED_POOLS.get().values()
+            _PINNED_POOLS.reset(token)
+            with _DB_POOLS_LOCK:
+                for pool in pools:
+                    pool.leases -= 1
+            for pool in pools:
+                if pool.superseded():
+                    reclaim_snapshots(pool.db)
+    return pinned
+
+def reclaim_snapshots(db):
+    """
+    Closes the pools of a DB's superseded snapshots which are idle (no queries or pinned requests), and
+    deletes the files of snapshots older than the last `SNAPSHOT_KEEP` versions, unless they're still read here.
+    """
+    pointer = snapshot_helper.current(db)
+    current = pointer['path'] if pointer is not None else None
+    busy = set()
+    with _DB_POOLS_LOCK:
+        for key, pool in list(DB_POOLS.items()):
+            if pool.db != db or pool.snapshot is None or pool.snapshot == current:
+                continue
+            if pool.in_use or pool.leases:
+                busy.add(pool.snapshot)
+            else:
+                DB_POOLS.pop(key)
+                pool.close()
+    for path in snapshot_helper.stale_snapshots(db, keep=settings.SNAPSHOT_KEEP):
+        if path not in busy:
+            try:
+                os.remove(path)
+            except OSError:
+                pass # e.g. still open in a process of a platform which can't delete open files
+
+def publish_snapshot(db) -> dict:
+    """Publishes the current data of a file DB as its new read snapshot (see `snapshot_helper`)."""
+    pointer = snapshot_helper.publish(connection_for_db(db), db)
+    reclaim_snapshots(db)
+    return pointer
+
+def collect_pool_metrics():
+    """Sets the connection pool metrics, when they're scraped."""
+    with _DB_POOLS_LOCK:
+        pools = list(DB_POOLS.values())
+    for metric in [metrics_helper.POOL_SIZE, metrics_helper.POOL_CONNECTIONS, metrics_helper.POOL_IN_USE]:
+        metric.clear()
+    # A DB with snapshots may have a pool per snapshot for a while
+    totals = {}
+    for pool in pools:
+        db_name = Path(pool.db).stem if pool.db != ':memory:' else 'memory'
+        total = totals.setdefault(db_name, [0, 0, 0, 0])
+        for idx, value in enumerate([pool.size, pool.created, pool.in_use, pool.waits]):
+            total[idx] += value
+    for db_name, (size, created, in_use, waits) in totals.items():
+        metrics_helper.POOL_SIZE.set(db_name, value=size)
+        metrics_helper.POOL_CONNECTIONS.set(db_name, value=created)
+        metrics_helper.POOL_IN_USE.set(db_name, value=in_use)
+        metrics_helper.POOL_WAITS.set_total(db_name, value=waits)
+
+metrics_helper.REGISTRY.collectors.append(collect_pool_metrics)
+
+@contextmanager
+def pooled_connection(db):
+    """Borrows a read connection for a DB from its connection pool."""
+    pool = pool_for_db(db)
+    con = pool.acquire()
+    try:
+        yield con
+    finally:
+        pool.release(con)
+
+def snapshot_memory_db(path=settings.MEMORY_DB_SNAPSHOT):
+    """Saves the in-memory DB to disk with the SQLite backup API (if the in-memory DB is in use)."""
+    con = DB_CONNECTIONS.get(':memory:', None)
+    if con is None or not path:
+        return
+    logging.info(f">>> Saving in-memory database snapshot to `{path}` <<<")
+    # Write to a temp file, then swap it in, so readers never see a partial snapshot
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    snapshot_con = sqlite3.connect(tmp_path)
+    try:
+        con.backup(snapshot_con)
+    finally:
+        snapshot_con.close()
+    os.replace(tmp_path, path)
+
+def restore_memory_db(path=settings.MEMORY_DB_SNAPSHOT) -> bool:
+    """Loads a saved snapshot into the in-memory DB with the SQLite backup API."""
+    if not path or not os.path.exists(path):
+        return False
+    logging.info(f">>> Restoring in-memory database from snapshot `{path}` <<<")
+    snapshot_con = sqlite3.connect(path)
+    try:
+        snapshot_con.backup(connection_for_db(':memory:'))
+    finally:
+        snapshot_con.close()
+    return True
+
 def delete_table(db, table_name):
     """
     Deletes the database table with all data read from the CSV. 
@@ -112,6 +477,8 @@ def delete_table(db, table_name):
         db_name = Path(db).name
         logging.info(f">>> Deleting stale table `{table_name}` from database `{db_name}` <<<")
         con.execute(f"DROP TABLE IF EXISTS {table_name}")
+        con.execute(f"DROP TABLE IF EXISTS {table_name}_fts")
+        con.execute(f"DROP TABLE IF EXISTS {table_name}_rtree")
 
 def close_database(db):
     """Shuts down the database with all its data."""
@@ -124,14 +491,38 @@ def close_database(db):
         # See https://stackoverflow.com/questions/48732439/deleting-a-database-file-in-memory
         con.close()
         DB_CONNECTIONS.pop(db, None)
+    with _DB_POOLS_LOCK:
+        pools = [DB_POOLS.pop(key) for key, pool in list(DB_POOLS.items()) if pool.db == db]
+    for pool in pools:
+        pool.close()
 
-def query_database(db, sql_query):
-    """Executes a SQL query on the database and returns rows as list of dicts."""
+def query_database(db, sql_query, timings=None, origin=None):
+    """
+    Executes a SQL query on the database and returns rows as list of dicts.
+
+    If a `timings` dict is given, the durations (ms) of executing the query (`query`), fetching
+    its rows (`fetch`) and converting them to dicts (`rows`) are put in it. Slow queries are
+    logged (see `slow_query_helper`), with `origin` (e.g. the route and params they came from).
+    """
     logging.info(f"Querying database: {sql_query}")
-    con = connection_for_db(db)
     try:
-        cur = con.execute(sql_query)
-        dicts = cur.fetchall()
+        with pooled_connection(db) as con, slow_query_helper.watch(con, db, sql_query, origin) as stats:
+            if timings is None:
+                cur = con.execute(sql_query)
+                dicts = cur.fetchall()
+            else:
+                start = time.perf_counter()
+                cur = con.execute(sql_query)
+                executed = time.perf_counter()
+                # Fetch plain tuples, so the dict conversion can be timed on its own
+                cur.row_factory = None
+                rows = cur.fetchall()
+                fetched = time.perf_counter()
+                dicts = [dict_factory(cur, row) for row in rows]
+                timings['query'] = elapsed_ms(start, executed)
+                timings['fetch'] = elapsed_ms(executed, fetched)
+                timings['rows'] = elapsed_ms(fetched)
+            stats['rows'] = len(dicts)
         return dicts
     except Exception as ex:
         db_name = Path(db).name
@@ -140,6 +531,251 @@ def query_database(db, sql_query):
             f'Ensure the DB table exists.\n{str(ex)}'
         )
 
+def elapsed_ms(start, end=None) -> float:
+    """Milliseconds from a `time.perf_counter()` start time to an end time (default now)."""
+    return round(((end or time.perf_counter()) - start) * 1000, 3)
+
+def table_columns(db, table) -> list:
+    """Gets the (lowercase) column names of a DB table."""
+    return [row['name'].lower() for row in query_database(db, f'PRAGMA table_info({table})')]
+
+def advise_indexes(database=None, table=None, build=False, limit=10) -> list:
+    """
+    Recommends indexes for the recorded workload (see `workload_helper`), optionally of a database
+    (name, e.g. `macro` or `memory`) and table, best first. With `build`, the recommended indexes are
+    built in background threads (see `workload_helper.BUILDS` for their status).
+    """
+    workload_helper.flush()
+    db = None
+    if database is not None:
+        db = ':memory:' if database == 'memory' else resolve_db(database)[0]
+
+    shapes_by_table = {}
+    for shape in workload_helper.load_shapes(database=db, table=table):
+        shapes_by_table.setdefault((shape['database'], shape['table']), []).append(shape)
+
+    recommendations = []
+    for (shape_db, shape_table), shapes in shapes_by_table.items():
+        if shape_db != ':memory:' and not os.path.exists(shape_db):
+            continue
+        with pooled_connection(shape_db) as con:
+            for rec in workload_helper.recommend(con, shape_table, shapes, stats=TABLE_STATS.get((shape_db, shape_table), None)):
+                rec['database'] = 'memory' if shape_db == ':memory:' else Path(shape_db).stem
+                rec['db'] = shape_db
+                recommendations.append(rec)
+
+    recommendations = sorted(recommendations, key=lambda rec: rec['est_saved_ms'], reverse=True)[:limit]
+    for rec in recommendations:
+        db = rec.pop('db')
+        rec['status'] = workload_helper.BUILDS.get(rec['index_name'], 'recommended')
+        if build and rec['status'] == 'recommended':
+            on_built = functools.partial(publish_snapshot, db) if settings.SNAPSHOTS and db != ':memory:' else None
+            rec['build'] = workload_helper.build_index(functools.partial(open_connection, db), rec, on_built=on_built)
+    return recommendations
+
+def database_for_request(request) -> str:
+    """Gets the database of a generated route from the request's path (`/{database}/{table}...`)."""
+    path = request.url.path.split('/')
+    if path[1] == 'memory':
+        return ':memory:'
+    database, _ = resolve_db(path[1])
+    return database
+
+def suggest(table: str, request: Request, col: str, prefix: str = '', limit: int = 10):
+    """
+    Autocompletes values of a text column: returns the first distinct values (case-insensitive, in order)
+    starting with `prefix`, with their row counts. Fast if the column has a prefix index.
+    """
+    database = database_for_request(request)
+    table = table.lower()
+    col = col.lower()
+
+    columns = table_columns(database, table)
+    if col not in columns:
+        raise Exception(f'Unknown column `{col}` in `col` parameter. Columns are: {columns}')
+    limit = min(max(limit, 1), settings.SUGGEST_MAX_LIMIT)
+
+    where = f"WHERE {col} IS NOT NULL"
+    if prefix:
+        where += " AND " + (prefix_range(col, prefix) or f"{col} LIKE {sql_string(prefix + '%')}")
+    sql_query = (
+        f"SELECT {col} AS value, COUNT(*) AS count FROM {table} {where} "
+        f"GROUP BY {col} COLLATE NOCASE ORDER BY {col} COLLATE NOCASE LIMIT {limit}"
+    )
+    dicts = query_database(database, sql_query)
+
+    return {
+        'metadata': {
+            'database': database,
+            'table': table,
+            'sql_query': sql_query,
+            'results_count': len(dicts),
+        },
+        'data': dicts
+    }
+
+def table_stats(table: str, request: Request, cols: str = None):
+    """
+    Gets a table's column stats (computed at ingest): type, null and distinct counts, min, max, top values
+    and, for numeric columns, a histogram. Optionally only of `cols` (comma separated). Doesn't query the table.
+    """
+    database = database_for_request(request)
+    table = table.lower()
+
+    stats = TABLE_STATS.get((database, table), None)
+    if stats is None:
+        raise Exception(f'No stats for table `{table}`. They are computed when data is ingested (see `COLUMN_STATS` in settings).')
+    columns = stats['columns']
+    if cols:
+        names = [col.strip().lower() for col in cols.split(',') if col.strip()]
+        unknown = [col for col in names if col not in columns]
+        if unknown:
+            raise Exception(f'Unknown column(s) {unknown} in `cols` parameter. Columns are: {list(columns)}')
+        columns = {col: columns[col] for col in names}
+
+    return {
+        'metadata': {
+            'database': database,
+            'table': table,
+            'row_count': stats['row_count'],
+            'computed_at': stats['computed_at'],
+        },
+        'columns': columns
+    }
+
+class FederatedTable(pydantic.BaseModel):
+    """A table of a federated query, and (except the first) how it joins the tables before it."""
+    database: str
+    table: str
+    alias: Optional[str] = None
+    on: Dict[str, str] = {}
+    how: str = 'inner'
+
+class FederatedQuery(pydantic.BaseModel):
+    """A join of tables of one or more databases, see `sql_helper.compile_join`."""
+    tables: List[FederatedTable]
+    filters: Dict[str, Any] = {}
+    cols: List[str] = []
+    order_by: List[str] = []
+    limit: Optional[int] = None
+
+def federated_query(query: FederatedQuery, origin=None) -> dict:
+    """
+    Runs a join of tables of one or more databases inside SQLite: the other databases are attached to a
+    pooled connection of the first table's database, for the query only. Returns results like a generated route.
+    """
+    if not 1 <= len(query.tables) <= settings.FEDERATED_MAX_TABLES:
+        raise Exception(f'A federated query joins 1 to {settings.FEDERATED_MAX_TABLES} tables')
+
+    primary = None
+    schemas = {} # key = db, value = schema name on the connection
+    tables = []
+    columns = {}
+    for idx, table in enumerate(query.tables):
+        db = ':memory:' if table.database.lower() == 'memory' else resolve_db(table.database)[0]
+        if db != ':memory:' and not os.path.exists(db):
+            raise Exception(f'Unknown database `{table.database}`')
+        if primary is None:
+            primary = db
+            schemas[db] = 'main'
+        elif db == ':memory:' and primary != ':memory:':
+            raise Exception('The in-memory database can only be the first table of a federated query')
+        schema = schemas.setdefault(db, f'db{len(schemas)}')
+
+        if not re.fullmatch(r'\w+', table.table):
+            raise Exception(f'Invalid table name `{table.table}`')
+        alias = (table.alias or f't{idx}').lower()
+        columns[alias] = table_columns(db, table.table.lower())
+        if not columns[alias]:
+            raise Exception(f'Unknown table `{table.table}` in database `{table.database}`')
+        tables.append({'schema': schema, 'table': table.table.lower(), 'alias': alias, 'on': table.on, 'how': table.how})
+
+    limit = min(query.limit or settings.FEDERATED_MAX_ROWS, settings.FEDERATED_MAX_ROWS)
+    sql_query = compile_join(tables, columns, filters=query.filters, cols=query.cols, order_by=query.order_by, limit=limit)
+    attached = [(db, schema) for db, schema in schemas.items() if schema != 'main']
+
+    logging.info(f"Querying databases: {sql_query}")
+    with pooled_connection(primary) as con:
+        try:
+            for db, schema in attached:
+                # The DB's snapshot, if it has snapshots
+                con.execute(f'ATTACH DATABASE {sql_string(pool_for_db(db).snapshot or db)} AS {schema}')
+            with slow_query_helper.watch(con, primary, sql_query, origin) as stats:
+                dicts = con.execute(sql_query).fetchall()
+                stats['rows'] = len(dicts)
+        finally:
+            for _, schema in attached:
+                try:
+                    con.execute(f'DETACH DATABASE {schema}')
+                except sqlite3.OperationalError:
+                    pass # Wasn't attached
+
+    return {
+        'metadata': {
+            'databases': {schema: Path(db).stem if db != ':memory:' else 'memory' for db, schema in schemas.items()},
+            'sql_query': sql_query,
+            'results_count': len(dicts),
+        },
+        'data': dicts
+    }
+
+COUNT_MODES = ['exact', 'estimate']
+
+def estimate_full_count(db, table, where, filters=None) -> dict:
+    """
+    Estimates how many rows of a table match a WHERE clause (for `count=estimate`). If `filters`, the
+    equality and range filters the WHERE clause was built from, are given and the table has column stats,
+    the estimate comes from the stats (see `stats_helper.estimate_count`) without querying the table.
+    Otherwise the WHERE clause is evaluated on a sample of `COUNT_SAMPLE_ROWS` rows.
+
+    Returns the estimated `count`, its bounds (`low`, `high`), the `method` ('stats', 'sample', or 'exact'
+    if the table is no bigger than the sample) and the `confidence` that the count is within the bounds.
+    """
+    stats = TABLE_STATS.get((db, table), None)
+    if filters is not None:
+        estimate = stats_helper.estimate_count(stats, filters)
+        if estimate is not None:
+            return {**estimate, 'method': 'stats', 'confidence': 1.0}
+    with pooled_connection(db) as con:
+        estimate = stats_helper.sample_count(
+            con, table, where, settings.COUNT_SAMPLE_ROWS, rows=stats['row_count'] if stats is not None else None
+        )
+    exact = estimate.pop('exact')
+    return {**estimate, 'method': 'exact' if exact else 'sample', 'confidence': 1.0 if exact else 0.95}
+
+def stream_query_html(db, sql_query, header_html='', footer_html='', origin=None, on_close=None):
+    """
+    Executes a SQL query and returns a generator which renders its rows as an HTML table,
+    straight from the DB cursor. The query runs right away, so DB errors are raised here
+    rather than half way through a streamed response (and only this part is checked by the
+    slow query log). `on_close` is called once the stream is done, or the query failed.
+    """
+    logging.info(f"Querying database: {sql_query}")
+    pool = pool_for_db(db)
+    con = pool.acquire()
+    try:
+        with slow_query_helper.watch(con, db, sql_query, origin):
+            cur = con.execute(sql_query)
+    except Exception as ex:
+        pool.release(con)
+        if on_close is not None:
+            on_close()
+        db_name = Path(db).name
+        raise Exception(
+            f'Database `{db_name}` exception.' +
+            f'Ensure the DB table exists.\n{str(ex)}'
+        )
+
+    def stream():
+        try:
+            yield from stream_html_table(cur, header_html=header_html, footer_html=footer_html)
+        finally:
+            pool.release(con)
+            if on_close is not None:
+                on_close()
+
+    return stream()
+
 class GenericEndpoint():
 
     get_endpoint = None
@@ -155,47 +791,95 @@ class GenericEndpoint():
         # TABLE IS A PATH PARAM & DATABASE PATH IS EXTRACTED FROM REQUEST OBJ
         # The routes are created for generic /database/{table} paths
         def generic_get(table: str, request: Request, **query_kwargs):
-            path = request.url.path.split('/')
-            if path[1] == 'memory':
-                database = ':memory:'
-            else:
-                database, _  = resolve_db(path[1])
+            start = time.perf_counter()
+            database = database_for_request(request)
             table = table.lower()
 
             to_html = False
+            # Phase timings, in the metadata (`timing` param) and Server-Timing header (also in debug mode)
+            timing = query_kwargs.pop('timing', None)
+            timing = timing is not None and timing.strip().lower() not in ['0', 'false', 'no']
+            timings = {} if timing or settings.DEBUG else None
+            # `full_count` mode: an exact COUNT(*) or an estimate (from column stats, else a sample)
+            count_mode = (query_kwargs.pop('count', None) or 'exact').strip().lower()
+            if count_mode not in COUNT_MODES:
+                raise Exception(f'Invalid `count` parameter ({count_mode}). Must be one of {COUNT_MODES}')
+            # HTML table pagination
+            page = query_kwargs.pop('page', None)
+            page_size = query_kwargs.pop('page_size', None)
+            # JSON results' rows (capped by the route's max. row limit), and the rows to skip
+            limit = query_kwargs.pop('limit', None)
+            offset = query_kwargs.pop('offset', None)
+            # Aggregation
+            group_by = query_kwargs.pop('group_by', None)
+            agg = query_kwargs.pop('agg', None)
+            having = query_kwargs.pop('having', None)
+            # Spatial filters
+            bbox = query_kwargs.pop('bbox', None)
+            near = query_kwargs.pop('near', None)
             forbidden_sql = ["insert", "delete", "update", "create", "replace", "drop", "rename", "alter"]
             where_clauses = []
             sql_cols = []
             sql_cmds = []
+            ad_hoc_where = False
+            # Filter shape, for the index advisor: columns filtered by equality and by range
+            eq_cols = []
+            range_cols = []
+            # Filters whose count can be estimated from column stats, as (op, column, value)
+            count_filters = []
+
+            # String and spatial filters use the table's full-text, prefix and spatial indexes, if it has any
+            indexes = None
+            def table_indexes():
+                nonlocal indexes
+                if indexes is None:
+                    with pooled_connection(database) as con:
+                        indexes = index_info(con, table)
+                return indexes
+
+            def string_filter(col, kind, val):
+                return compile_string_filter(table, col, kind, val, table_indexes())
 
             for name, val in query_kwargs.items():
                 name = name.lower()
                 if val is not None:
 
                     # clean parens and quoted terms, except for SQL expressions
-                    if name not in ['cols', 'cmd', 'where']:
+                    if name not in ['cols', 'cmd', 'where'] and isinstance(val, str):
                         val = val.replace('(', '').replace(')', '').replace('"', '').strip()
 
                     if name.endswith("_gt"):
                         where_clauses.append(f"{name[:-3]}>{as_int_or_float(val)}")
+                        range_cols.append(name[:-3])
+                        count_filters.append(('gt', name[:-3], as_int_or_float(val)))
                     elif name.endswith("_gte"):
                         where_clauses.append(f"{name[:-4]}>={as_int_or_float(val)}")
+                        range_cols.append(name[:-4])
+                        count_filters.append(('gte', name[:-4], as_int_or_float(val)))
                     elif name.endswith("_lt"):
                         where_clauses.append(f"{name[:-3]}<{as_int_or_float(val)}")
+                        range_cols.append(name[:-3])
+                        count_filters.append(('lt', name[:-3], as_int_or_float(val)))
                     elif name.endswith("_lte"):
                         where_clauses.append(f"{name[:-4]}<={as_int_or_float(val)}")
+                        range_cols.append(name[:-4])
+                        count_filters.append(('lte', name[:-4], as_int_or_float(val)))
                     elif name.endswith("_in"):
                         vals = re.split(',+',val)
+                        count_filters.append(('in', name[:-3], [v.strip() for v in vals]))
                         vals = [f'"{v.strip()}"' for v in vals]
                         vals = ','.join(vals)
                         where_clauses.append(f"{name[:-3]} IN ({vals})")
+                        eq_cols.append(name[:-3])
                     elif name.endswith("_like"):
-                        where_clauses.append(f'{name[:-5]} LIKE "%{val}%"')
+                        where_clauses.append(string_filter(name[:-5], 'like', val))
                         # where_clauses.append(f"instr({name[:-5]}, '{val}') > 0")
                     elif name.endswith("_begin"):
-                        where_clauses.append(f'{name[:-6]} LIKE "{val}%"')
+                        where_clauses.append(string_filter(name[:-6], 'begin', val))
                     elif name.endswith("_end"):
-                        where_clauses.append(f'{name[:-4]} LIKE "%{val}"')
+                        where_clauses.append(string_filter(name[:-4], 'end', val))
+                    elif name.endswith("_search"):
+                        where_clauses.append(string_filter(name[:-7], 'search', val))
                     elif name == "tohtml":
                         to_html = True
                     elif name == "cols":
@@ -213,23 +897,149 @@ class GenericEndpoint():
                             raise Exception(f"SQL query contains a forbidden command!\n{val}\nForbidden commands: {forbidden_sql}")
                         else:
                             where_clauses.append(f"({val})")
+                            ad_hoc_where = True
                     else:
+                        count_filters.append(('eq', name, val))
                         if isinstance(val, str):
                             val = f"'{val}'"
                         where_clauses.append(f"{name}={val}")
+                        eq_cols.append(name)
+
+            # Only equality and range filters can be estimated from column stats (they add a clause each)
+            stats_estimable = len(where_clauses) == len(count_filters) and not (bbox or near)
 
+            distance = None
+            if bbox or near:
+                coordinates = table_indexes()['spatial'] or detect_coordinate_columns(table_columns(database, table))
+                if coordinates is None:
+                    raise Exception("The `bbox` and `near` parameters need a table with latitude/longitude columns")
+                spatial = compile_spatial_filter(table, coordinates, table_indexes(), bbox=bbox, near=near)
+                where_clauses.extend(spatial['where'])
+                distance = spatial['distance']
+
+            where_clauses = [clause for clause in where_clauses if clause]
             where = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
             cols = ", ".join(sql_cols) if sql_cols else None
             cmd = " ".join(sql_cmds) if sql_cmds else ""
 
-            sql_query_count = f"SELECT COUNT(*) FROM {table} {where}".strip()
-            count_dicts = query_database(database, sql_query_count)
-            count = count_dicts[0]['COUNT(*)']
-
             sql_select = f"SELECT {cols}" if cols else "SELECT *"
             sql_from = f"FROM {table} {where} {cmd}"
+
+            # `near` results get their distance, nearest first (unless `cmd` orders them)
+            if distance and not (group_by or agg):
+                sql_select = f"{sql_select}, {distance} AS distance_km"
+                if 'order by' not in cmd.lower():
+                    cmd = f"ORDER BY distance_km {cmd}".strip()
+                sql_from = f"FROM {table} {where} {cmd}"
+
+            if group_by or agg:
+                if cols:
+                    raise Exception("The `cols` parameter can't be combined with `group_by` or `agg` parameters")
+                aggregation = compile_aggregation(table_columns(database, table), group_by=group_by, agg=agg, having=having)
+                sql_select = f"SELECT {aggregation['select']}"
+                sql_from = " ".join(part for part in [f"FROM {table}", where, aggregation['group_by'], aggregation['having'], cmd] if part)
+            elif having:
+                raise Exception("The `having` parameter needs an `agg` parameter")
+
             sql_query = f"{sql_select} {sql_from}".strip()
-            dicts = query_database(database, sql_query)
+
+            # Metric labels, also for the slow query log
+            route = metrics_helper.route_template(request.scope)
+            origin = {'route': route, 'params': dict(request.query_params)}
+
+            # JSON results: the row limit is enforced in the SQL, fetching a row more to tell if the results are truncated
+            default_limit, max_limit = row_limits(route)
+            limit = min(max(int(limit or default_limit), 1), max_limit)
+            offset = max(int(offset or 0), 0)
+            if re.search(r'\blimit\b', cmd, re.IGNORECASE):
+                # `cmd` limits the query already, so the row limit applies to its results
+                sql_limited = f"SELECT * FROM ({sql_query}) LIMIT {limit + 1} OFFSET {offset}"
+            else:
+                sql_limited = f"{sql_query} LIMIT {limit + 1} OFFSET {offset}"
+
+            # The queries a request runs: HTML tables count what the whole query returns (`cmd` may limit it), to know
+            # the number of pages, then read a page of it. JSON results count the rows matching the filters exactly
+            # (`count=estimate` reads the column stats or a bounded sample instead), then read the limited query
+            if to_html:
+                sql_count = f"SELECT COUNT(*) AS count FROM ({sql_query})"
+                sql_queries = [sql_count, sql_query]
+            else:
+                sql_count = f"SELECT COUNT(*) FROM {table} {where}".strip()
+                sql_queries = [sql_count, sql_limited] if count_mode == 'exact' else [sql_limited]
+
+            # Ad-hoc SQL (`where`, `cols` or `cmd`) is costed, and admitted within its client's budget, before it runs
+            estimated_cost = None
+            if admission_helper.enabled() and (ad_hoc_where or sql_cols or sql_cmds):
+                try:
+                    with pooled_connection(database) as con:
+                        estimated_cost = sum(
+                            admission_helper.estimate_cost(con, sql, lambda name: TABLE_STATS.get((database, name), None)) for sql in sql_queries
+                        )
+                except Exception:
+                    pass # Not a valid query: running it raises the usual error
+                if estimated_cost is not None:
+                    admission_helper.admit(admission_helper.client_key(request), estimated_cost)
+
+            sql_start = time.perf_counter()
+            if timings is not None:
+                timings['compile'] = elapsed_ms(start, sql_start)
+
+            if to_html:
+                # Count what the whole query returns (`cmd` may limit it), to know the number of pages
+                count_dicts = query_database(database, sql_count, origin=origin)
+                count = count_dicts[0]['count']
+                count_end = time.perf_counter()
+
+                page_size = min(max(int(page_size or settings.HTML_PAGE_SIZE), 1), settings.HTML_MAX_ROWS)
+                page_count = max(1, -(-count // page_size))
+                page = min(max(int(page or 1), 1), page_count)
+                offset = (page - 1) * page_size
+                sql_page = f"SELECT * FROM ({sql_query}) LIMIT {page_size} OFFSET {offset}"
+
+                pagination = pagination_html(
+                    page, page_count, min(offset + 1, count), min(offset + page_size, count), count,
+                    lambda page: str(request.url.include_query_params(page=page, page_size=page_size))
+                )
+                # The page is read while streaming, after the endpoint returns, so the stream holds its admission slot
+                html_content = stream_query_html(
+                    database, sql_page, header_html=pagination, footer_html=pagination, origin=origin, on_close=admission_helper.hand_off()
+                )
+                metrics_helper.SQL_SECONDS.observe(route, table, value=time.perf_counter() - sql_start)
+                metrics_helper.ROWS_RETURNED.inc(route, table, amount=max(0, min(page_size, count - offset)))
+                html_content = metrics_helper.timed(metrics_helper.HTML_SECONDS, route, table, chunks=html_content)
+
+                headers = {}
+                if timings is not None:
+                    # The page renders while streaming, after the headers are sent, so its time goes in an HTML comment
+                    timings['count'] = elapsed_ms(sql_start, count_end)
+                    timings['query'] = elapsed_ms(count_end)
+                    headers['Server-Timing'] = metrics_helper.server_timing(timings)
+                    if timing:
+                        html_content = metrics_helper.timing_comment(html_content)
+                return StreamingResponse(html_content, status_code=200, media_type='text/html', headers=headers)
+
+            count_estimate = None
+            if count_mode == 'estimate':
+                count_estimate = estimate_full_count(database, table, where, filters=count_filters if stats_estimable else None)
+                count = count_estimate.pop('count')
+            else:
+                count_dicts = query_database(database, sql_count, origin=origin)
+                count = count_dicts[0]['COUNT(*)']
+            if timings is not None:
+                timings['count'] = elapsed_ms(sql_start)
+
+            sql_query = sql_limited
+            dicts = query_database(database, sql_query, timings=timings, origin=origin)
+            truncated = len(dicts) > limit
+            del dicts[limit:]
+            sql_seconds = time.perf_counter() - sql_start
+            metrics_helper.SQL_SECONDS.observe(route, table, value=sql_seconds)
+            # `cols` only counts towards the shape if it just names columns (an index can cover those)
+            select_cols = [col.strip().lower() for col in cols.split(',')] if cols else None
+            if select_cols and not all(re.fullmatch(r'\w+', col) for col in select_cols):
+                select_cols = None
+            workload_helper.record(database, table, eq_cols, range_cols, select_cols, sql_seconds * 1000)
+            metrics_helper.ROWS_RETURNED.inc(route, table, amount=len(dicts))
 
             results = {
                 'metadata': {
@@ -238,23 +1048,58 @@ class GenericEndpoint():
                     'sql_query': sql_query,
                     'full_count': count,
                     'results_count': len(dicts),
+                    'limit': limit,
+                    'offset': offset,
+                    'truncated': truncated,
+                    # The URL of the next results, if truncated
+                    'next': str(request.url.include_query_params(limit=limit, offset=offset + limit)) if truncated else None,
                 },
                 'data': dicts
             }
-
-            if to_html:
-                html_content = dicts_to_html(dicts)
-                results = HTMLResponse(content=html_content, status_code=200)
-
-            return results
+            if count_estimate is not None:
+                results['metadata']['full_count_estimate'] = count_estimate
+            if estimated_cost is not None:
+                results['metadata']['estimated_cost'] = round(estimated_cost)
+            if timing:
+                # Serialization can't time itself, so it's only in the Server-Timing header
+                results['metadata']['timing'] = dict(timings)
+
+            # Serialize here (bypassing FastAPI's `jsonable_encoder`, which rows of SQLite scalars don't need), and time it
+            serialization_start = time.perf_counter()
+            response = FastJSONResponse(results)
+            metrics_helper.SERIALIZATION_SECONDS.observe(route, table, value=time.perf_counter() - serialization_start)
+
+            if timings is not None:
+                timings['serialize'] = elapsed_ms(serialization_start)
+                timings['total'] = elapsed_ms(start)
+                response.headers['Server-Timing'] = metrics_helper.server_timing(timings)
+
+            return response
 
         ### end def generic_get() ###
 
-        setattr(self.__class__, f'{prefix}_generic_get', generic_get)
+        # The count and data queries of a request read the same snapshot of the DB, and release its admission slots when done
+        setattr(self.__class__, f'{prefix}_generic_get', admission_helper.admitted(pinned_snapshots(generic_get)))
 
         self.get_endpoint = getattr(self.__class__, f'{prefix}_generic_get')
 
 
+class BatchQuery(pydantic.BaseModel):
+    """A query of a generated route in a batch: its path (which may have a query string) and params, like a GET."""
+    path: str
+    params: Dict[str, Any] = {}
+    id: Optional[str] = None
+
+_BATCH_EXECUTOR = []
+_BATCH_EXECUTOR_LOCK = threading.Lock()
+
+def batch_executor() -> ThreadPoolExecutor:
+    """The thread pool running the queries of batches, shared so `BATCH_CONCURRENCY` bounds all of them."""
+    with _BATCH_EXECUTOR_LOCK:
+        if not _BATCH_EXECUTOR:
+            _BATCH_EXECUTOR.append(ThreadPoolExecutor(max_workers=settings.BATCH_CONCURRENCY, thread_name_prefix='batch'))
+    return _BATCH_EXECUTOR[0]
+
 class FastAPI_Wrapper(FastAPI):
 
     get_endpoint = None
@@ -282,20 +1127,60 @@ class FastAPI_Wrapper(FastAPI):
             allow_headers=["*"],
         )
 
+        if settings.COMPRESSION_ENABLED:
+            self.add_middleware(
+                CompressionMiddleware,
+                encodings=settings.COMPRESSION_ENCODINGS,
+                levels=settings.COMPRESSION_LEVELS,
+                minimum_size=settings.COMPRESSION_MIN_SIZE,
+                cache_mb=settings.COMPRESSION_CACHE_MB,
+            )
+
+        # Added last, so it's outermost and times compression too
+        if settings.METRICS_ENABLED:
+            self.add_middleware(metrics_helper.MetricsMiddleware)
+
+        # Per-route OpenAPI fragments are built lazily on the first schema request, and cached
+        # in the routes config database keyed by route version, so restarts don't rebuild them.
+        # key = route name, value = route version (hash of the route's config)
+        self.route_versions = {}
+        # key = route name, value = (route version, fragment)
+        self.openapi_fragments = {}
+
         def custom_openapi():
-            from fastapi.openapi.utils import get_openapi
             from .__init__ import __version__ as version
 
             print('Running custom_openapi...')
             
             if self.openapi_schema:
                 return self.openapi_schema
-            openapi_schema = get_openapi(
-                title="FastAPI Wrapper for CSV & Excel Files",
-                version=version,
-                description="Custom API enpoints available for each converted file is listed below.",
-                routes=self.routes,
-            )
+
+            title = "FastAPI Wrapper for CSV & Excel Files"
+            description = "Custom API enpoints available for each converted file is listed below."
+
+            # Fixed routes are few, so are always built
+            fixed_routes = [route for route in self.routes if getattr(route, 'name', None) not in self.route_versions]
+            openapi_schema = openapi_helper.build_schema(fixed_routes, title, version, description)
+
+            config_con = None
+            if self.config_db is not None:
+                config_db, _ = resolve_db(self.config_db)
+                config_con = connection_for_db(config_db)
+                missing = [name for name in self.route_versions if name not in self.openapi_fragments]
+                if missing:
+                    self.openapi_fragments.update(openapi_helper.load_fragments(config_con))
+
+            for route_name, route_version in self.route_versions.items():
+                cached_version, fragment = self.openapi_fragments.get(route_name, (None, None))
+                metrics_helper.cache_lookup('openapi_fragment', hit=cached_version == route_version)
+                if cached_version != route_version:
+                    route = self._find_route(route_name)
+                    fragment = openapi_helper.fragment_of(openapi_helper.build_schema([route], title, version, description))
+                    self.openapi_fragments[route_name] = (route_version, fragment)
+                    if config_con is not None:
+                        openapi_helper.save_fragment(config_con, route_name, route_version, fragment)
+                openapi_helper.merge_fragment(openapi_schema, fragment)
+
             openapi_schema["info"]["x-logo"] = {
                 "url": "https://www.oxfordeconomics.com/static/img/logo.png"
             }
@@ -313,6 +1198,8 @@ class FastAPI_Wrapper(FastAPI):
 
             def suicide():
                 time.sleep(1)
+                # Being killed skips the shutdown event, so save the in-memory DB here
+                snapshot_memory_db()
                 # parent = psutil.Process(psutil.Process(os.getpid()).ppid())
                 # parent.kill()
                 myself = psutil.Process(os.getpid())
@@ -326,9 +1213,10 @@ class FastAPI_Wrapper(FastAPI):
             print(f'>>> Successfully killed API <<<')
             return {"success": True}  
 
-        def signal_handler(e):
+        def signal_handler():
             print(f'>>> API Signal Received <<<')
-            print(e)
+            snapshot_memory_db()
+            workload_helper.flush()
 
         self.on_event('shutdown')(signal_handler)
 
@@ -345,6 +1233,10 @@ class FastAPI_Wrapper(FastAPI):
         ):
             db, _ = resolve_db(database)
             if os.path.exists(db):
+                # Fold any WAL content into the DB file, so the download is complete
+                con = DB_CONNECTIONS.get(db, None)
+                if con is not None:
+                    con.execute('PRAGMA wal_checkpoint(TRUNCATE)')
                 suffix = str(datetime.now())[:-10].replace(' ', '_').replace(':','_')
                 db_suffix = db.replace('.db', f'_{suffix}.db')
                 return FileResponse(db, media_type='application/octet-stream', filename=db_suffix)
@@ -354,7 +1246,7 @@ class FastAPI_Wrapper(FastAPI):
         route_name = 'download'
         self.get(route_path, name=route_name, tags=[route_name])(download)
 
-        # /createdb?database=db&data_path=dp&data_format=<CSV | XLSX>&if_exists=<fail | replace | append>
+        # /createdb?database=db&data_path=dp&data_format=<CSV | XLSX>&if_exists=<fail | replace | append>&engine=<pandas | csv>&default_limit=n&max_limit=n
         #
         # Add createdb method as GET endpoint to fastapi
         # NOTE: Not very useful for physical DBs except when run locally!
@@ -375,8 +1267,24 @@ class FastAPI_Wrapper(FastAPI):
             if if_exists not in ['fail', 'replace', 'append']:
                 return Response(f"if_exists parameter must be one of ['fail', 'replace', 'append']", status_code=418) # I'm a teapot!
 
+            fts_columns = query_kwargs.get('fts_columns', None)
+            prefix_columns = query_kwargs.get('prefix_columns', None)
+
+            engine = query_kwargs.get('engine', None) or settings.INGEST_ENGINE
+            if engine not in INGEST_ENGINES:
+                return Response(f"engine parameter must be one of {INGEST_ENGINES}", status_code=418) # I'm a teapot!
+
+            default_limit = query_kwargs.get('default_limit', None)
+            max_limit = query_kwargs.get('max_limit', None)
+            if any(val is not None and val < 1 for val in [default_limit, max_limit]):
+                return Response(f"default_limit and max_limit parameters must be positive", status_code=418) # I'm a teapot!
+
             try:
-                self.create_database(database, data_path, data_format=data_format, if_exists=if_exists)
+                self.create_database(
+                    database, data_path, data_format=data_format, if_exists=if_exists,
+                    fts_columns=fts_columns, prefix_columns=prefix_columns, engine=engine,
+                    default_limit=default_limit, max_limit=max_limit
+                )
             except Exception as ex:
                 return Response(f'Failed: {str(ex.msg)}', status_code=418)
 
@@ -389,6 +1297,75 @@ class FastAPI_Wrapper(FastAPI):
 
             return Response(json.dumps({'status:': 'success', 'endpoint': route_name, 'params': query_params}), status_code=200)
 
+        # /metrics
+        #
+        # Prometheus metrics of this process
+        if settings.METRICS_ENABLED:
+            def metrics():
+                return Response(metrics_helper.REGISTRY.render(), media_type=metrics_helper.CONTENT_TYPE)
+
+            route_path = '/metrics'
+            route_name = 'metrics'
+            self.get(route_path, name=route_name, tags=[route_name])(metrics)
+
+        # /admin/slow-queries?limit=50
+        #
+        # Latest queries of the slow query log, newest first
+        def slow_queries(limit: int = Query(50, ge=1, le=1000)):
+            entries = slow_query_helper.recent(limit=limit)
+            return {
+                'metadata': {'log': settings.SLOW_QUERY_LOG, 'threshold_ms': settings.SLOW_QUERY_MS, 'results_count': len(entries)},
+                'data': entries
+            }
+
+        route_path = '/admin/slow-queries'
+        route_name = 'slow_queries'
+        self.get(route_path, name=route_name, tags=['admin'])(slow_queries)
+
+        # /admin/index-advisor?database=macro&table=custommacromodel_l_a&build=false&limit=10
+        #
+        # Recommends indexes for the recorded query workload, and optionally builds them in the background
+        def index_advisor(database: str = None, table: str = None, build: bool = False, limit: int = 10):
+            recommendations = advise_indexes(database=database, table=table, build=build, limit=limit)
+            for rec in recommendations:
+                rec.pop('build', None)
+            return {'metadata': {'workload_db': settings.WORKLOAD_DB, 'results_count': len(recommendations)}, 'data': recommendations}
+
+        route_path = '/admin/index-advisor'
+        route_name = 'index_advisor'
+        self.get(route_path, name=route_name, tags=['admin'])(index_advisor)
+
+        # POST /batch
+        #
+        # Runs many generated route queries concurrently, e.g. {"queries": [{"path": "/macro/table", "params": {"year": 2020}}]}
+        def batch(request: Request, queries: List[BatchQuery] = Body(..., embed=True)):
+            if len(queries) > settings.BATCH_MAX_QUERIES:
+                return Response(f'A batch can have at most {settings.BATCH_MAX_QUERIES} queries', status_code=418)
+            results = list(batch_executor().map(functools.partial(self._batch_query, request=request), queries))
+            errors = sum(1 for status, _ in results if status != 200)
+            # The results are JSON already, so splice them in rather than parse and serialize them again
+            body = (
+                b'{"metadata":' + json_helper.dumps({'results_count': len(results), 'errors_count': errors}) +
+                b',"results":[' + b','.join(result for _, result in results) + b']}'
+            )
+            return Response(body, media_type='application/json')
+
+        route_path = '/batch'
+        route_name = 'batch'
+        self.post(route_path, name=route_name, tags=[route_name])(batch)
+
+        # POST /federated
+        #
+        # Joins tables of one or more databases inside SQLite, e.g.
+        # {"tables": [{"database": "macro", "table": "a", "alias": "a"}, {"database": "geo", "table": "b", "alias": "b", "on": {"a.location": "b.location"}}]}
+        def federated(query: FederatedQuery):
+            origin = {'route': '/federated', 'params': query.dict()}
+            return FastJSONResponse(federated_query(query, origin=origin))
+
+        route_path = '/federated'
+        route_name = 'federated'
+        self.post(route_path, name=route_name, tags=[route_name])(federated)
+
         route_path = '/createdb'
         route_name = 'createdb'
         self.get(route_path, name=route_name, tags=[route_name])(createdb)
@@ -397,7 +1374,11 @@ class FastAPI_Wrapper(FastAPI):
         self._add_query_param(route_path, 'data_path', str)
         self._add_query_param(route_path, 'data_format', str)
         self._add_query_param(route_path, 'if_exists', str)
-
+        self._add_query_param(route_path, 'fts_columns', str)
+        self._add_query_param(route_path, 'prefix_columns', str)
+        self._add_query_param(route_path, 'engine', str)
+        self._add_query_param(route_path, 'default_limit', int)
+        self._add_query_param(route_path, 'max_limit', int)
 
         config_db, _ = resolve_db(self.config_db)
         # Explicit routes initialization case
@@ -415,6 +1396,9 @@ class FastAPI_Wrapper(FastAPI):
 
 
     def initialize_routes_with_config_db(self, config_db):
+        load_db_profiles(config_db)
+        load_table_stats(config_db)
+
         routes = query_database(config_db, 'SELECT route_path FROM routes_config')
         for route in routes:
             route_path = route['route_path']
@@ -425,7 +1409,13 @@ class FastAPI_Wrapper(FastAPI):
             route_tags_json = query_database(config_db, f'SELECT route_tags FROM routes_config WHERE route_path="{route_path}"')
             route_tags = json.loads(route_tags_json[0]['route_tags'])
 
+            # Routes config DBs made before routes had row limits don't have their columns
+            limits_res = query_database(config_db, f'SELECT * FROM routes_config WHERE route_path="{route_path}"')
+            ROUTE_LIMITS[route_path] = {col: limits_res[-1].get(col, None) for col in ROUTE_LIMIT_COLUMNS}
+
             self.get(route_path, name=route_name, tags=route_tags, operation_id=route_name, include_in_schema=True)(GenericEndpoint(prefix=route_name).get_endpoint)
+            self._add_suggest_route(route_path, route_tags)
+            self._add_stats_route(route_path, route_tags)
 
             self._clear_query_params(route_path)
 
@@ -435,9 +1425,21 @@ class FastAPI_Wrapper(FastAPI):
                 qp = query_param[1]
                 type_ = str if query_param[2] == 'str' else (float if query_param[2] == 'float' else int)
                 self._add_query_param(route_path, qp, type_)
+            # ...nor their query params
+            for qp in ['limit', 'offset']:
+                if qp not in [query_param[1] for query_param in query_params]:
+                    self._add_query_param(route_path, qp, int)
+                    query_params.append([route_path, qp, int.__name__])
+
+            self._set_route_version(route_path, route_name, route_tags, query_params)
 
+        # The in-memory DB's data didn't survive the restart, so restore it from its snapshot
+        if any(route['route_path'].startswith('/memory/') for route in routes):
+            restore_memory_db()
 
-    def create_database(self, database: str, data_path: Union[str, Path], data_format='CSV', if_exists='replace', df=None) -> None:
+
+    def create_database(self, database: str, data_path: Union[str, Path], data_format='CSV', if_exists='replace', df=None, fts_columns=None, prefix_columns=None, engine=None,
+                        default_limit=None, max_limit=None) -> None:
         """
         Create DB
 
@@ -448,10 +1450,23 @@ class FastAPI_Wrapper(FastAPI):
             if_exists : {'fail', 'replace', 'append'}, default 'fail': controls how
             the database table is treated if it already exists
             df (pd.DataFrame): Optionally, a populated dataframe will be used instead of a data file
+            fts_columns (Union[list, str]): Text columns to build a full-text index for (or '*' for all).
+            Defaults to settings.FTS_COLUMNS
+            prefix_columns (Union[list, str]): Text columns to build a prefix index for (or '*' for all).
+            Defaults to settings.PREFIX_COLUMNS
+            engine (str): 'pandas' | 'csv', the engine ingesting a data file (see `update_database`).
+            Defaults to settings.INGEST_ENGINE
+            default_limit (int): Rows the route's queries return, unless their `limit` param is given.
+            Defaults to the route's current limit, else settings.DEFAULT_ROW_LIMIT
+            max_limit (int): Max. rows the route's queries return, whatever `limit` is given.
+            Defaults to the route's current limit, else settings.MAX_ROW_LIMIT
         """
         db, db_name = resolve_db(database)
 
-        df_db = self.update_database(db, data_path, data_format=data_format, if_exists=if_exists, df=df)
+        df_db = self.update_database(
+            db, data_path, data_format=data_format, if_exists=if_exists, df=df,
+            fts_columns=fts_columns, prefix_columns=prefix_columns, engine=engine
+        )
 
         # Add the method as GET endpoint to fastapi.
         # {database-table_name} represents a *unique* root and path param details will be extracted from the request object
@@ -468,7 +1483,17 @@ class FastAPI_Wrapper(FastAPI):
         routes_config['route_name'] = route_name
         routes_config['route_tags'] = json.dumps(route_tags)
 
+        # The route (of all the database's tables) keeps its row limits, unless new ones are given
+        limits = ROUTE_LIMITS.setdefault(route_path, {'default_limit': None, 'max_limit': None})
+        if default_limit is not None:
+            limits['default_limit'] = default_limit
+        if max_limit is not None:
+            limits['max_limit'] = max_limit
+        routes_config.update(limits)
+
         self.get(route_path, name=route_name, tags=route_tags, operation_id=route_name, include_in_schema=True)(GenericEndpoint(prefix=route_name).get_endpoint)
+        self._add_suggest_route(route_path, route_tags)
+        self._add_stats_route(route_path, route_tags)
     
         # Remove all auto-generated query parameters (=one for `kwargs`).
         self._clear_query_params(route_path)
@@ -500,34 +1525,66 @@ class FastAPI_Wrapper(FastAPI):
                 self._add_query_param(route_path, col + "_like", type_)
                 self._add_query_param(route_path, col + "_begin", type_)
                 self._add_query_param(route_path, col + "_end", type_)
+                self._add_query_param(route_path, col + "_search", type_)
 
                 query_params.append([route_path, col + "_in", type_.__name__])
                 query_params.append([route_path, col + "_like", type_.__name__])
                 query_params.append([route_path, col + "_begin", type_.__name__])
                 query_params.append([route_path, col + "_end", type_.__name__])
+                query_params.append([route_path, col + "_search", type_.__name__])
 
         self._add_query_param(route_path, "where", str)
         self._add_query_param(route_path, "cols", str)
         self._add_query_param(route_path, "cmd", str)
         self._add_query_param(route_path, "tohtml", str)
+        self._add_query_param(route_path, "page", int)
+        self._add_query_param(route_path, "page_size", int)
+        self._add_query_param(route_path, "limit", int)
+        self._add_query_param(route_path, "offset", int)
+        self._add_query_param(route_path, "group_by", str)
+        self._add_query_param(route_path, "agg", str)
+        self._add_query_param(route_path, "having", str)
+        self._add_query_param(route_path, "timing", str)
+        self._add_query_param(route_path, "count", str)
+
+        # Tables with coordinates can be filtered by bounding box and distance
+        coordinates = detect_coordinate_columns(
+            [col.lower() for col, dtype in zip(df_db.columns, df_db.dtypes) if dtype_to_type(dtype) in (int, float)]
+        )
+        if coordinates is not None:
+            self._add_query_param(route_path, "bbox", str)
+            self._add_query_param(route_path, "near", str)
 
         query_params.append([route_path, "where", str.__name__])
         query_params.append([route_path, "cols", str.__name__])
         query_params.append([route_path, "cmd", str.__name__])
         query_params.append([route_path, "tohtml", str.__name__])
+        query_params.append([route_path, "page", int.__name__])
+        query_params.append([route_path, "page_size", int.__name__])
+        query_params.append([route_path, "limit", int.__name__])
+        query_params.append([route_path, "offset", int.__name__])
+        query_params.append([route_path, "group_by", str.__name__])
+        query_params.append([route_path, "agg", str.__name__])
+        query_params.append([route_path, "having", str.__name__])
+        query_params.append([route_path, "timing", str.__name__])
+        query_params.append([route_path, "count", str.__name__])
+        if coordinates is not None:
+            query_params.append([route_path, "bbox", str.__name__])
+            query_params.append([route_path, "near", str.__name__])
 
         routes_config['query_params'] = json.dumps(query_params)
 
-        config_df =  pd.DataFrame(routes_config, index=[0])
+        self._set_route_version(route_path, route_name, route_tags, query_params)
 
         if self.config_db is not None:
             config_db, _ = resolve_db(self.config_db)
-            self.update_database(config_db, 'routes_config', if_exists='append', df=config_df)
+            save_routes_config(config_db, routes_config)
+            save_db_profile(config_db, db_name, profile_for_db(db))
 
         return self
 
 
-    def update_database(self, database: str, data_path: Union[str, Path], data_format='CSV', if_exists='replace', df=None):
+    def update_database(self, database: str, data_path: Union[str, Path], data_format='CSV', if_exists='replace', df=None, fts_columns=None, prefix_columns=None, engine=None):
         """
         Updates the database with the current data from the CSV file.
         
@@ -542,7 +1599,21 @@ class FastAPI_Wrapper(FastAPI):
             if_exists : {'fail', 'replace', 'append'}, default 'fail': controls how
             the database table is treated if it already exists
             df (pd.DataFrame): Optionally, a populated dataframe will be used instead of a data file
+            fts_columns (Union[list, str]): Text columns to build a full-text index for (or '*' for all).
+            Defaults to settings.FTS_COLUMNS. When appending, an existing full-text index is refreshed.
+            prefix_columns (Union[list, str]): Text columns to build a prefix index for (or '*' for all).
+            Defaults to settings.PREFIX_COLUMNS
+            engine (str): 'pandas' | 'csv'. The csv engine streams a CSV file into the DB without pandas
+            (see `csv_helper`), and returns a `CsvTable` rather than a DataFrame. A `df` is always written by pandas.
+            Defaults to settings.INGEST_ENGINE
         """
+        engine = engine or settings.INGEST_ENGINE
+        if engine not in INGEST_ENGINES:
+            raise Exception(f'Ingestion engine must be one of {INGEST_ENGINES}, not {engine}')
+        if df is not None:
+            engine = 'pandas'
+        elif engine == 'csv' and data_format != 'CSV':
+            raise Exception(f'The csv ingestion engine only reads CSV files, not {data_format}')
 
         db, _ = resolve_db(database)
 
@@ -555,38 +1626,169 @@ class FastAPI_Wrapper(FastAPI):
             raise Exception(f'Invalid character(s) {invalid_chars} in data_path ({data_path}). Cannot create a valid table name.')
 
         df_db = None
+        ingest_start = time.perf_counter()
 
-        if df is None:
-            # Download excel file from data path (e.g. GitHub, Google Sheets, filesystem), read it
-            # with pandas and write to database.
-            if data_format == 'CSV':
-                df_db = pd.read_csv(data_path)
-            elif data_format == 'XLSX':
-                df_db = pd.read_excel(data_path)
-            else:
-                raise Exception(f'Data format not supported: {data_format}')
+        if engine == 'csv':
+            if (if_exists != 'append'):
+                # delete table
+                delete_table(db, table_name)
+
+            con = connection_for_db(db)
+
+            # Stream the CSV file into the DB, without pandas
+            df_db = csv_helper.ingest_csv(con, table_name, data_path, normalize=normalize_column_name, if_exists=if_exists)
         else:
-            assert(isinstance(df, pd.DataFrame))
-            df_db = df
+            # pandas is only imported when it ingests data, so serving the API (e.g. from a routes config) starts faster
+            import pandas as pd
+
+            if df is None:
+                # Download excel file from data path (e.g. GitHub, Google Sheets, filesystem), read it
+                # with pandas and write to database.
+                if data_format == 'CSV':
+                    df_db = pd.read_csv(data_path)
+                elif data_format == 'XLSX':
+                    df_db = pd.read_excel(data_path)
+                else:
+                    raise Exception(f'Data format not supported: {data_format}')
+            else:
+                assert(isinstance(df, pd.DataFrame))
+                df_db = df
+
+            df_db.columns = [normalize_column_name(col) for col in df_db.columns]
 
-        normalized_columns = [col.lower().replace(' ', '_').replace('.', '_').replace(':', '_').replace('unnamed', 'x') for col in df_db.columns]
-        df_db.columns = normalized_columns
+            if (if_exists != 'append'):
+                # delete table
+                delete_table(db, table_name)
 
-        if (if_exists != 'append'):
-            # delete table
-            delete_table(db, table_name)
+            con = connection_for_db(db)
+
+            # Create the DB
+            # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.to_sql.html
+            df_db.to_sql(table_name, con=con, index_label='id', chunksize=100000, if_exists=if_exists)
+
+        # Full-text index, for fast `_like`, `_begin`, `_end` and `_search` filters
+        text_columns = [col for col, dtype in zip(df_db.columns, df_db.dtypes) if dtype_to_type(dtype) == str]
+        fts_columns = resolve_index_columns(fts_columns if fts_columns is not None else settings.FTS_COLUMNS, text_columns)
+        if fts_columns:
+            build_fts_index(con, table_name, fts_columns)
+        elif if_exists == 'append':
+            rebuild_fts_index(con, table_name)
+
+        # Case-insensitive indexes, for fast `_begin` filters and `suggest` lookups
+        prefix_columns = resolve_index_columns(
+            prefix_columns if prefix_columns is not None else settings.PREFIX_COLUMNS, text_columns, index_kind='Prefix'
+        )
+        build_prefix_indexes(con, table_name, prefix_columns)
+
+        # R*Tree index of latitude/longitude columns, for fast `bbox` and `near` filters
+        numeric_columns = [col for col, dtype in zip(df_db.columns, df_db.dtypes) if dtype_to_type(dtype) in (int, float)]
+        coordinates = detect_coordinate_columns(numeric_columns)
+        if coordinates is not None and settings.SPATIAL_INDEX:
+            build_spatial_index(con, table_name, *coordinates)
+
+        # Column stats, served by `/{database}/{table}/stats` (not for the routes config itself)
+        config_db = resolve_db(self.config_db)[0] if self.config_db is not None else None
+        if settings.COLUMN_STATS and db != config_db:
+            if engine == 'csv':
+                # Computed by SQLite, so pandas isn't needed
+                read_con = open_connection(db, read_only=True)
+                try:
+                    stats = csv_helper.table_stats(read_con, table_name, top_k=settings.STATS_TOP_K, bins=settings.STATS_HISTOGRAM_BINS)
+                finally:
+                    read_con.close()
+            elif if_exists == 'append':
+                # Stats of the whole table, not just the appended rows
+                read_con = open_connection(db, read_only=True)
+                read_con.row_factory = None
+                try:
+                    df_stats = pd.read_sql_query(f'SELECT * FROM {table_name}', read_con, index_col='id')
+                finally:
+                    read_con.close()
+                stats = stats_helper.table_stats(df_stats, top_k=settings.STATS_TOP_K, bins=settings.STATS_HISTOGRAM_BINS)
+            else:
+                stats = stats_helper.table_stats(df_db, top_k=settings.STATS_TOP_K, bins=settings.STATS_HISTOGRAM_BINS)
+            TABLE_STATS[(db, table_name)] = stats
+            if config_db is not None:
+                save_table_stats(config_db, Path(db).stem.replace(':', ''), table_name, stats)
 
-        con = connection_for_db(db)
+        # Publish the new data to readers (not in the write path: ingestion never waits on queries of the DB)
+        if settings.SNAPSHOTS and db not in (':memory:', config_db):
+            publish_snapshot(db)
 
-        # Create the DB
-        # https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.to_sql.html
-        df_db.to_sql(table_name, con=con, index_label='id', chunksize=100000, if_exists=if_exists)
+        metrics_helper.INGEST_ROWS.inc(table_name, amount=len(df_db))
+        metrics_helper.INGEST_SECONDS.inc(table_name, amount=time.perf_counter() - ingest_start)
 
         logging.info("Database successfully updated")
         logging.info(f'Columns: {list(df_db.columns)}')
 
         return df_db
 
+    def _batch_query(self, query: BatchQuery, request: Request = None) -> tuple:
+        """
+        Runs a query of a batch through its generated route's endpoint, with its params validated like a GET's,
+        on behalf of the batch's `request` client (for admission control). Returns the status and the query's
+        result (or error) as JSON bytes.
+        """
+        def result(status, **content):
+            head = json_helper.dumps({'id': query.id, 'path': query.path, 'status': status, **content})
+            return status, head
+
+        url = urlsplit(query.path)
+        params = {**dict(parse_qsl(url.query, keep_blank_values=True)), **query.params}
+        parts = url.path.strip('/').split('/')
+        route = self._find_route(f'/{parts[0]}' + '/{table}') if len(parts) == 2 else None
+        if route is None:
+            return result(404, error=f'No generated route for path `{url.path}`')
+        if 'tohtml' in params:
+            return result(400, error='The `tohtml` parameter is not supported in batches')
+
+        fields = {field.name: field for field in route.dependant.query_params}
+        unknown = [name for name in params if name not in fields]
+        if unknown:
+            return result(400, error=f'Unknown parameter(s) {unknown} for route `{route.path}`')
+        kwargs = {name: None for name in fields}
+        for name, val in params.items():
+            kwargs[name], errors = fields[name].validate(val, {}, loc=('query', name))
+            if errors:
+                return result(400, error=f'Invalid value ({val}) of parameter `{name}`')
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'scheme': 'http', 'server': None, 'root_path': '',
+            'client': request.scope.get('client', None) if request is not None else None,
+            'headers': request.scope.get('headers', []) if request is not None else [],
+            'path': url.path, 'query_string': urlencode(params).encode(),
+            'app': self, 'route': route, 'endpoint': route.endpoint, 'path_params': {'table': parts[1]},
+        }
+        try:
+            response = route.endpoint(table=parts[1], request=Request(scope), **kwargs)
+        except Exception as ex:
+            return result(400, error=str(ex))
+        if response.status_code != 200:
+            # e.g. rejected by admission control
+            return result(response.status_code, error=json.loads(response.body)['detail'])
+        # Splice the route's JSON response in as the `result`
+        status, head = result(200)
+        return status, head[:-1] + b',"result":' + response.body + b'}'
+
+    def _set_route_version(self, route_path, route_name, route_tags, query_params):
+        """Records a (new) route version and invalidates the assembled OpenAPI schema."""
+        self.route_versions[route_name] = openapi_helper.route_version(
+            route_path, route_name, route_tags, query_params, version=fastapi.__version__
+        )
+        self.openapi_schema = None
+
+    def _add_suggest_route(self, route_path, route_tags):
+        """Adds the `/{database}/{table}/suggest` autocomplete endpoint (once per database)."""
+        suggest_path = f'{route_path}/suggest'
+        if self._find_route(suggest_path) is None:
+            self.get(suggest_path, name=suggest_path, tags=route_tags)(suggest)
+
+    def _add_stats_route(self, route_path, route_tags):
+        """Adds the `/{database}/{table}/stats` column stats endpoint (once per database)."""
+        stats_path = f'{route_path}/stats'
+        if self._find_route(stats_path) is None:
+            self.get(stats_path, name=stats_path, tags=route_tags)(table_stats)
+
     def _find_route(self, route_path_or_name):
         """Find a route (stored in the FastAPI instance) by its path (e.g. '/index')."""
         for route in self.router.routes:
@@ -614,6 +1816,33 @@ class FastAPI_Wrapper(FastAPI):
         return route.dependant.query_params
 
 
+APP_FACTORY = 'fastapi_wrapper.fastapi_wrapper:create_app'
+
+def create_app(config_db=None) -> FastAPI_Wrapper:
+    """
+    App factory which rebuilds the API routes from a routes config database.
+
+    Use it with uvicorn's `--factory` option. Each uvicorn worker process calls it to build its
+    own `FastAPI_Wrapper`, so it is *not* a singleton. If `config_db` isn't given, the
+    `API_CONFIG_DB` environment variable (see settings) is used.
+    """
+    config_db = config_db or settings.API_CONFIG_DB
+    return FastAPI_Wrapper(init_routes_with_config_db=True, config_db=config_db)
+
+def run_workers(config_db, host='127.0.0.1', port=8000, workers=settings.API_WORKERS):
+    """
+    Serves the API from a routes config database with multiple uvicorn worker processes.
+
+    File-backed databases are shared by the workers. An in-memory database can't be shared across
+    processes, so each worker restores its own copy from the in-memory DB snapshot (see `snapshot_memory_db`).
+    """
+    import uvicorn
+
+    # Worker processes read their settings from the environment
+    os.environ['API_CONFIG_DB'] = config_db
+    uvicorn.run(APP_FACTORY, factory=True, host=host, port=port, workers=workers)
+
+
 from abc import ABCMeta
 # https://stackoverflow.com/questions/6760685/creating-a-singleton-in-python
 class Singleton(type, metaclass=ABCMeta):
@@ -1,4 +1,4 @@
-import pandas as pd
+from html import escape
 
 HTML_WRAPPER = r"""
 <!DOCTYPE html>
@@ -24,6 +24,14 @@ HTML_WRAPPER = r"""
         background-color: #003469;
         color: white;
     }
+    .pagination {
+        font-family: Arial, Helvetica, sans-serif;
+        font-size: 12px;
+        padding: 8px 0px;
+    }
+    .pagination a, .pagination span {
+        padding: 0px 6px;
+    }
     </style>
     </head>
     <body>
@@ -39,5 +47,48 @@ def wrap_html(html):
 def df_to_html(df):
     return wrap_html(df.to_html())
 
-def dicts_to_html(dicts):
-    return wrap_html(pd.DataFrame([row for row in dicts]).to_html())
+def _html_cell(val):
+    return '' if val is None else escape(str(val))
+
+def stream_html_table(cursor, header_html='', footer_html='', batch_size=1000):
+    """
+    Renders the rows of a DB cursor as an HTML table, in chunks of `batch_size` rows.
+
+    The rows are never all in memory, so it can be used for a streamed response.
+    """
+    head, tail = HTML_WRAPPER.split('@TABLE')
+    cols = [col[0] for col in cursor.description]
+
+    yield head
+    yield header_html
+    yield (
+        '<table border="1" class="dataframe">\n  <thead>\n    <tr style="text-align: right;">\n' +
+        ''.join(f'      <th>{_html_cell(col)}</th>\n' for col in cols) +
+        '    </tr>\n  </thead>\n  <tbody>\n'
+    )
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield ''.join(
+            '    <tr>\n' +
+            ''.join(f'      <td>{_html_cell(val)}</td>\n' for val in (row.values() if isinstance(row, dict) else row)) +
+            '    </tr>\n'
+            for row in rows
+        )
+    yield '  </tbody>\n</table>'
+    yield footer_html
+    yield tail
+
+def pagination_html(page, page_count, first_row, last_row, total_rows, url_for_page):
+    """Makes First/Prev/Next/Last page links. `url_for_page` maps a page number to its URL."""
+    links = []
+    if page > 1:
+        links.append(f'<a href="{escape(url_for_page(1))}">&laquo; First</a>')
+        links.append(f'<a href="{escape(url_for_page(page - 1))}">&lsaquo; Prev</a>')
+    links.append(f'<span>Page {page} of {page_count} (rows {first_row}-{last_row} of {total_rows})</span>')
+    if page < page_count:
+        links.append(f'<a href="{escape(url_for_page(page + 1))}">Next &rsaquo;</a>')
+        links.append(f'<a href="{escape(url_for_page(page_count))}">Last &raquo;</a>')
+    return f'<div class="pagination">{"".join(links)}</div>'
+
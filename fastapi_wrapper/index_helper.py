@@ -0,0 +1,139 @@
+"""
+Builds and inspects the auxiliary indexes created for a table at ingest.
+
+Full-text indexes are SQLite FTS5 tables named `<table>_fts`, which use the table as
+external content, so the text itself isn't stored twice. Prefix indexes are ordinary
+indexes with case-insensitive (NOCASE) collation, named `ix_<table>_<column>_nocase`.
+Spatial indexes are SQLite R*Tree tables named `<table>_rtree`, over a table's latitude
+and longitude columns.
+"""
+import logging
+import re
+
+LAT_NAMES = ['lat', 'latitude']
+LNG_NAMES = ['lng', 'lon', 'long', 'longitude']
+
+def fts_table(table) -> str:
+    return f'{table}_fts'
+
+def prefix_index(table, col) -> str:
+    return f'ix_{table}_{col}_nocase'
+
+def resolve_index_columns(columns, text_columns, index_kind='Full-text') -> list:
+    """
+    Resolves which text columns get an index.
+
+    `columns` may be a list or a comma separated string of column names, or '*' for all text columns.
+    """
+    if not columns:
+        return []
+    if isinstance(columns, str):
+        if columns.strip() == '*':
+            return list(text_columns)
+        columns = columns.split(',')
+    columns = [col.strip().lower() for col in columns if col.strip()]
+    invalid = [col for col in columns if col not in text_columns]
+    if invalid:
+        raise Exception(f'{index_kind} index columns {invalid} are not text columns. Text columns are: {list(text_columns)}')
+    return columns
+
+def build_fts_index(con, table, columns):
+    """
+    (Re)builds the full-text index of a table's columns.
+
+    Uses the trigram tokenizer if SQLite has it (3.34+), which indexes substrings, so
+    `LIKE` patterns can be served from the index too. Otherwise falls back to word tokens.
+    """
+    fts = fts_table(table)
+    cols = ', '.join(columns)
+    con.execute(f'DROP TABLE IF EXISTS {fts}')
+    try:
+        con.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', tokenize='trigram')")
+    except Exception:
+        logging.info('SQLite FTS5 trigram tokenizer not available, using the default tokenizer')
+        con.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}')")
+    with con:
+        con.execute(f"INSERT INTO {fts}({fts}) VALUES('rebuild')")
+    logging.info(f'Full-text index built for `{table}` columns: {columns}')
+
+def rebuild_fts_index(con, table) -> bool:
+    """Refreshes a table's full-text index (if it has one), e.g. after appending rows."""
+    fts = fts_table(table)
+    if not con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (fts,)).fetchall():
+        return False
+    with con:
+        con.execute(f"INSERT INTO {fts}({fts}) VALUES('rebuild')")
+    return True
+
+def build_prefix_indexes(con, table, columns):
+    """
+    Creates case-insensitive indexes of a table's columns, which serve prefix (`_begin`)
+    range predicates and the `suggest` endpoint.
+    """
+    for col in columns:
+        con.execute(f'CREATE INDEX IF NOT EXISTS {prefix_index(table, col)} ON {table} ({col} COLLATE NOCASE)')
+    logging.info(f'Prefix indexes built for `{table}` columns: {columns}')
+
+def rtree_table(table) -> str:
+    return f'{table}_rtree'
+
+def detect_coordinate_columns(numeric_columns):
+    """
+    Finds a latitude/longitude column pair, e.g. `lat` & `lng`, or `pickup_latitude` & `pickup_longitude`.
+
+    Returns:
+        tuple: (lat column, lng column), or None if there isn't a pair
+    """
+    lat_pattern = re.compile(f"^(.*?)({'|'.join(LAT_NAMES)})(.*)$")
+    for lat_col in numeric_columns:
+        match = lat_pattern.match(lat_col)
+        if match is None:
+            continue
+        before, _, after = match.groups()
+        for lng_name in LNG_NAMES:
+            lng_col = f'{before}{lng_name}{after}'
+            if lng_col in numeric_columns:
+                return lat_col, lng_col
+    return None
+
+def build_spatial_index(con, table, lat_col, lng_col):
+    """(Re)builds the R*Tree index of a table's coordinates, keyed by the table's rowid."""
+    rtree = rtree_table(table)
+    con.execute(f'DROP TABLE IF EXISTS {rtree}')
+    con.execute(
+        f'CREATE VIRTUAL TABLE {rtree} USING rtree(id, min_{lat_col}, max_{lat_col}, min_{lng_col}, max_{lng_col})'
+    )
+    with con:
+        con.execute(
+            f'INSERT INTO {rtree} SELECT rowid, {lat_col}, {lat_col}, {lng_col}, {lng_col} FROM {table} '
+            f'WHERE {lat_col} IS NOT NULL AND {lng_col} IS NOT NULL'
+        )
+    logging.info(f'Spatial index built for `{table}` columns: {[lat_col, lng_col]}')
+
+def index_info(con, table) -> dict:
+    """
+    Gets a table's auxiliary indexes: its full-text index columns (`columns`), whether that
+    uses the trigram tokenizer (`trigram`), its prefix indexed columns (`prefix`), and its
+    spatial index coordinate columns (`spatial`, as (lat, lng) or None).
+    """
+    def value(row, key, idx):
+        return row[key] if isinstance(row, dict) else row[idx]
+
+    spatial = None
+    rtree_columns = [value(row, 'name', 1) for row in con.execute(f'PRAGMA table_info({rtree_table(table)})').fetchall()]
+    if len(rtree_columns) == 5:
+        spatial = (rtree_columns[1][len('min_'):], rtree_columns[3][len('min_'):])
+
+    prefix = []
+    for row in con.execute(f'PRAGMA index_list({table})').fetchall():
+        name = value(row, 'name', 1)
+        if name.startswith(f'ix_{table}_') and name.endswith('_nocase'):
+            prefix.append(name[len(f'ix_{table}_'):-len('_nocase')])
+
+    fts = fts_table(table)
+    rows = con.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?", (fts,)).fetchall()
+    if not rows:
+        return {'columns': [], 'trigram': False, 'prefix': prefix, 'spatial': spatial}
+    sql = value(rows[0], 'sql', 0)
+    columns = [value(row, 'name', 1).lower() for row in con.execute(f'PRAGMA table_info({fts})').fetchall()]
+    return {'columns': columns, 'trigram': "'trigram'" in sql, 'prefix': prefix, 'spatial': spatial}
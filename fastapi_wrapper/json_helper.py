@@ -0,0 +1,50 @@
+"""
+Fast JSON serialization of query results, straight to bytes.
+
+Query results only hold SQLite scalar types (str, int, float, bytes and None), so they don't need
+FastAPI's `jsonable_encoder`. If `orjson` is installed it does the encoding, otherwise the stdlib
+`json` encoder. Either way NaN and infinite floats become `null`, and bytes (BLOBs) become strings.
+"""
+import json
+import math
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(obj):
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return bytes(obj).decode('utf-8', errors='replace')
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+def _finite(obj):
+    """Replaces NaN and infinite floats with None, like orjson does."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _finite(val) for key, val in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(val) for val in obj]
+    return obj
+
+def dumps(content) -> bytes:
+    """Serializes content to (compact, UTF-8) JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    try:
+        text = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':'), default=_default)
+    except ValueError:
+        # Out of range floats are rare, so only then pay for a pass over the content
+        text = json.dumps(_finite(content), ensure_ascii=False, allow_nan=False, separators=(',', ':'), default=_default)
+    return text.encode('utf-8')
+
+class FastJSONResponse(Response):
+    """A JSON response serialized with `dumps`, bypassing `jsonable_encoder`."""
+
+    media_type = 'application/json'
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,219 @@
+"""
+In-process metrics, exposed in the Prometheus text format by the `/metrics` endpoint.
+
+Recording is a dict update under a per-metric lock, so it's cheap enough for the hot path.
+Metrics are per process: with several uvicorn workers, each scrape sees the worker it hit.
+See https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+import bisect
+import threading
+import time
+
+NAMESPACE = 'fastapi_wrapper'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(val) -> str:
+    return str(val).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels_text(names, values, extra='') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(val) -> str:
+    if val == float('inf'):
+        return '+Inf'
+    return repr(float(val)) if isinstance(val, float) else str(val)
+
+class Metric():
+    """A named metric with a fixed set of label names. Values are keyed by a tuple of label values."""
+
+    type_ = None
+
+    def __init__(self, name, help, labels=()) -> None:
+        self.name = f'{NAMESPACE}_{name}'
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type_}']
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in sorted(values):
+            lines.extend(self._samples(label_values, value))
+        return lines
+
+    def _samples(self, label_values, value) -> list:
+        return [f'{self.name}{_labels_text(self.labels, label_values)} {_number(value)}']
+
+class Counter(Metric):
+    type_ = 'counter'
+
+    def inc(self, *label_values, amount=1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def set_total(self, *label_values, value) -> None:
+        """Sets the total of a count kept elsewhere (e.g. by a connection pool), when scraped."""
+        with self._lock:
+            self._values[label_values] = value
+
+class Gauge(Metric):
+    type_ = 'gauge'
+
+    def set(self, *label_values, value) -> None:
+        with self._lock:
+            self._values[label_values] = value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+class Histogram(Metric):
+    type_ = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, *label_values, value) -> None:
+        # Bucket counts aren't cumulative here, only when rendered
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(label_values, None)
+            if counts is None:
+                counts = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[idx] += 1
+            counts[-1] += value
+
+    def _samples(self, label_values, counts) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts[:-1]):
+            cumulative += count
+            le = f'le="{_number(bound)}"'
+            lines.append(f'{self.name}_bucket{_labels_text(self.labels, label_values, le)} {cumulative}')
+        labels = _labels_text(self.labels, label_values)
+        lines.append(f'{self.name}_sum{labels} {_number(counts[-1])}')
+        lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+class Registry():
+    """Holds the metrics, and functions run before rendering them (e.g. to set gauges)."""
+
+    def __init__(self) -> None:
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+# Requests (recorded by `MetricsMiddleware`)
+REQUESTS = REGISTRY.register(Counter('requests_total', 'HTTP requests.', ['route', 'method', 'status']))
+REQUEST_SECONDS = REGISTRY.register(Histogram('request_duration_seconds', 'HTTP request duration, until the response is sent.', ['route', 'method']))
+
+# Generated routes
+SQL_SECONDS = REGISTRY.register(Histogram('sql_duration_seconds', 'SQL query time of generated routes.', ['route', 'table']))
+SERIALIZATION_SECONDS = REGISTRY.register(Histogram('serialization_duration_seconds', 'JSON serialization time of generated routes.', ['route', 'table']))
+HTML_SECONDS = REGISTRY.register(Histogram('html_render_duration_seconds', 'HTML table streaming time (incl. reading rows from the DB cursor) of generated routes.', ['route', 'table']))
+ROWS_RETURNED = REGISTRY.register(Counter('rows_returned_total', 'Rows returned by generated routes.', ['route', 'table']))
+
+# Caches (hit ratio = hits / (hits + misses))
+CACHE_REQUESTS = REGISTRY.register(Counter('cache_requests_total', 'Cache lookups, by result (hit or miss).', ['cache', 'result']))
+
+# Connection pools (set when scraped)
+POOL_SIZE = REGISTRY.register(Gauge('pool_size', 'Max. connections of a read connection pool.', ['database']))
+POOL_CONNECTIONS = REGISTRY.register(Gauge('pool_connections', 'Connections opened by a read connection pool.', ['database']))
+POOL_IN_USE = REGISTRY.register(Gauge('pool_connections_in_use', 'Connections borrowed from, or being waited for from, a read connection pool.', ['database']))
+POOL_WAITS = REGISTRY.register(Counter('pool_waits_total', 'Times a query had to wait for a connection of a saturated read connection pool.', ['database']))
+
+# Admission control of ad-hoc queries, by decision (admitted, queued, rejected_cost or rejected_busy)
+ADMISSION_DECISIONS = REGISTRY.register(Counter('admission_decisions_total', 'Admission decisions on ad-hoc (`where`, `cols`, `cmd`) queries.', ['decision']))
+
+# Ingestion
+INGEST_ROWS = REGISTRY.register(Counter('ingest_rows_total', 'Rows written by ingestion.', ['table']))
+INGEST_SECONDS = REGISTRY.register(Counter('ingest_duration_seconds_total', 'Time spent ingesting (reading, writing and indexing).', ['table']))
+
+def cache_lookup(cache, hit) -> None:
+    CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+def timed(histogram, *label_values, chunks):
+    """Passes through a (streamed) response's chunks, observing the time taken to produce them all."""
+    start = time.perf_counter()
+    try:
+        yield from chunks
+    finally:
+        histogram.observe(*label_values, value=time.perf_counter() - start)
+
+def server_timing(timings) -> str:
+    """Formats phase durations (ms) as a `Server-Timing` header value, e.g. `count;dur=1.2, query;dur=3.4`."""
+    return ', '.join(f'{phase};dur={ms}' for phase, ms in timings.items())
+
+def timing_comment(chunks):
+    """Passes through streamed HTML chunks, then appends the time taken to produce them as an HTML comment."""
+    start = time.perf_counter()
+    yield from chunks
+    yield f'\n<!-- Server-Timing: render;dur={round((time.perf_counter() - start) * 1000, 3)} -->\n'
+
+def route_template(scope) -> str:
+    """
+    Gets the path template of the route which served a request, e.g. `/macro/{table}`, by putting back
+    the path params in its path, so the label values stay few. Unmatched requests are `<unmatched>`.
+    """
+    if 'endpoint' not in scope:
+        return '<unmatched>'
+    params = {str(val): name for name, val in scope.get('path_params', {}).items()}
+    parts = scope['path'].split('/')
+    # Path params are at the end of the paths here, and each replaces one part
+    for idx in reversed(range(len(parts))):
+        if not params:
+            break
+        if parts[idx] in params:
+            parts[idx] = '{' + params.pop(parts[idx]) + '}'
+    return '/'.join(parts)
+
+class MetricsMiddleware():
+    """ASGI middleware which counts and times HTTP requests, by route template, method and status."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                route = route_template(scope)
+                REQUESTS.inc(route, scope['method'], str(status[0]))
+                REQUEST_SECONDS.observe(route, scope['method'], value=time.perf_counter() - start)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            route = route_template(scope)
+            REQUESTS.inc(route, scope['method'], '500')
+            REQUEST_SECONDS.observe(route, scope['method'], value=time.perf_counter() - start)
+            raise
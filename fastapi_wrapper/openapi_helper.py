@@ -0,0 +1,62 @@
+"""
+Incremental OpenAPI schema building for the generated routes.
+
+Each generated route contributes a schema *fragment* (its `paths` entry plus the
+`components` it references). Fragments are keyed by a route version hash derived
+from the route's config, so they can be cached in the routes config database and
+reused across restarts until the route definition changes.
+"""
+import hashlib
+import json
+
+OPENAPI_CACHE_TABLE = 'openapi_cache'
+
+def route_version(route_path, route_name, route_tags, query_params, version='') -> str:
+    """Makes a stable version hash for a route's config."""
+    route_config = [route_path, route_name, route_tags, query_params, version]
+    return hashlib.sha1(json.dumps(route_config, sort_keys=True).encode('utf-8')).hexdigest()
+
+def build_schema(routes, title, version, description) -> dict:
+    """Builds an OpenAPI schema (or fragment) for the given routes."""
+    from fastapi.openapi.utils import get_openapi
+
+    return get_openapi(title=title, version=version, description=description, routes=routes)
+
+def fragment_of(schema) -> dict:
+    """Extracts the route specific parts of an OpenAPI schema."""
+    return {
+        'paths': schema.get('paths', {}),
+        'components': schema.get('components', {}),
+    }
+
+def merge_fragment(schema, fragment) -> dict:
+    """Merges a route fragment into a full OpenAPI schema (in place)."""
+    paths = schema.setdefault('paths', {})
+    for path, path_item in fragment.get('paths', {}).items():
+        paths.setdefault(path, {}).update(path_item)
+
+    for section, items in fragment.get('components', {}).items():
+        components = schema.setdefault('components', {})
+        components.setdefault(section, {}).update(items)
+
+    return schema
+
+def ensure_cache_table(con):
+    con.execute(
+        f'CREATE TABLE IF NOT EXISTS {OPENAPI_CACHE_TABLE} '
+        '(route_name TEXT PRIMARY KEY, route_version TEXT, fragment TEXT)'
+    )
+
+def load_fragments(con) -> dict:
+    """Loads all cached fragments as {route_name: (route_version, fragment)}."""
+    ensure_cache_table(con)
+    rows = con.execute(f'SELECT route_name, route_version, fragment FROM {OPENAPI_CACHE_TABLE}').fetchall()
+    return {row['route_name']: (row['route_version'], json.loads(row['fragment'])) for row in rows}
+
+def save_fragment(con, route_name, version, fragment):
+    ensure_cache_table(con)
+    with con:
+        con.execute(
+            f'INSERT OR REPLACE INTO {OPENAPI_CACHE_TABLE} (route_name, route_version, fragment) VALUES (?, ?, ?)',
+            (route_name, version, json.dumps(fragment))
+        )
@@ -0,0 +1,135 @@
+"""
+Logs slow SQL queries, with their query plan, to a SQLite DB or a JSONL file (see `SLOW_QUERY_LOG` in settings).
+
+Python's sqlite3 doesn't expose SQLite's per-statement scan counters, so the work a query did is
+measured in virtual machine steps (`vm_steps`), counted with a progress handler.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import settings.settings as settings
+
+SLOW_QUERIES_TABLE = 'slow_queries'
+# The progress handler is called every this many VM steps (so `vm_steps` is a multiple of it), which keeps its overhead under 1%
+VM_STEP_GRANULARITY = 10000
+
+_lock = threading.Lock()
+_connections = {} # key = log path, value = connection
+
+def enabled() -> bool:
+    return bool(settings.SLOW_QUERY_LOG) and settings.SLOW_QUERY_MS >= 0
+
+def query_plan(con, sql_query) -> list:
+    """Gets a query's `EXPLAIN QUERY PLAN` lines, indented by depth."""
+    depths = {0: -1}
+    lines = []
+    for row in con.execute(f'EXPLAIN QUERY PLAN {sql_query}').fetchall():
+        row_id, parent, detail = (row['id'], row['parent'], row['detail']) if isinstance(row, dict) else (row[0], row[1], row[3])
+        depths[row_id] = depths.get(parent, -1) + 1
+        lines.append('  ' * depths[row_id] + detail)
+    return lines
+
+@contextmanager
+def watch(con, db, sql_query, origin=None):
+    """
+    Times a query run on `con` in the `with` block, and logs it if it's slow. Set the number of rows
+    it returned in the yielded dict's `rows`. `origin` (dict) is e.g. the route and params it came from.
+    """
+    if not enabled():
+        yield {}
+        return
+
+    steps = [0]
+    def count_steps():
+        steps[0] += VM_STEP_GRANULARITY
+        return 0
+
+    stats = {'rows': None}
+    con.set_progress_handler(count_steps, VM_STEP_GRANULARITY)
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        con.set_progress_handler(None, 0)
+    if duration_ms >= settings.SLOW_QUERY_MS:
+        try:
+            plan = query_plan(con, sql_query)
+        except Exception as ex:
+            plan = [f'EXPLAIN QUERY PLAN failed: {str(ex)}']
+        origin = origin or {}
+        record({
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            'database': os.path.basename(db) if db != ':memory:' else 'memory',
+            'route': origin.get('route', None),
+            'params': origin.get('params', None),
+            'sql_query': sql_query,
+            'duration_ms': round(duration_ms, 3),
+            'rows_returned': stats['rows'],
+            'vm_steps': steps[0],
+            'query_plan': plan,
+        })
+
+def _log_connection(path) -> sqlite3.Connection:
+    con = _connections.get(path, None)
+    if con is None:
+        con = _connections[path] = sqlite3.connect(path, check_same_thread=False)
+        con.execute(
+            f'CREATE TABLE IF NOT EXISTS {SLOW_QUERIES_TABLE} (timestamp TEXT, database TEXT, route TEXT, params TEXT, '
+            'sql_query TEXT, duration_ms REAL, rows_returned INTEGER, vm_steps INTEGER, query_plan TEXT)'
+        )
+    return con
+
+def record(entry, path=None) -> None:
+    """Appends a slow query entry to the log (a `.jsonl` file, else a SQLite DB)."""
+    path = path or settings.SLOW_QUERY_LOG
+    logging.warning(f"Slow query ({entry['duration_ms']} ms): {entry['sql_query']}")
+    try:
+        with _lock:
+            if path.endswith('.jsonl'):
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entry) + '\n')
+            else:
+                con = _log_connection(path)
+                with con:
+                    con.execute(
+                        f'INSERT INTO {SLOW_QUERIES_TABLE} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (entry['timestamp'], entry['database'], entry['route'], json.dumps(entry['params']),
+                         entry['sql_query'], entry['duration_ms'], entry['rows_returned'], entry['vm_steps'],
+                         json.dumps(entry['query_plan']))
+                    )
+    except Exception as ex:
+        # Logging must never fail the query
+        logging.error(f'Failed to write slow query log `{path}`: {str(ex)}')
+
+def recent(limit=50, path=None) -> list:
+    """Gets the latest `limit` (at least 1) slow query entries, newest first."""
+    path = path or settings.SLOW_QUERY_LOG
+    limit = max(1, limit)
+    if not path or not os.path.exists(path):
+        return []
+    with _lock:
+        if path.endswith('.jsonl'):
+            with open(path, encoding='utf-8') as f:
+                lines = f.readlines()
+            return [json.loads(line) for line in reversed(lines[-limit:]) if line.strip()]
+        con = _log_connection(path)
+        cur = con.execute(f'SELECT * FROM {SLOW_QUERIES_TABLE} ORDER BY rowid DESC LIMIT ?', (limit,))
+        columns = [col[0] for col in cur.description]
+        entries = [dict(zip(columns, row)) for row in cur.fetchall()]
+    for entry in entries:
+        entry['params'] = json.loads(entry['params'])
+        entry['query_plan'] = json.loads(entry['query_plan'])
+    return entries
+
+def close() -> None:
+    with _lock:
+        for con in _connections.values():
+            con.close()
+        _connections.clear()
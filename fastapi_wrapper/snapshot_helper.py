@@ -0,0 +1,105 @@
+"""
+Immutable, versioned read snapshots of file DBs (`SNAPSHOTS` in settings.py).
+
+Ingestion still writes to the DB file itself (e.g. `sql_db/macro.db`), but queries don't read it: once an
+`update_database` is done, the DB is copied with the SQLite backup API into a new snapshot file
+(`sql_db/macro.v3.db`), which is then published by atomically replacing a small pointer file
+(`sql_db/macro.db.snapshot`). Readers (in any worker process) open the current snapshot as `immutable`,
+so they take no locks and never wait on, or slow down, a load in progress.
+
+The connection pools (see `fastapi_wrapper.pool_for_db`) keep one pool per snapshot, so a query which
+started on a snapshot finishes on it. Superseded snapshots' pools are closed when idle, and their files
+deleted once they're older than the last `SNAPSHOT_KEEP` versions.
+"""
+from pathlib import Path
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+
+import settings.settings as settings
+
+POINTER_SUFFIX = '.snapshot'
+
+_pointers = {} # key = db, value = (pointer file's stat key, pointer)
+
+def pointer_path(db) -> str:
+    return f'{db}{POINTER_SUFFIX}'
+
+def snapshot_path(db, version) -> str:
+    """The file of a DB's snapshot version, e.g. `sql_db/macro.v3.db` for `sql_db/macro.db`."""
+    stem, ext = os.path.splitext(db)
+    return f'{stem}.v{version}{ext}'
+
+def snapshot_versions(db) -> dict:
+    """The snapshot files of a DB on disk, keyed by version."""
+    stem, ext = os.path.splitext(db)
+    pattern = re.compile(re.escape(Path(stem).name) + r'\.v(\d+)' + re.escape(ext) + r'\Z')
+    versions = {}
+    for path in glob.glob(f'{glob.escape(stem)}.v*{ext}'):
+        match = pattern.match(Path(path).name)
+        if match:
+            versions[int(match.group(1))] = path
+    return versions
+
+def current(db):
+    """
+    The published snapshot of a DB: a dict of its `version` and `path`, or None if the DB has none.
+    The pointer file is only read again when it's been replaced, so this costs a `stat` per call.
+    """
+    try:
+        stat = os.stat(pointer_path(db))
+    except FileNotFoundError:
+        return None
+    key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _pointers.get(db, None)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    with open(pointer_path(db)) as f:
+        pointer = json.load(f)
+    pointer['path'] = os.path.join(os.path.dirname(db), pointer['file'])
+    _pointers[db] = (key, pointer)
+    return pointer
+
+def publish(con, db) -> dict:
+    """
+    Copies a DB, through its (write) connection `con`, into a new snapshot file with the backup API, and
+    publishes it. The copy is written to a temp file and renamed, so no reader sees a partial snapshot.
+    Returns the new pointer.
+
+    Publishing holds the DB's write lock (in any process, e.g. another uvicorn worker), so no two publishers
+    take the same version, and the copy is of the latest data. SQLite releases the lock if the process dies.
+    """
+    lock_con = sqlite3.connect(db, timeout=settings.SQLITE_BUSY_TIMEOUT)
+    try:
+        lock_con.execute('BEGIN IMMEDIATE')
+        pointer = current(db)
+        version = max([pointer['version'] if pointer is not None else 0, *snapshot_versions(db)]) + 1
+        path = snapshot_path(db, version)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        snapshot_con = sqlite3.connect(tmp_path)
+        try:
+            con.backup(snapshot_con)
+            # A single file, which can be opened as immutable (the copy would otherwise be in WAL mode like its DB)
+            snapshot_con.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            snapshot_con.close()
+        os.replace(tmp_path, path)
+
+        tmp_pointer = f'{pointer_path(db)}.{os.getpid()}.tmp'
+        with open(tmp_pointer, 'w') as f:
+            json.dump({'version': version, 'file': Path(path).name}, f)
+        os.replace(tmp_pointer, pointer_path(db))
+    finally:
+        lock_con.close()
+    logging.info(f'>>> Published snapshot {version} of database `{Path(db).name}` <<<')
+    return current(db)
+
+def stale_snapshots(db, keep=2) -> list:
+    """The files of a DB's snapshots older than its last `keep` versions (never the current one)."""
+    pointer = current(db)
+    if pointer is None:
+        return []
+    return [path for version, path in snapshot_versions(db).items() if version <= pointer['version'] - max(1, keep)]
@@ -0,0 +1,333 @@
+"""
+Compiles structured query parameters of the generated routes into SQL clauses.
+
+Unlike the free-form `where`, `cols` and `cmd` params, every name used here is validated
+against the table's columns, so nothing from the request reaches the SQL unchecked.
+"""
+import math
+import re
+
+AGG_FUNCTIONS = ['sum', 'avg', 'min', 'max', 'count']
+HAVING_OPERATORS = ['>=', '<=', '!=', '<>', '=', '>', '<']
+
+def split_list(val) -> list:
+    """Splits a comma separated query param value, dropping blanks."""
+    return [v.strip().lower() for v in re.split(',+', val) if v.strip()]
+
+def _check_column(col, columns, param):
+    if col not in columns:
+        raise Exception(f'Unknown column `{col}` in `{param}` parameter. Columns are: {columns}')
+
+def compile_aggregation(columns, group_by=None, agg=None, having=None) -> dict:
+    """
+    Compiles `group_by`, `agg` and `having` query params into SQL clauses.
+
+    Args:
+        columns (list): The table's (lowercase) column names
+        group_by (str): Comma separated columns, e.g. `location,year`
+        agg (str): Comma separated `function:column` aggregates, e.g. `sum:value,avg:value,count`.
+            Functions are sum, avg, min, max and count (a bare `count` counts rows).
+            Results are named `<function>_<column>`, e.g. `sum_value`, or `count`.
+        having (str): Comma separated (ANDed) conditions on aggregate names, e.g. `sum_value>1000`
+
+    Returns:
+        dict: `select`, `group_by` and `having` SQL clauses (empty strings when not applicable)
+    """
+    group_cols = split_list(group_by) if group_by else []
+    for col in group_cols:
+        _check_column(col, columns, 'group_by')
+
+    select = list(group_cols)
+    aliases = []
+    for term in (split_list(agg) if agg else []):
+        func, _, col = term.partition(':')
+        func, col = func.strip(), col.strip()
+        if func not in AGG_FUNCTIONS:
+            raise Exception(f'Unknown aggregate function `{func}` in `agg` parameter. Functions are: {AGG_FUNCTIONS}')
+        if not col:
+            if func != 'count':
+                raise Exception(f'Aggregate function `{func}` in `agg` parameter needs a column, e.g. `{func}:column`')
+            select.append('COUNT(*) AS count')
+            aliases.append('count')
+        else:
+            _check_column(col, columns, 'agg')
+            select.append(f'{func.upper()}({col}) AS {func}_{col}')
+            aliases.append(f'{func}_{col}')
+
+    having_clauses = []
+    for term in (split_list(having) if having else []):
+        op = next((op for op in HAVING_OPERATORS if op in term), None)
+        if op is None:
+            raise Exception(f'Condition `{term}` in `having` parameter needs one of the operators {HAVING_OPERATORS}')
+        alias, _, val = term.partition(op)
+        alias, val = alias.strip(), val.strip()
+        if alias not in aliases:
+            raise Exception(f'Unknown aggregate `{alias}` in `having` parameter. Aggregates are: {aliases}')
+        try:
+            val = float(val) if '.' in val else int(val)
+        except ValueError:
+            raise Exception(f'Condition `{term}` in `having` parameter must compare with a number')
+        having_clauses.append(f'{alias}{op}{val}')
+
+    if having_clauses and not aliases:
+        raise Exception('The `having` parameter needs an `agg` parameter')
+
+    return {
+        'select': ', '.join(select),
+        'group_by': f"GROUP BY {', '.join(group_cols)}" if group_cols else '',
+        'having': f"HAVING {' AND '.join(having_clauses)}" if having_clauses else '',
+    }
+
+LIKE_PATTERNS = {'like': '%{}%', 'begin': '{}%', 'end': '%{}'}
+TRIGRAM_MIN_LENGTH = 3
+
+def sql_string(val) -> str:
+    """Quotes a value as a SQL string literal."""
+    return "'" + str(val).replace("'", "''") + "'"
+
+def prefix_range(col, prefix) -> str:
+    """
+    Rewrites `col LIKE 'prefix%'` into an equivalent range predicate, which a NOCASE collated
+    index of the column can serve. Returns None if the prefix can't be rewritten.
+    """
+    # LIKE wildcards would change the meaning
+    if not prefix or '%' in prefix or '_' in prefix:
+        return None
+    # Like LIKE, NOCASE collation only folds ASCII letters
+    low = ''.join(c.lower() if 'A' <= c <= 'Z' else c for c in prefix)
+    last = ord(low[-1])
+    if last >= 0x10FFFF or 0xD7FF <= last <= 0xDFFF:
+        return None
+    # NOCASE compares uppercase letters as lowercase ones, so the bound mustn't be one (after '@', it's '[')
+    last += 1
+    if ord('A') <= last <= ord('Z'):
+        last = ord('Z') + 1
+    high = low[:-1] + chr(last)
+    return f'({col} >= {sql_string(low)} COLLATE NOCASE AND {col} < {sql_string(high)} COLLATE NOCASE)'
+
+def compile_string_filter(table, col, kind, val, indexes=None) -> str:
+    """
+    Compiles the `_like`, `_begin`, `_end` and `_search` string filters of a column.
+
+    The filters use the column's indexes (`indexes` is from `index_helper.index_info`) if it has
+    any: `_begin` uses a range predicate on its prefix index. Otherwise, with a full-text index,
+    `LIKE` patterns are served from a trigram index (which needs at least 3 characters), and
+    `_search` terms (all must match) from a full-text `MATCH`. Failing that, plain `LIKE` is used.
+    """
+    indexes = indexes or {'columns': [], 'trigram': False, 'prefix': []}
+    indexed = col in indexes['columns']
+    fts_table = f'{table}_fts'
+
+    if kind == 'begin' and col in indexes.get('prefix', []):
+        predicate = prefix_range(col, val)
+        if predicate is not None:
+            return predicate
+
+    if kind == 'search':
+        terms = val.split()
+        if not terms:
+            return ''
+        if indexed and (not indexes['trigram'] or all(len(term) >= TRIGRAM_MIN_LENGTH for term in terms)):
+            match = ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+            return f"rowid IN (SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH {sql_string(f'{col} : ({match})')})"
+        return '(' + ' AND '.join(f"{col} LIKE {sql_string('%' + term + '%')}" for term in terms) + ')'
+
+    pattern = LIKE_PATTERNS[kind].format(val)
+    if indexed and indexes['trigram'] and len(val) >= TRIGRAM_MIN_LENGTH:
+        return f"rowid IN (SELECT rowid FROM {fts_table} WHERE {col} LIKE {sql_string(pattern)})"
+    return f'{col} LIKE "{pattern}"'
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance in km. Registered as the `distance_km` SQL function."""
+    if None in (lat1, lng1, lat2, lng2):
+        return None
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def _parse_floats(val, count, param, layout):
+    try:
+        nums = [float(v) for v in split_list(val)]
+    except ValueError:
+        nums = []
+    if len(nums) != count:
+        raise Exception(f'The `{param}` parameter must be {layout}, got `{val}`')
+    return nums
+
+def _box_filter(table, lat_col, lng_col, min_lat, min_lng, max_lat, max_lng, spatial) -> str:
+    box = f'({lat_col} BETWEEN {min_lat} AND {max_lat} AND {lng_col} BETWEEN {min_lng} AND {max_lng})'
+    if not spatial:
+        return box
+    # The R*Tree stores (outward rounded) 32-bit floats, so it finds the candidates overlapping
+    # the box, and the exact coordinates decide
+    return (
+        f'rowid IN (SELECT id FROM {table}_rtree WHERE max_{lat_col} >= {min_lat} AND min_{lat_col} <= {max_lat} '
+        f'AND max_{lng_col} >= {min_lng} AND min_{lng_col} <= {max_lng}) AND {box}'
+    )
+
+def compile_spatial_filter(table, coordinates, indexes=None, bbox=None, near=None) -> dict:
+    """
+    Compiles the `bbox` and `near` query params into SQL, using the table's R*Tree index if it has one.
+
+    Args:
+        coordinates (tuple): The table's (lat, lng) columns
+        bbox (str): `min_lng,min_lat,max_lng,max_lat` (i.e. west,south,east,north, like GeoJSON)
+        near (str): `lat,lng,radius_km`
+
+    Returns:
+        dict: `where` clauses (list), and for `near` the `distance` SQL expression (else None)
+    """
+    lat_col, lng_col = coordinates
+    spatial = (indexes or {}).get('spatial', None) == tuple(coordinates)
+    where = []
+    distance = None
+
+    if bbox:
+        min_lng, min_lat, max_lng, max_lat = _parse_floats(bbox, 4, 'bbox', 'min_lng,min_lat,max_lng,max_lat')
+        where.append(_box_filter(table, lat_col, lng_col, min_lat, min_lng, max_lat, max_lng, spatial))
+
+    if near:
+        lat, lng, radius_km = _parse_floats(near, 3, 'near', 'lat,lng,radius_km')
+        # The bounding box of the circle finds candidates from the index, then the exact distance filters them
+        dlat = radius_km / KM_PER_DEGREE
+        min_lat, max_lat = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+        sin_dlng = math.sin(math.radians(dlat)) / max(1e-12, math.cos(math.radians(lat)))
+        if min_lat <= -90 or max_lat >= 90 or sin_dlng >= 1:
+            # The circle covers a pole, so all longitudes
+            ranges = [(-180.0, 180.0)]
+        else:
+            # The longitudes of the circle's tangent meridians (wider than dlat/cos(lat) far from the equator)
+            dlng = math.degrees(math.asin(sin_dlng))
+            lng = (lng + 180) % 360 - 180
+            ranges = [(lng - dlng, lng + dlng)]
+            # A box crossing the antimeridian is 2 boxes, one on each side
+            if lng - dlng < -180:
+                ranges = [(lng - dlng + 360, 180.0), (-180.0, lng + dlng)]
+            elif lng + dlng > 180:
+                ranges = [(lng - dlng, 180.0), (-180.0, lng + dlng - 360)]
+        boxes = [_box_filter(table, lat_col, lng_col, min_lat, min_lng, max_lat, max_lng, spatial) for min_lng, max_lng in ranges]
+        where.append(boxes[0] if len(boxes) == 1 else f"({' OR '.join(boxes)})")
+        distance = f'distance_km({lat_col}, {lng_col}, {lat}, {lng})'
+        where.append(f'{distance} <= {radius_km}')
+
+    return {'where': where, 'distance': distance}
+
+
+JOIN_TYPES = {'inner': 'JOIN', 'left': 'LEFT JOIN'}
+JOIN_FILTERS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=', 'in': 'IN', 'like': 'like', 'begin': 'begin', 'end': 'end'}
+IDENTIFIER = re.compile(r'[a-z_][a-z0-9_]*')
+
+def sql_literal(val) -> str:
+    """Quotes a value as a SQL literal: numbers as they are, anything else as a string."""
+    if isinstance(val, bool):
+        return str(int(val))
+    if isinstance(val, (int, float)) and math.isfinite(val):
+        return repr(val)
+    return sql_string(val)
+
+def compile_join(tables, columns, filters=None, cols=None, order_by=None, limit=None) -> str:
+    """
+    Compiles a structured join of tables (possibly in different, attached DBs) into a SQL query.
+
+    Args:
+        tables (list): Dicts of `schema` (the DB's schema name on the connection), `table`, `alias` and, for all
+            but the first table, `on` (dict of `alias.column` of an earlier table to `alias.column` of this one)
+            and `how` (`inner` or `left`)
+        columns (dict): The (lowercase) columns of each table, by alias
+        filters (dict): `alias.column` (equality) or `alias.column_<op>` to value, where op is gt, gte, lt,
+            lte, in (a list or comma separated values), like, begin or end. All are ANDed
+        cols (list): `alias.column` or `alias.column AS name` to select. Default all columns, named
+            `<alias>_<column>`. Columns are named after themselves, unless that's ambiguous
+        order_by (list): `alias.column`, optionally followed by `ASC` or `DESC`
+        limit (int): Max. rows
+    """
+    def column_ref(ref, param) -> tuple:
+        alias, _, col = ref.strip().lower().partition('.')
+        if alias not in columns:
+            raise Exception(f'Unknown table alias `{alias}` in `{param}`. Aliases are: {list(columns)}')
+        _check_column(col, columns[alias], param)
+        return alias, col
+
+    aliases = [table['alias'] for table in tables]
+    if len(set(aliases)) != len(aliases) or not all(IDENTIFIER.fullmatch(alias) for alias in aliases):
+        raise Exception(f'Table aliases must be unique names: {aliases}')
+
+    sql_from = f"FROM {tables[0]['schema']}.{tables[0]['table']} AS {tables[0]['alias']}"
+    for idx, table in enumerate(tables[1:], start=1):
+        how = (table.get('how', None) or 'inner').lower()
+        if how not in JOIN_TYPES:
+            raise Exception(f"Unknown join type `{how}`. Join types are: {list(JOIN_TYPES)}")
+        if not table.get('on', None):
+            raise Exception(f"Table `{table['alias']}` needs join keys (`on`)")
+        conditions = []
+        for left, right in table['on'].items():
+            left_alias, left_col = column_ref(left, 'on')
+            right_alias, right_col = column_ref(right, 'on')
+            if right_alias != table['alias'] or left_alias not in aliases[:idx]:
+                raise Exception(f"Join keys of table `{table['alias']}` must map an earlier table's column to one of its own: {left} -> {right}")
+            conditions.append(f'{left_alias}.{left_col} = {right_alias}.{right_col}')
+        sql_from += f" {JOIN_TYPES[how]} {table['schema']}.{table['table']} AS {table['alias']} ON {' AND '.join(conditions)}"
+
+    if cols:
+        selected = []
+        for term in cols:
+            parts = re.split(r'\s+as\s+', term.strip().lower(), maxsplit=1)
+            ref, name = parts[0], (parts[1].strip() if len(parts) == 2 else None)
+            alias, col = column_ref(ref, 'cols')
+            if name is not None and not IDENTIFIER.fullmatch(name):
+                raise Exception(f'Invalid column name `{name}` in `cols`')
+            selected.append((alias, col, name))
+        plain = [col for _, col, name in selected if name is None]
+        select = [
+            f"{alias}.{col} AS {name or (col if plain.count(col) == 1 else f'{alias}_{col}')}"
+            for alias, col, name in selected
+        ]
+    else:
+        select = [f'{alias}.{col} AS {alias}_{col}' for alias in aliases for col in columns[alias]]
+
+    where = []
+    for key, val in (filters or {}).items():
+        alias, _, name = key.strip().lower().partition('.')
+        op = None
+        if alias in columns and name not in columns[alias]:
+            col, _, op = name.rpartition('_')
+            if op not in JOIN_FILTERS:
+                col, op = name, None
+            name = col
+        alias, col = column_ref(f'{alias}.{name}', 'filters')
+        ref = f'{alias}.{col}'
+        if op is None:
+            where.append(f'{ref} = {sql_literal(val)}')
+        elif op == 'in':
+            vals = val if isinstance(val, list) else [v.strip() for v in re.split(',+', str(val)) if v.strip()]
+            where.append(f"{ref} IN ({', '.join(sql_literal(v) for v in vals)})")
+        elif op in LIKE_PATTERNS:
+            where.append(f'{ref} LIKE {sql_string(LIKE_PATTERNS[op].format(val))}')
+        else:
+            if isinstance(val, str):
+                try:
+                    val = float(val)
+                except ValueError:
+                    raise Exception(f'Filter `{key}` needs a number, not `{val}`')
+            where.append(f'{ref} {JOIN_FILTERS[op]} {sql_literal(val)}')
+
+    order = []
+    for term in (order_by or []):
+        ref, _, direction = term.strip().partition(' ')
+        direction = direction.strip().upper()
+        if direction not in ('', 'ASC', 'DESC'):
+            raise Exception(f'Invalid `order_by` direction `{direction}`. Directions are ASC and DESC')
+        alias, col = column_ref(ref, 'order_by')
+        order.append(f'{alias}.{col} {direction}'.strip())
+
+    sql_query = f"SELECT {', '.join(select)} {sql_from}"
+    if where:
+        sql_query += f" WHERE {' AND '.join(where)}"
+    if order:
+        sql_query += f" ORDER BY {', '.join(order)}"
+    if limit is not None:
+        sql_query += f' LIMIT {int(limit)}'
+    return sql_query
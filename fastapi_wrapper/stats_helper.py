@@ -0,0 +1,213 @@
+"""
+Computes per-column statistics of a table's data at ingest, with vectorized pandas operations.
+
+For each column: its type, non-null count, null count, distinct count, min and max, the top-k
+most frequent values with their counts, and (numeric columns) an equal-width histogram. Stats
+are plain JSON-able dicts, stored in the routes config DB and served at `/{database}/{table}/stats`.
+
+The stats also give quick estimates of how many rows a query's filters match (`count=estimate`),
+falling back to evaluating the filters on a bounded sample of rows if the stats can't be used.
+
+numpy and pandas are only imported when stats are computed (at ingest), so serving doesn't load them.
+"""
+from datetime import datetime
+import math
+import random
+
+def _py(val):
+    """Converts numpy scalars to Python values (and NaN to None), so stats are JSON-able."""
+    if hasattr(val, 'item'):
+        val = val.item()
+    if isinstance(val, float) and not math.isfinite(val):
+        return None
+    return val
+
+def column_type(series) -> str:
+    import pandas as pd
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return 'int'
+    if pd.api.types.is_float_dtype(series):
+        return 'float'
+    return 'str'
+
+def histogram(values, bins) -> dict:
+    """An equal-width histogram of (non-null, finite) numeric values: bin `edges` (bins + 1) and `counts`."""
+    import numpy as np
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return {'edges': [], 'counts': []}
+    counts, edges = np.histogram(values, bins=bins)
+    return {'edges': [_py(edge) for edge in edges], 'counts': [int(count) for count in counts]}
+
+def column_stats(series, top_k=10, bins=20) -> dict:
+    import numpy as np
+    col_type = column_type(series)
+    values = series.dropna()
+    if col_type == 'str':
+        values = values.astype(str)
+    elif col_type == 'int':
+        values = values.astype(np.int64)
+
+    top = values.value_counts(sort=True).head(top_k)
+    stats = {
+        'type': col_type,
+        'count': int(len(values)),
+        'null_count': int(len(series) - len(values)),
+        'distinct_count': int(values.nunique()),
+        'min': _py(values.min()) if len(values) else None,
+        'max': _py(values.max()) if len(values) else None,
+        'top_values': [{'value': _py(val), 'count': int(count)} for val, count in top.items()],
+    }
+    if col_type != 'str':
+        stats['histogram'] = histogram(values.to_numpy(dtype=float), bins)
+    return stats
+
+def table_stats(df, top_k=10, bins=20) -> dict:
+    """Computes the stats of all columns of a DataFrame."""
+    return {
+        'row_count': int(len(df)),
+        'computed_at': datetime.now().isoformat(timespec='seconds'),
+        'columns': {col: column_stats(df[col], top_k=top_k, bins=bins) for col in df.columns},
+    }
+
+# ----- Count estimates -----
+
+RANGE_OPS = {'gt', 'gte', 'lt', 'lte'}
+
+def _eq_count(col_stats, val) -> tuple:
+    """Estimated (count, low, high) of rows where a column equals a value."""
+    top = {item['value']: item['count'] for item in col_stats['top_values']}
+    if val in top:
+        return top[val], top[val], top[val]
+    if col_stats['type'] != 'str':
+        if col_stats['min'] is None or not (col_stats['min'] <= val <= col_stats['max']):
+            return 0, 0, 0
+    others = col_stats['distinct_count'] - len(top)
+    if others <= 0:
+        # All the column's values are in the top values
+        return 0, 0, 0
+    rest = col_stats['count'] - sum(top.values())
+    # A value which isn't a top value is at most as frequent as the least frequent top value
+    high = min(rest, min(top.values())) if top else rest
+    return rest / others, 0, high
+
+def _range_count(col_stats, ranges) -> tuple:
+    """Estimated (count, low, high) of rows where a numeric column is within range conditions, from its histogram."""
+    lo, lo_incl, hi, hi_incl = None, True, None, True
+    for op, val in ranges:
+        if op in ('gt', 'gte') and (lo is None or val >= lo):
+            lo, lo_incl = val, op == 'gte' and not (lo == val and not lo_incl)
+        elif op in ('lt', 'lte') and (hi is None or val <= hi):
+            hi, hi_incl = val, op == 'lte' and not (hi == val and not hi_incl)
+
+    edges, counts = col_stats['histogram']['edges'], col_stats['histogram']['counts']
+    est = low = high = 0
+    for a, b, count in zip(edges[:-1], edges[1:], counts):
+        if (lo is not None and lo > b) or (hi is not None and hi < a):
+            continue
+        inside = (lo is None or lo < a or (lo == a and lo_incl)) and (hi is None or hi > b or (hi == b and hi_incl))
+        high += count
+        if inside:
+            low += count
+            est += count
+        else:
+            # Assume the values are spread evenly within the bin
+            overlap = min(b, hi if hi is not None else b) - max(a, lo if lo is not None else a)
+            est += count * max(0.0, overlap) / (b - a)
+    return est, low, high
+
+def estimate_count(stats, filters):
+    """
+    Estimates how many rows match equality (`eq`, `in`) and range (`gt`, `gte`, `lt`, `lte`) filters,
+    given as (op, column, value) tuples, from a table's column stats. Filters on different columns are
+    assumed to be independent for the estimate. The bounds don't assume that (they're the Fréchet bounds
+    of the filters' own bounds), so the true count is always within them, as long as the stats are current.
+
+    Returns a dict of `count`, `low` and `high`, or None if a filter can't be estimated from the stats.
+    """
+    if stats is None:
+        return None
+    rows = stats['row_count']
+    columns = stats['columns']
+
+    terms = [] # (count, low, high) per filtered column and kind
+    ranges = {}
+    for op, col, val in filters:
+        col_stats = columns.get(col, None)
+        if col_stats is None:
+            return None
+        if op in RANGE_OPS:
+            if col_stats['type'] == 'str' or 'histogram' not in col_stats:
+                return None
+            ranges.setdefault(col, []).append((op, val))
+        elif op == 'eq':
+            terms.append(_eq_count(col_stats, val))
+        elif op == 'in':
+            try:
+                vals = set(val if col_stats['type'] == 'str' else [float(v) for v in val])
+            except ValueError:
+                return None
+            counts = [_eq_count(col_stats, v) for v in vals]
+            terms.append((sum(c[0] for c in counts), sum(c[1] for c in counts), min(col_stats['count'], sum(c[2] for c in counts))))
+        else:
+            return None
+    for col, col_ranges in ranges.items():
+        terms.append(_range_count(columns[col], col_ranges))
+
+    if rows == 0 or not terms:
+        return {'count': rows, 'low': rows, 'high': rows}
+    est = rows
+    for count, _, _ in terms:
+        est *= count / rows
+    low = max(0, sum(low for _, low, _ in terms) - (len(terms) - 1) * rows)
+    high = min(high for _, _, high in terms)
+    est = min(max(est, low), high)
+    return {'count': int(round(est)), 'low': int(math.ceil(low)), 'high': int(math.floor(high))}
+
+def sample_count(con, table, where, budget, rows=None, blocks=100, z=1.96):
+    """
+    Estimates how many rows match a WHERE clause by evaluating it on about `budget` rows: `blocks` runs of
+    consecutive rowids, one at a random offset in each of as many equal slices of the table's rowid range.
+    The bounds are a 95% (`z`) Wilson interval (approximate, as rows in a run may be alike). If the table has at most `budget` rows, they're all counted.
+
+    Returns a dict of `count`, `low` and `high`, and `exact` (whether all rows were counted).
+    """
+    def fetch_row(sql):
+        cur = con.execute(sql)
+        cur.row_factory = None
+        return cur.fetchone()
+
+    first, last = fetch_row(f'SELECT MIN(rowid), MAX(rowid) FROM {table}')
+    if first is None:
+        return {'count': 0, 'low': 0, 'high': 0, 'exact': True}
+    span = last - first + 1
+    if span <= budget:
+        count = fetch_row(f'SELECT COUNT(*) FROM {table} {where}')[0]
+        return {'count': count, 'low': count, 'high': count, 'exact': True}
+
+    rng = random.Random()
+    block_size = max(1, budget // blocks)
+    slice_size = span // blocks
+    ranges = []
+    for i in range(blocks):
+        start = first + i * slice_size + rng.randrange(max(1, slice_size - block_size + 1))
+        ranges.append(f'rowid BETWEEN {start} AND {start + block_size - 1}')
+    condition = where[len('WHERE '):] if where else '1'
+    sampled, matched = fetch_row(
+        f"SELECT COUNT(*), COALESCE(SUM(CASE WHEN {condition} THEN 1 ELSE 0 END), 0) FROM {table} WHERE {' OR '.join(ranges)}"
+    )
+    if rows is None:
+        # Rowids may have gaps, so scale the rows sampled to the whole rowid range
+        rows = sampled * span / (blocks * block_size)
+    if sampled == 0:
+        return {'count': 0, 'low': 0, 'high': int(rows), 'exact': False}
+
+    p = matched / sampled
+    centre = (p + z * z / (2 * sampled)) / (1 + z * z / sampled)
+    margin = z * math.sqrt(p * (1 - p) / sampled + z * z / (4 * sampled * sampled)) / (1 + z * z / sampled)
+    return {
+        'count': int(round(p * rows)),
+        'low': int(math.floor(max(0.0, centre - margin) * rows)),
+        'high': int(math.ceil(min(1.0, centre + margin) * rows)),
+        'exact': False,
+    }
@@ -0,0 +1,271 @@
+"""
+Records the filter shapes of generated route queries, and recommends indexes for them.
+
+A shape is which columns a query filters by equality (`eq`, incl. `_in`) and by range (`range`),
+and which columns it selects (`select`, if `cols` only names columns). Shapes are counted in
+memory, with their SQL time, and flushed to the workload DB (`WORKLOAD_DB` in settings) every
+`WORKLOAD_FLUSH_SECONDS`, so the advisor can also run in another process (e.g. the CLI).
+
+The advisor proposes a composite index per shape (equality columns, most selective first, then
+a range column, then the selected columns to make it covering), checks with `EXPLAIN QUERY PLAN`
+on an empty copy of the table's schema that SQLite would use it, and ranks the indexes by the
+estimated SQL time they would have saved.
+"""
+from datetime import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import settings.settings as settings
+
+SHAPES_TABLE = 'query_shapes'
+# Fraction of rows a range filter is assumed to keep (like SQLite's planner without stats)
+RANGE_SELECTIVITY = 0.25
+# Max. columns of a recommended index
+MAX_INDEX_COLUMNS = 6
+
+_lock = threading.Lock()
+_pending = {} # key = (database, table, shape), value = [count, total_ms]
+_last_flush = [time.monotonic()]
+_connections = {} # key = workload DB path, value = connection
+
+# Background index builds, key = index name, value = status
+BUILDS = {}
+
+def _value(row, key, idx):
+    return row[key] if isinstance(row, dict) else row[idx]
+
+def enabled() -> bool:
+    return bool(settings.WORKLOAD_DB)
+
+def shape_of(eq, range_, select=None) -> str:
+    return json.dumps({'eq': sorted(set(eq)), 'range': sorted(set(range_)), 'select': sorted(set(select)) if select else None})
+
+def record(database, table, eq, range_, select, duration_ms) -> None:
+    """Counts a query's filter shape (if it filters on any columns), flushing the counts when they're due."""
+    if not enabled() or not (eq or range_):
+        return
+    key = (database, table, shape_of(eq, range_, select))
+    with _lock:
+        counts = _pending.get(key, None)
+        if counts is None:
+            counts = _pending[key] = [0, 0.0]
+        counts[0] += 1
+        counts[1] += duration_ms
+        due = time.monotonic() - _last_flush[0] >= settings.WORKLOAD_FLUSH_SECONDS
+    if due:
+        flush()
+
+def _workload_connection(path) -> sqlite3.Connection:
+    con = _connections.get(path, None)
+    if con is None:
+        con = _connections[path] = sqlite3.connect(path, check_same_thread=False, timeout=settings.SQLITE_BUSY_TIMEOUT)
+        con.execute(
+            f'CREATE TABLE IF NOT EXISTS {SHAPES_TABLE} (database TEXT, table_name TEXT, shape TEXT, count INTEGER, '
+            'total_ms REAL, last_seen TEXT, PRIMARY KEY (database, table_name, shape))'
+        )
+    return con
+
+def flush(path=None) -> None:
+    """Adds the counted shapes to the workload DB."""
+    path = path or settings.WORKLOAD_DB
+    with _lock:
+        pending = list(_pending.items())
+        _pending.clear()
+        _last_flush[0] = time.monotonic()
+        if not pending or not path:
+            return
+        now = datetime.now().isoformat(timespec='seconds')
+        try:
+            con = _workload_connection(path)
+            with con:
+                con.executemany(
+                    f'INSERT INTO {SHAPES_TABLE} VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (database, table_name, shape) DO UPDATE SET '
+                    'count = count + excluded.count, total_ms = total_ms + excluded.total_ms, last_seen = excluded.last_seen',
+                    [(database, table, shape, count, total_ms, now) for (database, table, shape), (count, total_ms) in pending]
+                )
+        except Exception as ex:
+            # Recording must never fail the query
+            logging.error(f'Failed to write workload DB `{path}`: {str(ex)}')
+
+def load_shapes(database=None, table=None, path=None) -> list:
+    """Gets the recorded shapes (optionally of a database and table), with their counts and SQL time."""
+    path = path or settings.WORKLOAD_DB
+    if not path or not os.path.exists(path):
+        return []
+    with _lock:
+        con = _workload_connection(path)
+        rows = con.execute(
+            f'SELECT database, table_name, shape, count, total_ms FROM {SHAPES_TABLE} '
+            'WHERE (? IS NULL OR database = ?) AND (? IS NULL OR table_name = ?)',
+            (database, database, table, table)
+        ).fetchall()
+    shapes = []
+    for shape_db, shape_table, shape, count, total_ms in rows:
+        shapes.append({'database': shape_db, 'table': shape_table, **json.loads(shape), 'count': count, 'total_ms': total_ms})
+    return shapes
+
+def close() -> None:
+    with _lock:
+        for con in _connections.values():
+            con.close()
+        _connections.clear()
+
+# ----- Advisor -----
+
+def index_name(table, columns) -> str:
+    return f"ix_{table}_{'_'.join(columns)}"
+
+def _representative_query(table, shape) -> tuple:
+    select = ', '.join(shape['select']) if shape['select'] else '*'
+    conditions = [f'{col} = ?' for col in shape['eq']] + [f'{col} > ?' for col in shape['range']]
+    return f"SELECT {select} FROM {table} WHERE {' AND '.join(conditions)}", [0] * len(conditions)
+
+def _schema_copy(con, table) -> sqlite3.Connection:
+    """Copies a table's schema, its indexes and planner stats (not its rows) to an in-memory DB."""
+    copy = sqlite3.connect(':memory:')
+    for row in con.execute(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('table', 'index') AND sql IS NOT NULL ORDER BY type DESC",
+        (table,)
+    ).fetchall():
+        copy.execute(_value(row, 'sql', 0))
+    if con.execute("SELECT name FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchall():
+        copy.execute('ANALYZE')
+        stats = [(_value(row, 'tbl', 0), _value(row, 'idx', 1), _value(row, 'stat', 2))
+                 for row in con.execute('SELECT tbl, idx, stat FROM sqlite_stat1 WHERE tbl = ?', (table,)).fetchall()]
+        copy.executemany('INSERT INTO sqlite_stat1 VALUES (?, ?, ?)', stats)
+        copy.execute('ANALYZE sqlite_master')
+    return copy
+
+def _plan(con, sql, params) -> list:
+    return [_value(row, 'detail', 3) for row in con.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+def _constrained_columns(plan, table) -> list:
+    """Gets the columns a plan's index search on the table is constrained by, e.g. `(a=? AND b>?)`."""
+    for detail in plan:
+        if detail.startswith(f'SEARCH {table} ') and '(' in detail:
+            return re.findall(r'(\w+)\s*[=<>]', detail[detail.index('('):])
+    return []
+
+def _fraction(columns, shape, distinct) -> float:
+    """Estimates the fraction of rows an index search constrained by `columns` reads."""
+    fraction = 1.0
+    for col in columns:
+        fraction *= RANGE_SELECTIVITY if col in shape['range'] else 1 / max(1, distinct(col))
+    return fraction
+
+def recommend(con, table, shapes, stats=None) -> list:
+    """
+    Recommends indexes for a table's recorded shapes, ranked by estimated SQL time saved (`est_saved_ms`).
+    Only indexes which `EXPLAIN QUERY PLAN` shows would be used, and would read fewer rows, are recommended.
+
+    Columns' distinct counts come from the table's column `stats` (computed at ingest), so the table isn't
+    scanned. Without them, they're counted in a sample of `COUNT_SAMPLE_ROWS` rows.
+    """
+    columns_stats = stats['columns'] if stats is not None else {}
+    distinct_counts = {}
+    def distinct(col):
+        if col not in distinct_counts:
+            if col in columns_stats:
+                distinct_counts[col] = columns_stats[col]['distinct_count']
+            else:
+                row = con.execute(
+                    f'SELECT COUNT(DISTINCT {col}) AS n FROM (SELECT {col} FROM {table} LIMIT ?)', (settings.COUNT_SAMPLE_ROWS,)
+                ).fetchall()[0]
+                distinct_counts[col] = _value(row, 'n', 0)
+        return distinct_counts[col]
+
+    copy = _schema_copy(con, table)
+    recommendations = {}
+    try:
+        for shape in shapes:
+            # Equality columns, most selective first, then the most selective range column (an index serves one)
+            columns = sorted(shape['eq'], key=distinct, reverse=True)
+            if shape['range']:
+                columns.append(max(shape['range'], key=distinct))
+            # Make it covering, if not too wide
+            covering = [col for col in (shape['select'] or []) if col not in columns]
+            if covering and len(columns) + len(covering) <= MAX_INDEX_COLUMNS:
+                columns += covering
+            columns = columns[:MAX_INDEX_COLUMNS]
+
+            name = index_name(table, columns)
+            create_sql = f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+            sql, params = _representative_query(table, shape)
+
+            current_plan = _plan(copy, sql, params)
+            copy.execute('SAVEPOINT candidate')
+            try:
+                copy.execute(create_sql)
+                new_plan = _plan(copy, sql, params)
+            finally:
+                copy.execute('ROLLBACK TO candidate')
+                copy.execute('RELEASE candidate')
+
+            if not any(name in detail for detail in new_plan):
+                continue
+            current_fraction = _fraction(_constrained_columns(current_plan, table), shape, distinct)
+            new_fraction = _fraction(_constrained_columns(new_plan, table), shape, distinct)
+            newly_covering = any('COVERING' in detail for detail in new_plan) and not any('COVERING' in detail for detail in current_plan)
+            if new_fraction >= current_fraction and not newly_covering:
+                continue
+
+            saved_ms = shape['total_ms'] * max(0.0, 1 - new_fraction / current_fraction)
+            rec = recommendations.get(name, None)
+            if rec is None:
+                rec = recommendations[name] = {
+                    'table': table, 'index_name': name, 'columns': columns, 'create_sql': create_sql,
+                    'queries': 0, 'total_ms': 0.0, 'est_saved_ms': 0.0, 'shapes': [],
+                    'current_plan': current_plan, 'new_plan': new_plan,
+                }
+            rec['queries'] += shape['count']
+            rec['total_ms'] = round(rec['total_ms'] + shape['total_ms'], 3)
+            rec['est_saved_ms'] = round(rec['est_saved_ms'] + saved_ms, 3)
+            rec['shapes'].append({key: shape[key] for key in ['eq', 'range', 'select', 'count']})
+    finally:
+        copy.close()
+
+    return sorted(recommendations.values(), key=lambda rec: rec['est_saved_ms'], reverse=True)
+
+def build_index(connect, rec, on_built=None) -> threading.Thread:
+    """
+    Builds a recommended index in a background thread, then checks with `EXPLAIN QUERY PLAN` that it's used.
+
+    The index is built on a connection of its own (`connect()` opens it), in a transaction which takes the DB's
+    write lock, so it never interleaves with a load on the DB's primary connection. The thread isn't a daemon,
+    so shutdown waits for the build rather than losing it. The status is kept in `BUILDS` ('built' once the
+    index is committed). `on_built` is called once the index is built (e.g. to publish a snapshot of the DB
+    with it). Returns the thread.
+    """
+    def build():
+        BUILDS[rec['index_name']] = 'building'
+        try:
+            con = connect()
+            try:
+                con.execute('BEGIN IMMEDIATE')
+                try:
+                    con.execute(rec['create_sql'])
+                    con.commit()
+                except BaseException:
+                    con.rollback()
+                    raise
+                shape = rec['shapes'][0]
+                sql, params = _representative_query(rec['table'], {**shape, 'total_ms': 0})
+                used = any(rec['index_name'] in detail for detail in _plan(con, sql, params))
+            finally:
+                con.close()
+            BUILDS[rec['index_name']] = 'built' if used else 'built, but not used'
+            logging.info(f"Index `{rec['index_name']}` {BUILDS[rec['index_name']]}")
+            if on_built is not None:
+                on_built()
+        except Exception as ex:
+            BUILDS[rec['index_name']] = f'failed: {str(ex)}'
+            logging.error(f"Index `{rec['index_name']}` build failed: {str(ex)}")
+
+    thread = threading.Thread(target=build, name=f"build-{rec['index_name']}")
+    thread.start()
+    return thread
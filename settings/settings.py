@@ -1,8 +1,7 @@
-# django environ
-import environ
 # system environ
 from os import environ as osenv
 import os
+import json
 from dotenv import load_dotenv, find_dotenv
 
 # ======== GLOBAL SETTINGS ========
@@ -14,17 +13,18 @@ print(f'>>> CWD: {BASE_DIR} <<<')
 
 # ======== GENERAL ENVIRONMENT VARS ========
 
-env = environ.Env(
-    DEBUG=(bool, False),
-    ENVIRONMENT=(str, None),
-    ENABLE_FILE_LOGGERS=(bool, False),
-    ALLOWED_HOSTS=(list, []),
-)
+# Booleans are parsed like django-environ did (without importing it, which slows down every worker and CLI start-up)
+TRUE_STRINGS = ('true', 'on', 'ok', 'y', 'yes', '1')
 
-DEBUG = env('DEBUG')
-ENVIRONMENT = env('ENVIRONMENT')
+def env_bool(name, default) -> bool:
+    """Reads a boolean environment variable: one of `TRUE_STRINGS` (any case) is True, anything else False."""
+    val = osenv.get(name, None)
+    return default if val is None else val.strip().lower() in TRUE_STRINGS
 
-ALLOWED_HOSTS = env('ALLOWED_HOSTS')
+DEBUG = env_bool('DEBUG', False)
+ENVIRONMENT = osenv.get('ENVIRONMENT', None)
+
+ALLOWED_HOSTS = [host for host in osenv.get('ALLOWED_HOSTS', '').split(',') if host]
 
 DATA_PATH = os.path.join(BASE_DIR, 'data')
 DB_PATH = os.path.join(BASE_DIR, 'sql_db')
@@ -40,4 +40,134 @@ if ENV_FILE:
 API_HOST = osenv.get('API_HOST', 'localhost')
 API_PORT = int(osenv.get('API_PORT', '8000'))
 API_BASE_URL = osenv.get('API_BASE_URL', 'http://localhost:8000')
-CORS_ALLOW_ORIGINS = osenv.get('CORS_ALLOW_ORIGINS', '').split(',')
\ No newline at end of file
+CORS_ALLOW_ORIGINS = osenv.get('CORS_ALLOW_ORIGINS', '').split(',')
+
+# API Serving
+
+# Routes config database used by the app factory (`create_app`) in each uvicorn worker process
+API_CONFIG_DB = osenv.get('API_CONFIG_DB', 'routes_config.db')
+API_WORKERS = int(osenv.get('API_WORKERS', '1'))
+
+# SQLite
+
+# Seconds a connection waits on a locked database (e.g. another worker is writing) before failing
+SQLITE_BUSY_TIMEOUT = float(osenv.get('SQLITE_BUSY_TIMEOUT', '30'))
+# Max. read connections pooled per database (per snapshot, with snapshots)
+SQLITE_POOL_SIZE = int(osenv.get('SQLITE_POOL_SIZE', '8'))
+# The in-memory database is saved here on shutdown and restored on start-up (set to '' to disable)
+MEMORY_DB_SNAPSHOT = osenv.get('MEMORY_DB_SNAPSHOT', os.path.join(DB_PATH, 'memory_snapshot.db'))
+# Queries of file databases read immutable snapshots, published after each update, so loads don't slow them down (see `snapshot_helper`)
+SNAPSHOTS = env_bool('SNAPSHOTS', False)
+# Snapshot versions of a database kept on disk; older ones are deleted once no query (of this process) reads them
+SNAPSHOT_KEEP = int(osenv.get('SNAPSHOT_KEEP', '2'))
+
+# SQLite performance profile, applied whenever a connection is opened (see https://www.sqlite.org/pragma.html)
+# - mmap_size: bytes of the DB file read through memory-mapped I/O (0 disables it)
+# - cache_size: page cache size; negative values are KiB, positive values are pages
+# - temp_store: where temp tables and indices (e.g. for sorts) live: DEFAULT, FILE or MEMORY
+# - query_only: makes read (pooled) connections read-only
+SQLITE_PROFILE = {
+    'mmap_size': int(osenv.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    'cache_size': int(osenv.get('SQLITE_CACHE_SIZE', '-65536')),
+    'temp_store': osenv.get('SQLITE_TEMP_STORE', 'DEFAULT'),
+    'query_only': env_bool('SQLITE_QUERY_ONLY', True),
+}
+# Per-database profile overrides as JSON keyed by database name, e.g. {"macro": {"mmap_size": 0}}
+SQLITE_DB_PROFILES = json.loads(osenv.get('SQLITE_DB_PROFILES', '{}'))
+
+# Metrics
+
+# Record request, query and ingestion metrics, and serve them at `/metrics` (Prometheus format)
+METRICS_ENABLED = env_bool('METRICS_ENABLED', True)
+
+# Response compression
+
+# Compress responses for clients which accept it (`Accept-Encoding`)
+COMPRESSION_ENABLED = env_bool('COMPRESSION_ENABLED', True)
+# Encodings in order of preference; `br` and `zstd` need the `brotli` and `zstandard` packages
+COMPRESSION_ENCODINGS = [enc.strip() for enc in osenv.get('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',') if enc.strip()]
+# Compression levels as JSON keyed by encoding, e.g. {"gzip": 6, "br": 4, "zstd": 3}
+COMPRESSION_LEVELS = json.loads(osenv.get('COMPRESSION_LEVELS', '{}'))
+# Responses smaller than this many bytes are not compressed
+COMPRESSION_MIN_SIZE = int(osenv.get('COMPRESSION_MIN_SIZE', '1024'))
+# MiB of compressed responses cached, so repeated responses are compressed once (0 turns the cache off)
+COMPRESSION_CACHE_MB = float(osenv.get('COMPRESSION_CACHE_MB', '0'))
+
+# Slow query log
+
+# Queries taking at least this many ms are logged with their query plan (a negative value turns the log off)
+SLOW_QUERY_MS = float(osenv.get('SLOW_QUERY_MS', '500'))
+# The log: a `.jsonl` file, otherwise a SQLite DB (empty turns the log off). See `/admin/slow-queries`
+SLOW_QUERY_LOG = osenv.get('SLOW_QUERY_LOG', os.path.join(DB_PATH, 'slow_queries.db'))
+
+# Index advisor
+
+# The DB recording the filter shapes of queries, which the index advisor uses (empty turns recording off)
+WORKLOAD_DB = osenv.get('WORKLOAD_DB', os.path.join(DB_PATH, 'workload.db'))
+# How often the recorded shapes are written to the workload DB
+WORKLOAD_FLUSH_SECONDS = float(osenv.get('WORKLOAD_FLUSH_SECONDS', '10'))
+
+# Batches (`POST /batch`)
+
+# Max. queries in a batch
+BATCH_MAX_QUERIES = int(osenv.get('BATCH_MAX_QUERIES', '50'))
+# Max. queries of batches running at once (in this process)
+BATCH_CONCURRENCY = int(osenv.get('BATCH_CONCURRENCY', str(SQLITE_POOL_SIZE)))
+
+# Federated queries (`POST /federated`)
+
+# Max. tables a federated query joins (SQLite attaches at most 10 databases to a connection)
+FEDERATED_MAX_TABLES = int(osenv.get('FEDERATED_MAX_TABLES', '4'))
+# Max. rows a federated query returns
+FEDERATED_MAX_ROWS = int(osenv.get('FEDERATED_MAX_ROWS', '10000'))
+
+# Admission control of ad-hoc queries (`where`, `cols` and `cmd` params, see `admission_helper`)
+
+# Estimate ad-hoc queries' cost (rows read and sorted) with `EXPLAIN QUERY PLAN` and column stats before running them
+ADMISSION_CONTROL = env_bool('ADMISSION_CONTROL', True)
+# Queries costing more than this are rejected (a negative value turns this off)
+ADMISSION_MAX_COST = float(osenv.get('ADMISSION_MAX_COST', '1e9'))
+# Queries costing at least this are expensive, and a client runs at most `ADMISSION_MAX_EXPENSIVE` at once (per process)
+ADMISSION_EXPENSIVE_COST = float(osenv.get('ADMISSION_EXPENSIVE_COST', '1e6'))
+ADMISSION_MAX_EXPENSIVE = int(osenv.get('ADMISSION_MAX_EXPENSIVE', '2'))
+# Seconds an expensive query waits for a slot of its client before it's rejected
+ADMISSION_QUEUE_SECONDS = float(osenv.get('ADMISSION_QUEUE_SECONDS', '5'))
+# Request header identifying a client (e.g. `X-API-Key`); clients are told apart by host if empty or missing
+ADMISSION_CLIENT_HEADER = osenv.get('ADMISSION_CLIENT_HEADER', '')
+# Per-client limit overrides as JSON keyed by client, e.g. {"10.0.0.5": {"max_cost": 1e10, "max_expensive": 4}}
+ADMISSION_CLIENT_LIMITS = json.loads(osenv.get('ADMISSION_CLIENT_LIMITS', '{}'))
+
+# Row limits of generated routes (JSON results; a route's config can set its own, see `create_database`)
+
+# Rows a query returns, unless its `limit` param is given
+DEFAULT_ROW_LIMIT = int(osenv.get('DEFAULT_ROW_LIMIT', '10000'))
+# Max. rows a query returns, whatever `limit` is given
+MAX_ROW_LIMIT = int(osenv.get('MAX_ROW_LIMIT', '100000'))
+
+# HTML tables (`tohtml`)
+
+# Rows per page, unless the `page_size` query param is given
+HTML_PAGE_SIZE = int(osenv.get('HTML_PAGE_SIZE', '1000'))
+# Max. rows per page, whatever `page_size` is given
+HTML_MAX_ROWS = int(osenv.get('HTML_MAX_ROWS', '10000'))
+
+# Ingestion
+
+# Text columns to build a full-text (SQLite FTS5) index for at ingest, comma separated, or '*' for all text columns
+FTS_COLUMNS = osenv.get('FTS_COLUMNS', '')
+# Text columns to build a case-insensitive prefix index for at ingest (serves `_begin` and `suggest`), as above
+PREFIX_COLUMNS = osenv.get('PREFIX_COLUMNS', '')
+# Max. values returned by the `/{database}/{table}/suggest` endpoint
+SUGGEST_MAX_LIMIT = int(osenv.get('SUGGEST_MAX_LIMIT', '100'))
+# Engine ingesting data files: 'pandas', or 'csv' to stream CSV files into SQLite without pandas (see `csv_helper`)
+INGEST_ENGINE = osenv.get('INGEST_ENGINE', 'pandas')
+# Compute column stats (null and distinct counts, min, max, top values, histograms) at ingest, served by `/{database}/{table}/stats`
+COLUMN_STATS = env_bool('COLUMN_STATS', True)
+# Most frequent values kept per column
+STATS_TOP_K = int(osenv.get('STATS_TOP_K', '10'))
+# Histogram bins of numeric columns
+STATS_HISTOGRAM_BINS = int(osenv.get('STATS_HISTOGRAM_BINS', '20'))
+# Rows sampled to estimate `full_count` (`count=estimate`) when the column stats can't be used
+COUNT_SAMPLE_ROWS = int(osenv.get('COUNT_SAMPLE_ROWS', '10000'))
+# Build an R*Tree index of latitude/longitude column pairs (e.g. `lat` & `lng`) at ingest (serves `bbox` and `near`)
+SPATIAL_INDEX = env_bool('SPATIAL_INDEX', True)
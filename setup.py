@@ -26,7 +26,7 @@ setup(
     packages=find_packages(exclude=("tests", "docs", "examples")),
     include_package_data=True,
     install_requires=["pandas", "uvicorn", "pydantic", "numpy", "fastapi", "typer",],
-    entry_points={"console_scripts": ["fastapi-wrapper=fastapi_wrapper.cli:typer_app"],},
+    entry_points={"console_scripts": ["fastapi-wrapper=fastapi_wrapper.cli:typer_app", "fastapi-wrapper-advise=fastapi_wrapper.cli:advisor_app"],},
     classifiers=[
         "Programming Language :: Python :: 3",
         "Programming Language :: Python :: 3.6",